@@ -1,22 +1,37 @@
-from fastapi import FastAPI, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, Request, Form, Query
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
 from datetime import datetime, timedelta
-import sqlite3
+import json
 import os
-import requests
 from engine.models.nudges import generate_nudges
 from engine.models.forecast_main import router as forecast_router
 from engine.models.riskradar import router as risk_router
+from engine.models.timeline import router as timeline_router
+from engine.models.capacity import router as capacity_router
+from engine.models.sessions import router as sessions_router, session_auto_closer
+from engine.models.dashboard import router as dashboard_router
+from engine.models.sites import employee_clocks, router as sites_router
+from engine.models import baselines
+from engine.utils.cache import cached_response, result_cache, version_sync, versions
+from engine.utils.db import DATABASE_ERRORS, DatabaseBusy, database, dialect, get_pool, write_transaction
+from engine.utils.executor import analytics
+from engine.utils.geocoding import geocoder
+from engine.utils.ingest import ingest_queue, checkin_event, checkout_event, IngestQueueFull
+from engine.utils.metrics import MetricsMiddleware, profiler, registry
+from engine.utils.migrations import migrate
+from engine.utils.nudge_stream import TooManySubscribers, nudge_hub
+from engine.utils.precompute import precomputed_nudges_or_live, precomputer
+from engine.utils.retention import archiver
+from engine.utils.timestamps import local_fields, site_time
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
 
 templates = Jinja2Templates(directory="../frontend/templates")
 
-DB_FILE = "../db/checkins.db"
-
 ##########ADDING THE BURNOUT PART########################################
 
 app.include_router(risk_router)
@@ -24,41 +39,95 @@ app.include_router(risk_router)
 ########################################################################
 
 
-#####API for Geo Location, we are using OpenCage(https://opencagedata.com)
-
-OPENCAGE_API_KEY = "506c9ae25ba84de0a447d82bcae9f147"
-
-def reverse_geocode(lat, lon):
+#####Geo Location is resolved in the background (engine/utils/geocoding.py, OpenCage by default)
+
+# Check-ins written by other API processes reach this one's live nudge subscribers too
+version_sync.listeners.append(nudge_hub.evaluate)
+
+@app.on_event("startup")
+async def start_background_workers():
+    await geocoder.start()
+    await ingest_queue.start()
+    await session_auto_closer.start()
+    await version_sync.start()
+    await archiver.start()
+    await precomputer.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await precomputer.stop()
+    await archiver.stop()
+    await version_sync.stop()
+    await session_auto_closer.stop()
+    # Flush queued writes first; they may still hand check-ins to the geocoder
+    await ingest_queue.stop()
+    await geocoder.stop()
+    nudge_hub.close()
+    database.shutdown()
+    analytics.shutdown()
+
+@app.exception_handler(DatabaseBusy)
+async def database_busy(request: Request, exc: DatabaseBusy):
+    return JSONResponse(status_code=503, content={"detail": "Database is busy, please retry shortly."})
+
+async def enqueue_or_503(event):
     try:
-        url = f"https://api.opencagedata.com/geocode/v1/json?q={lat}+{lon}&key={OPENCAGE_API_KEY}"
-        response = requests.get(url)
-        if response.status_code == 200:
-            results = response.json()
-            if results['results']:
-                return results['results'][0]['formatted']  # Full address
-    except Exception as e:
-        print(f"Reverse geocoding failed: {e}")
-    return "Unknown Location"
+        await ingest_queue.enqueue(event)
+    except IngestQueueFull:
+        raise HTTPException(status_code=503, detail="Check-in queue is full, please retry shortly.")
+
+@app.get("/ingest/stats")
+def ingest_stats():
+    return ingest_queue.metrics()
+
+@app.get("/db/stats")
+def db_stats():
+    return database.stats()
+
+@app.get("/archive/stats")
+def archive_stats():
+    return archiver.metrics()
+
+@app.get("/precompute/stats")
+def precompute_stats():
+    return precomputer.metrics()
+
+@app.get("/analytics/stats")
+def analytics_stats():
+    return analytics.metrics()
+
+#####Metrics (engine/utils/metrics.py): Prometheus text at /metrics
+registry.add_collector("db", database.stats)
+registry.add_collector("ingest", ingest_queue.metrics)
+registry.add_collector("geocoder", geocoder.metrics)
+registry.add_collector("cache", result_cache.stats)
+registry.add_collector("cache_sync", version_sync.metrics)
+registry.add_collector("nudge_stream", nudge_hub.metrics)
+registry.add_collector("sessions_auto_close", session_auto_closer.metrics)
+registry.add_collector("archive", archiver.metrics)
+registry.add_collector("precompute", precomputer.metrics)
+registry.add_collector("analytics", analytics.metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/profiling")
+def profiling_stats():
+    return profiler.metrics()
+
+@app.post("/metrics/profiling")
+def set_profiling(sample_rate: float = Query(..., ge=0, le=1)):
+    """Profile this fraction of requests from now on (this process only); 0 turns it off."""
+    profiler.sample_rate = sample_rate
+    return profiler.metrics()
 
 #######################################################################################################
 
-# Initialize DB (basic setup)
+# Initialize DB (create tables, apply pending migrations)
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS checkins (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            employee_id TEXT,
-            checkin_time TEXT,
-            checkout_time TEXT,
-            latitude REAL,
-            longitude REAL,
-            context TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with get_pool().connection() as conn:
+        migrate(conn)
 
 init_db()
 
@@ -69,19 +138,138 @@ class CheckIn(BaseModel):
     checkout_time: datetime
     context: Optional[List[str]] = []
 
+INSERT_CHECKIN_SQL = '''
+    INSERT INTO checkins (id, employee_id, checkin_time, checkout_time, context, checkin_ts, checkout_ts, work_date,
+                          checkin_minute, expected_start_minute)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def checkin_row(checkin_id, data: CheckIn, clock):
+    """The checkins row of one record, its times on the employee's site clock (models/sites.py)."""
+    tz, expected_start = clock
+    checkin, checkout = site_time(data.checkin_time, tz), site_time(data.checkout_time, tz)
+    checkin_ts, day, minutes = local_fields(checkin)
+    return (
+        checkin_id,
+        data.employee_id,
+        checkin.isoformat(),
+        checkout.isoformat(),
+        ",".join(data.context),
+        checkin_ts,
+        local_fields(checkout)[0],
+        day,
+        minutes,
+        expected_start
+    )
+
 # Endpoint to submit check-in
 @app.post("/checkin")
-def submit_checkin(data: CheckIn):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO checkins (employee_id, checkin_time, checkout_time, context)
-        VALUES (?, ?, ?, ?)
-    ''', (data.employee_id, data.checkin_time.isoformat(), data.checkout_time.isoformat(), ",".join(data.context)))
-    conn.commit()
-    conn.close()
+async def submit_checkin(data: CheckIn):
+    await database.run(insert_checkin_batch, [data])
     return {"message": "Check-in recorded"}
 
+####Bulk ingestion: JSON array or NDJSON stream, one transaction per BULK_BATCH_SIZE rows
+
+BULK_BATCH_SIZE = 500
+
+def insert_checkin_batch(conn, records):
+    """Insert validated CheckIn records and fold them into the baseline store in one transaction."""
+    with write_transaction(conn, lock_keys=[data.employee_id for data in records]):
+        clocks = employee_clocks(conn, (data.employee_id for data in records))
+        # Ids are allocated up front, so no per-row lastrowid round trip is needed
+        ids = dialect(conn).allocate_ids(conn, "checkins", len(records))
+        rows = [checkin_row(checkin_id, data, clocks[data.employee_id]) for checkin_id, data in zip(ids, records)]
+        conn.executemany(INSERT_CHECKIN_SQL, rows)
+        baselines.record_events(
+            conn,
+            checkins=[(checkin_id, emp, ts, day, minutes) for checkin_id, emp, _, _, _, ts, _, day, minutes, _ in rows],
+            checkouts=[(emp, day, minutes, checkout_ts - ts, expected)
+                       for _, emp, _, _, _, ts, checkout_ts, day, minutes, expected in rows]
+        )
+    # Committed: a failure from here on must not make the caller resend these rows
+    try:
+        versions.bump((data.employee_id for data in records), conn)
+        nudge_hub.evaluate(conn, {data.employee_id for data in records})
+    except Exception as e:
+        print(f"Updating caches after {len(records)} check-ins failed: {e!r}")
+
+async def iter_bulk_records(request: Request):
+    """Yields (index, parsed object or parse error) from a JSON array or an NDJSON body."""
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        index, buffer = 0, b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield index, _parse_line(line)
+                    index += 1
+        if buffer.strip():
+            yield index, _parse_line(buffer)
+        return
+
+    try:
+        body = json.loads(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of check-ins.")
+    for index, item in enumerate(body):
+        yield index, item
+
+def _parse_line(line):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+
+@app.post("/checkin/bulk")
+async def submit_checkin_bulk(request: Request):
+    results = []
+    batch, batch_indexes = [], []
+    accepted = 0
+
+    async def flush():
+        nonlocal accepted
+        # Earlier batches may have committed: whatever fails here rejects just this batch's rows
+        try:
+            await database.run(insert_checkin_batch, batch)
+            accepted += len(batch)
+            results.extend({"index": i, "status": "accepted"} for i in batch_indexes)
+        except DatabaseBusy:
+            results.extend({"index": i, "status": "rejected", "error": "Database is busy, please retry."} for i in batch_indexes)
+        except DATABASE_ERRORS as e:
+            results.extend({"index": i, "status": "rejected", "error": f"Database error: {e}"} for i in batch_indexes)
+        except Exception as e:
+            results.extend({"index": i, "status": "rejected", "error": f"Write failed: {e!r}"} for i in batch_indexes)
+        batch.clear()
+        batch_indexes.clear()
+
+    async for index, item in iter_bulk_records(request):
+        if isinstance(item, Exception):
+            results.append({"index": index, "status": "rejected", "error": str(item)})
+            continue
+        try:
+            data = CheckIn.model_validate(item)
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(map(str, err['loc']))}: {err['msg']}" if err['loc'] else err['msg']
+                for err in e.errors()
+            )
+            results.append({"index": index, "status": "rejected", "error": errors})
+            continue
+        batch.append(data)
+        batch_indexes.append(index)
+        if len(batch) >= BULK_BATCH_SIZE:
+            await flush()
+
+    if batch:
+        await flush()
+
+    results.sort(key=lambda r: r["index"])
+    return {"accepted": accepted, "rejected": len(results) - accepted, "results": results}
+
 ####Adding the checkin form - HTML input form 
 
 @app.get("/checkin-form", response_class=HTMLResponse)
@@ -96,23 +284,8 @@ async def submit_checkin_form(
 ):
     from datetime import datetime
     checkin_time = datetime.now()
-    location_name = reverse_geocode(latitude, longitude)
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO checkins (employee_id, checkin_time, checkout_time, latitude, longitude, context)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (
-        employee_id,
-        checkin_time.isoformat(),
-        None,
-        latitude,
-        longitude,
-        location_name
-    ))
-    conn.commit()
-    conn.close()
+    # Written by the write-behind queue; location is filled from cache or by the geocoder
+    await enqueue_or_503(checkin_event(employee_id, checkin_time, latitude, longitude))
 
     return RedirectResponse(url="/checkin-form", status_code=303)
 
@@ -126,138 +299,78 @@ async def submit_checkout_form(employee_id: str = Form(...)):
     from datetime import datetime
 
     checkout_time = datetime.now()
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    # Find the latest record for this employee with NULL checkout
-    cursor.execute('''
-        SELECT id FROM checkins
-        WHERE employee_id = ? AND checkout_time IS NULL
-        ORDER BY checkin_time DESC
-        LIMIT 1
-    ''', (employee_id,))
-    result = cursor.fetchone()
-
-    if result:
-        checkin_id = result[0]
-        cursor.execute('''
-            UPDATE checkins
-            SET checkout_time = ?
-            WHERE id = ?
-        ''', (checkout_time.isoformat(), checkin_id))
-        conn.commit()
-
-    conn.close()
+    # Closes the employee's open session (models/sessions.py) when the writer applies it
+    await enqueue_or_503(checkout_event(employee_id, checkout_time))
 
     return RedirectResponse(url="/checkout-form", status_code=303)
 
 ###################################################################################################################################
 
-# Endpoint to get behavior timeline for an employee
-@app.get("/timeline/{employee_id}")
-def get_behavior_timeline(employee_id: str):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT checkin_time, checkout_time, context FROM checkins
-        WHERE employee_id = ?
-        ORDER BY checkin_time ASC
-    ''', (employee_id,))
-    rows = cursor.fetchall()
-    conn.close()
-
-    if not rows:
+# Employee timeline (date filters, keyset pagination, NDJSON streaming, daily/weekly rollups)
+app.include_router(timeline_router)
+
+# Precomputed check-in baseline for an employee (maintained on every write, see models/baselines.py)
+@app.get("/baseline/{employee_id}")
+async def get_baseline(employee_id: str):
+    state = (await database.run(baselines.load_states, [employee_id])).get(employee_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="No check-in records found for this employee.")
 
-    timeline = []
-    for checkin, checkout, context in rows:
-        checkin_dt = datetime.fromisoformat(checkin)
-        checkout_dt = datetime.fromisoformat(checkout)
-        duration = (checkout_dt - checkin_dt).total_seconds() / 3600
-        timeline.append({
-            "date": checkin_dt.date().isoformat(),
-            "checkin": checkin_dt.time().strftime("%H:%M"),
-            "checkout": checkout_dt.time().strftime("%H:%M"),
-            "duration_hours": round(duration, 2),
-            "context": context.split(",") if context else []
-        })
-
-    return {"employee_id": employee_id, "timeline": timeline}
-
-############ CALCULATE personalized baseline for each employee to see the pattern ###################
-
-def calculate_baseline(employee_id, conn):
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT checkin_time FROM checkins
-        WHERE employee_id = ?
-        AND checkin_time IS NOT NULL
-        ORDER BY checkin_time DESC
-        LIMIT 7
-    ''', (employee_id,))
-    
-    times = []
-    for row in cursor.fetchall():
-        dt = datetime.fromisoformat(row[0])
-        minutes = dt.hour * 60 + dt.minute
-        times.append(minutes)
-    
-    if not times:
-        return None, None
-
-    mean = sum(times) / len(times)
-    stddev = (sum((x - mean) ** 2 for x in times) / len(times)) ** 0.5
-    return mean, stddev
-
-############################
-
-
-################Adding the behaviour shift detection########################################
-
-def detect_shift(employee_id, conn):
-    cursor = conn.cursor()
-
-    # Get last 3 check-ins
-    cursor.execute('''
-        SELECT checkin_time FROM checkins
-        WHERE employee_id = ?
-        AND checkin_time IS NOT NULL
-        ORDER BY checkin_time DESC
-        LIMIT 3
-    ''', (employee_id,))
-    recent = [
-        datetime.fromisoformat(row[0]).hour * 60 + datetime.fromisoformat(row[0]).minute
-        for row in cursor.fetchall()
-    ]
-
-    # Get baseline (older)
-    cursor.execute('''
-        SELECT checkin_time FROM checkins
-        WHERE employee_id = ?
-        AND checkin_time IS NOT NULL
-        ORDER BY checkin_time DESC
-        LIMIT 7 OFFSET 3
-    ''', (employee_id,))
-    baseline = [
-        datetime.fromisoformat(row[0]).hour * 60 + datetime.fromisoformat(row[0]).minute
-        for row in cursor.fetchall()
-    ]
-
-    if len(recent) < 2 or len(baseline) < 3:
-        return None
-
-    avg_recent = sum(recent) / len(recent)
-    avg_baseline = sum(baseline) / len(baseline)
-    diff = avg_recent - avg_baseline
-
-    return diff  # + means later, - means earlier
+    count = state["checkin_count"]
+    return {
+        "employee_id": employee_id,
+        "baseline_mean_minutes": state["baseline_mean"],
+        "baseline_stddev_minutes": state["baseline_stddev"],
+        "shift_minutes": state["shift"],
+        "checkin_count": count,
+        "lifetime_mean_minutes": state["lifetime_mean"],
+        "lifetime_stddev_minutes": (state["lifetime_m2"] / count) ** 0.5 if count else None,
+        "recent_checkin_minutes": [m for _, m in state["recent"]]
+    }
 
 #################Getting forecast from forecast.py############
 
 app.include_router(forecast_router)
 
+# Org hierarchy, team assignments and team/department/org capacity rollups
+app.include_router(capacity_router)
+
+# Site timezones and expected start times, and which site each employee works at
+app.include_router(sites_router)
+
+# Who is checked in right now; stale sessions are auto-closed in the background
+app.include_router(sessions_router)
+
+# Overview page totals in one round trip
+app.include_router(dashboard_router)
+
 #####################################
 @app.get("/nudges")
-def nudges_route():
-    return generate_nudges()
+async def nudges_route(request: Request, fresh: bool = False):
+    if fresh:
+        return await cached_response(request, "nudges", (), generate_nudges)
+    # Tonight's behavior-shift nudges plus today's unusual check-ins (utils/precompute.py);
+    # ?fresh=true recomputes the shifts too
+    return await cached_response(request, "nudges", ("precomputed",), precomputed_nudges_or_live)
+
+# Live nudges as Server-Sent Events, pushed as check-ins are written. Only nudges
+# that appear after connecting are sent; fetch /nudges for the current ones.
+@app.get("/nudges/stream")
+async def nudges_stream(employees: Optional[List[str]] = Query(None)):
+    try:
+        subscriber = nudge_hub.subscribe(employees)
+    except TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many live nudge subscribers, please retry shortly.")
+    return StreamingResponse(
+        nudge_hub.events(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/nudges/stream/stats")
+def nudges_stream_stats():
+    return nudge_hub.metrics()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {**result_cache.stats(), "sync": version_sync.metrics()}
@@ -0,0 +1,274 @@
+from datetime import date, timedelta
+import heapq
+import json
+from engine.utils.cache import versions
+from engine.utils.db import upsert_sql, write_transaction
+
+############ Incremental per-employee baseline store ###################
+# employee_stats keeps, per employee, a ring buffer of the last 10 check-in
+# minutes plus the baseline/shift numbers derived from it, and lifetime
+# check-in minute stats (Welford). employee_daily keeps per-day hours and the
+# sums the risk radar needs, and employee_weekly the same hours laid out as
+# one row per week with a column per weekday (for the forecast). team_daily
+# rolls employee_daily up to the employee's current team (models/capacity.py).
+# All are updated on every check-in/checkout write, so the analytic endpoints
+# read a few precomputed rows per employee. The apply_* functions work on the
+# integer columns stored with each check-in (epoch seconds, local minute of
+# day and work date, expected start; see models/sites.py), so a rebuild never
+# parses a timestamp.
+
+BASELINE_WINDOW = 7
+RECENT_WINDOW = 3
+RING_SIZE = RECENT_WINDOW + BASELINE_WINDOW
+# Expected start of check-ins written without one (employees not at a site)
+EXPECTED_START_MINUTES = 9 * 60
+REBUILD_CHUNK_SIZE = 10000
+# Employee-days rebuild() folds in memory before adding them to the store tables
+REBUILD_FLUSH_DAYS = 50000
+TEAM_LOOKUP_CHUNK_SIZE = 500
+WEEKDAY_COLUMNS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+# team_daily bucket for employees without a row in employee_teams
+UNASSIGNED_TEAM = ""
+
+def new_state(employee_id, first_seen_id):
+    return {
+        "employee_id": employee_id,
+        "first_seen_id": first_seen_id,
+        "recent": [],               # [[checkin_ts, minutes], ...] newest first
+        "checkin_count": 0,
+        "lifetime_mean": 0.0,
+        "lifetime_m2": 0.0,
+        "baseline_mean": None,
+        "baseline_stddev": None,
+        "shift": None,
+        "last_work_date": None,
+        "first_checkin_minutes": None,
+    }
+
+def _refresh_derived(state):
+    minutes = [m for _, m in state["recent"]]
+    baseline = minutes[:BASELINE_WINDOW]
+    if baseline:
+        mean = sum(baseline) / len(baseline)
+        state["baseline_mean"] = mean
+        state["baseline_stddev"] = (sum((x - mean) ** 2 for x in baseline) / len(baseline)) ** 0.5
+
+    recent, older = minutes[:RECENT_WINDOW], minutes[RECENT_WINDOW:]
+    if len(recent) < 2 or len(older) < 3:
+        state["shift"] = None
+    else:
+        state["shift"] = sum(recent) / len(recent) - sum(older) / len(older)
+
+def apply_checkin(state, ts, minutes, day):
+    # Ring buffer of the newest RING_SIZE check-ins, ordered like ORDER BY checkin_ts DESC
+    recent = state["recent"]
+    position = len(recent)
+    while position > 0 and recent[position - 1][0] < ts:
+        position -= 1
+    if position < RING_SIZE:
+        recent.insert(position, [ts, minutes])
+        del recent[RING_SIZE:]
+        _refresh_derived(state)
+
+    # Welford running mean/variance over every check-in
+    state["checkin_count"] += 1
+    delta = minutes - state["lifetime_mean"]
+    state["lifetime_mean"] += delta / state["checkin_count"]
+    state["lifetime_m2"] += delta * (minutes - state["lifetime_mean"])
+
+    # First check-in recorded on the latest work date ("today's" check-in for nudges)
+    if state["last_work_date"] is None or day > state["last_work_date"]:
+        state["last_work_date"] = day
+        state["first_checkin_minutes"] = minutes
+
+def _daily_delta(daily, employee_id, day):
+    key = (employee_id, day)
+    if key not in daily:
+        daily[key] = [0, 0, 0.0, 0.0, 0.0]   # sessions, completed, hours, delta_sum, delta_sumsq
+    return daily[key]
+
+def apply_daily_checkin(daily, employee_id, day):
+    _daily_delta(daily, employee_id, day)[0] += 1
+
+def apply_daily_checkout(daily, employee_id, day, minutes, seconds, expected_start=None):
+    """A completed session of `seconds` that started at minute of day `minutes` on `day`."""
+    row = _daily_delta(daily, employee_id, day)
+    shift_delta = abs(minutes - (EXPECTED_START_MINUTES if expected_start is None else expected_start))
+    row[1] += 1
+    row[2] += seconds / 3600.0
+    row[3] += shift_delta
+    row[4] += shift_delta ** 2
+
+def weekly_deltas(daily):
+    """Fold per-day deltas into (employee_id, week_start) -> hours per weekday."""
+    weekly = {}
+    for (employee_id, day), values in daily.items():
+        if not values[2]:
+            continue
+        day = date.fromisoformat(day)
+        key = (employee_id, (day - timedelta(days=day.weekday())).isoformat())
+        if key not in weekly:
+            weekly[key] = [0.0] * len(WEEKDAY_COLUMNS)
+        weekly[key][day.weekday()] += values[2]
+    return weekly
+
+############ Persistence ############
+
+STATE_COLUMNS = (
+    "employee_id", "first_seen_id", "recent", "checkin_count", "lifetime_mean", "lifetime_m2",
+    "baseline_mean", "baseline_stddev", "shift", "last_work_date", "first_checkin_minutes"
+)
+
+def load_states(conn, employee_ids):
+    employee_ids = list(employee_ids)
+    if not employee_ids:
+        return {}
+    placeholders = ",".join("?" * len(employee_ids))
+    rows = conn.execute(
+        f"SELECT {', '.join(STATE_COLUMNS)} FROM employee_stats WHERE employee_id IN ({placeholders})",
+        employee_ids
+    ).fetchall()
+    states = {}
+    for row in rows:
+        state = dict(zip(STATE_COLUMNS, row))
+        state["recent"] = json.loads(state["recent"])
+        states[state["employee_id"]] = state
+    return states
+
+def save(conn, states, daily):
+    conn.executemany(upsert_sql("employee_stats", STATE_COLUMNS, ("employee_id",)), (
+        tuple(json.dumps(s[c]) if c == "recent" else s[c] for c in STATE_COLUMNS)
+        for s in states.values()
+    ))
+    conn.executemany('''
+        INSERT INTO employee_daily (employee_id, work_date, sessions, completed, hours, delta_sum, delta_sumsq)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (employee_id, work_date) DO UPDATE SET
+            sessions = employee_daily.sessions + excluded.sessions,
+            completed = employee_daily.completed + excluded.completed,
+            hours = employee_daily.hours + excluded.hours,
+            delta_sum = employee_daily.delta_sum + excluded.delta_sum,
+            delta_sumsq = employee_daily.delta_sumsq + excluded.delta_sumsq
+    ''', ((emp, day, *values) for (emp, day), values in daily.items()))
+    conn.executemany(f'''
+        INSERT INTO employee_weekly (employee_id, week_start, {', '.join(WEEKDAY_COLUMNS)})
+        VALUES (?, ?, {', '.join('?' * len(WEEKDAY_COLUMNS))})
+        ON CONFLICT (employee_id, week_start) DO UPDATE SET
+            {', '.join(f"{c} = employee_weekly.{c} + excluded.{c}" for c in WEEKDAY_COLUMNS)}
+    ''', ((emp, week, *values) for (emp, week), values in weekly_deltas(daily).items()))
+    save_team_daily(conn, ((emp, day, values) for (emp, day), values in daily.items()))
+
+def teams_of(conn, employee_ids):
+    employee_ids = sorted(employee_ids)
+    teams = {}
+    for i in range(0, len(employee_ids), TEAM_LOOKUP_CHUNK_SIZE):
+        chunk = employee_ids[i:i + TEAM_LOOKUP_CHUNK_SIZE]
+        teams.update(conn.execute(
+            f"SELECT employee_id, team_id FROM employee_teams WHERE employee_id IN ({','.join('?' * len(chunk))})",
+            chunk
+        ))
+    return teams
+
+def save_team_daily(conn, deltas):
+    """Add (employee_id, work_date, [sessions, completed, hours, ...]) deltas to the employee's team."""
+    deltas = list(deltas)
+    teams = teams_of(conn, {emp for emp, _, _ in deltas})
+    totals = {}
+    for emp, day, values in deltas:
+        row = totals.setdefault((teams.get(emp, UNASSIGNED_TEAM), day), [0, 0, 0.0])
+        for i in range(3):
+            row[i] += values[i]
+    # One row per team and day, in key order: concurrent writers (PostgreSQL) lock team rows in the same order
+    conn.executemany('''
+        INSERT INTO team_daily (team_id, work_date, sessions, completed, hours)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (team_id, work_date) DO UPDATE SET
+            sessions = team_daily.sessions + excluded.sessions,
+            completed = team_daily.completed + excluded.completed,
+            hours = team_daily.hours + excluded.hours
+    ''', ((team, day, *values) for (team, day), values in sorted(totals.items())))
+
+def record_events(conn, checkins=(), checkouts=(), late_checkouts=()):
+    """
+    Fold new writes into the store, inside the caller's write transaction, from
+    the values written to checkins: checkins (checkin_id, employee_id,
+    checkin_ts, work_date, checkin_minute), checkouts (employee_id, work_date,
+    checkin_minute, checkout_ts - checkin_ts, expected_start_minute) and
+    late_checkouts (employee_id, work_date, checkout_ts - checkin_ts) written
+    over an auto-closed session's zero-length checkout (models/sessions.py),
+    which already counted it as completed.
+    """
+    states = load_states(conn, {c[1] for c in checkins})
+    daily = {}
+    for checkin_id, employee_id, checkin_ts, day, minutes in checkins:
+        state = states.get(employee_id)
+        if state is None:
+            state = states[employee_id] = new_state(employee_id, checkin_id)
+        apply_checkin(state, checkin_ts, minutes, day)
+        apply_daily_checkin(daily, employee_id, day)
+    for employee_id, day, minutes, seconds, expected_start in checkouts:
+        apply_daily_checkout(daily, employee_id, day, minutes, seconds, expected_start)
+    for employee_id, day, seconds in late_checkouts:
+        _daily_delta(daily, employee_id, day)[2] += seconds / 3600.0
+    save(conn, states, daily)
+
+def _live_rows(conn, chunk_size):
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, employee_id, checkin_ts, checkout_ts, work_date, checkin_minute, expected_start_minute FROM checkins
+            WHERE id > ? AND checkin_ts IS NOT NULL
+            ORDER BY id
+            LIMIT ?
+        ''', (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1][0]
+
+def history_rows(conn, chunk_size=REBUILD_CHUNK_SIZE):
+    """Every check-in in id order: archived months (utils/retention.py) merged with the live table."""
+    # Imported here: retention builds on the Parquet export, which imports this module
+    from engine.utils.retention import archived_rows
+    return heapq.merge(archived_rows(conn), _live_rows(conn, chunk_size))
+
+def rebuild(conn, chunk_size=REBUILD_CHUNK_SIZE, flush_days=REBUILD_FLUSH_DAYS):
+    """
+    Regenerate the store tables (employee_stats, employee_daily, employee_weekly,
+    team_daily) from the checkins history. The history is read inside the write
+    transaction, so check-ins and checkouts committed meanwhile (the CLI runs
+    against a live database) wait for it instead of being left out. Only one
+    state per employee stays in memory: daily rows are added to the tables
+    every flush_days employee-days, like record_events does.
+    """
+    states, daily = {}, {}
+    with write_transaction(conn):
+        conn.execute("DELETE FROM employee_stats")
+        conn.execute("DELETE FROM employee_daily")
+        conn.execute("DELETE FROM employee_weekly")
+        conn.execute("DELETE FROM team_daily")
+        for checkin_id, employee_id, checkin_ts, checkout_ts, day, minutes, expected_start in history_rows(conn, chunk_size):
+            state = states.get(employee_id)
+            if state is None:
+                state = states[employee_id] = new_state(employee_id, checkin_id)
+            apply_checkin(state, checkin_ts, minutes, day)
+            apply_daily_checkin(daily, employee_id, day)
+            if checkout_ts is not None:
+                apply_daily_checkout(daily, employee_id, day, minutes, checkout_ts - checkin_ts, expected_start)
+            if len(daily) >= flush_days:
+                save(conn, {}, daily)
+                daily = {}
+        save(conn, states, daily)
+    versions.bump(conn=conn)
+    return len(states)
+
+if __name__ == "__main__":
+    # Run from backend/: python -m engine.models.baselines [db_path]
+    import sys
+    from engine.utils import db
+    from engine.utils.migrations import migrate
+    if len(sys.argv) > 1:
+        db.configure(sys.argv[1])
+    with db.get_pool().connection() as conn:
+        migrate(conn)
+        print(f"Rebuilt baselines for {rebuild(conn)} employees")
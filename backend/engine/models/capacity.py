@@ -0,0 +1,155 @@
+from datetime import date, timedelta
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel
+from typing import List, Literal, Optional
+from engine.models.baselines import save_team_daily
+from engine.utils.cache import cached_response, versions
+from engine.utils.db import database, upsert_sql, write_transaction
+
+router = APIRouter()
+
+############ Team / department / org capacity ###################
+# org_units is the hierarchy (org > department > team, linked by parent_id) and
+# employee_teams maps each employee to one team. team_daily holds per-team daily
+# totals, kept in step with employee_daily on every write (models/baselines.py),
+# so a rollup over any window reads one row per team and day.
+
+DEFAULT_WINDOW_DAYS = 14
+
+class OrgUnit(BaseModel):
+    unit_id: str
+    name: str
+    kind: Literal["org", "department", "team"]
+    parent_id: Optional[str] = None
+
+class TeamAssignment(BaseModel):
+    employee_id: str
+    team_id: Optional[str] = None   # None takes the employee out of their team
+
+def upsert_units(conn, units):
+    with write_transaction(conn):
+        conn.executemany(
+            upsert_sql("org_units", ("unit_id", "name", "kind", "parent_id"), ("unit_id",)),
+            [(u.unit_id, u.name, u.kind, u.parent_id) for u in units]
+        )
+    versions.bump(conn=conn)
+
+def employee_daily_rows(conn, employee_id, sign=1):
+    return [
+        (employee_id, day, (sign * sessions, sign * completed, sign * hours))
+        for day, sessions, completed, hours in conn.execute(
+            "SELECT work_date, sessions, completed, hours FROM employee_daily WHERE employee_id = ?",
+            (employee_id,)
+        )
+    ]
+
+def assign_employees(conn, assignments):
+    """
+    Move employees between teams. Their whole employee_daily history moves with them,
+    so team_daily always reflects current membership.
+    """
+    teams = {row[0] for row in conn.execute("SELECT unit_id FROM org_units WHERE kind = 'team'")}
+    unknown = sorted({a.team_id for a in assignments if a.team_id is not None and a.team_id not in teams})
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown team(s): {', '.join(unknown)}")
+
+    with write_transaction(conn, lock_keys=[a.employee_id for a in assignments]):
+        for a in assignments:
+            current = conn.execute("SELECT team_id FROM employee_teams WHERE employee_id = ?", (a.employee_id,)).fetchone()
+            if (current[0] if current else None) == a.team_id:
+                continue
+            # Subtract under the old team, switch, add back under the new one
+            save_team_daily(conn, employee_daily_rows(conn, a.employee_id, sign=-1))
+            if a.team_id is None:
+                conn.execute("DELETE FROM employee_teams WHERE employee_id = ?", (a.employee_id,))
+            else:
+                conn.execute(upsert_sql("employee_teams", ("employee_id", "team_id"), ("employee_id",)), (a.employee_id, a.team_id))
+            save_team_daily(conn, employee_daily_rows(conn, a.employee_id))
+    versions.bump(conn=conn)
+
+def rollup(conn, start, end, unit_id=None, level=None):
+    units = {
+        row[0]: {"unit_id": row[0], "name": row[1], "kind": row[2], "parent_id": row[3],
+                 "headcount": 0, "sessions": 0, "completed": 0, "hours": 0.0}
+        for row in conn.execute("SELECT unit_id, name, kind, parent_id FROM org_units")
+    }
+    if unit_id is not None and unit_id not in units:
+        raise HTTPException(status_code=404, detail="Unknown org unit.")
+    unassigned = {"headcount": 0, "sessions": 0, "completed": 0, "hours": 0.0}
+
+    def add_up(team_id, values):
+        """Add values to the team and every unit above it."""
+        target = units.get(team_id)
+        if target is None:
+            for key, value in values.items():
+                unassigned[key] += value
+            return
+        seen = set()
+        while target is not None and target["unit_id"] not in seen:
+            seen.add(target["unit_id"])
+            for key, value in values.items():
+                target[key] += value
+            target = units.get(target["parent_id"])
+
+    for team_id, headcount in conn.execute("SELECT team_id, COUNT(*) FROM employee_teams GROUP BY team_id"):
+        add_up(team_id, {"headcount": headcount})
+    assigned = sum(u["headcount"] for u in units.values() if u["kind"] == "team")
+    unassigned["headcount"] = max(conn.execute("SELECT COUNT(*) FROM employee_stats").fetchone()[0] - assigned, 0)
+    for team_id, sessions, completed, hours in conn.execute('''
+        SELECT team_id, SUM(sessions), SUM(completed), SUM(hours) FROM team_daily
+        WHERE work_date BETWEEN ? AND ?
+        GROUP BY team_id
+    ''', (start.isoformat(), end.isoformat())):
+        add_up(team_id, {"sessions": sessions, "completed": completed, "hours": hours})
+
+    if unit_id is not None:
+        # Keep unit_id and everything below it
+        subtree, frontier = {unit_id}, [unit_id]
+        while frontier:
+            children = [u["unit_id"] for u in units.values() if u["parent_id"] in frontier and u["unit_id"] not in subtree]
+            subtree.update(children)
+            frontier = children
+        selected = [units[u] for u in subtree]
+    else:
+        selected = list(units.values())
+    if level is not None:
+        selected = [u for u in selected if u["kind"] == level]
+
+    days = (end - start).days + 1
+    for unit in selected + [unassigned]:
+        unit["hours"] = round(unit["hours"], 2)
+        unit["avg_weekly_hours"] = round(unit["hours"] / days * 7, 2)
+
+    response = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "units": sorted(selected, key=lambda u: (u["kind"] != "org", u["kind"] != "department", u["unit_id"])),
+    }
+    if unit_id is None:
+        # Employees without a team (or whose team is missing from org_units)
+        response["unassigned"] = unassigned
+    return response
+
+@router.put("/org/units")
+async def put_org_units(units: List[OrgUnit]):
+    await database.run(upsert_units, units)
+    return {"updated": len(units)}
+
+@router.put("/org/assignments")
+async def put_team_assignments(assignments: List[TeamAssignment]):
+    await database.run(assign_employees, assignments)
+    return {"updated": len(assignments)}
+
+@router.get("/capacity/rollup")
+async def capacity_rollup(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    unit_id: Optional[str] = None,
+    level: Optional[Literal["org", "department", "team"]] = None
+):
+    end = end or date.today()
+    start = start or end - timedelta(days=DEFAULT_WINDOW_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+    return await cached_response(request, "capacity-rollup", (start, end, unit_id, level), rollup, start, end, unit_id, level)
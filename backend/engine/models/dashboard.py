@@ -0,0 +1,58 @@
+from collections import Counter
+from fastapi import APIRouter, Request
+from engine.models.baselines import EXPECTED_START_MINUTES
+from engine.models.riskradar import assess_risks
+from engine.models.sites import date_at, local_dates
+from engine.utils.cache import cached_response
+
+router = APIRouter()
+
+############ Overview dashboard ###################
+# One round trip for the Overview page. Everything comes from the maintained
+# stores: employee_stats (one row per employee) for check-in totals and today's
+# first check-ins, open_sessions for who is in, and the risk radar over
+# employee_daily for the risk counts.
+
+# A first check-in later than this many minutes after the expected start counts as late
+LATE_GRACE_MINUTES = 15
+
+def dashboard_summary(conn, today=None):
+    # "Today" is each site's local date (models/sites.py), and late is against its expected start
+    dates = local_dates(conn, today)
+    employees, total_checkins = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(checkin_count), 0) FROM employee_stats"
+    ).fetchone()
+    checked_in_today = late_today = 0
+    for site_id, last_work_date, checked_in, late in conn.execute('''
+        SELECT es.site_id, st.last_work_date, COUNT(*),
+               SUM(CASE WHEN st.first_checkin_minutes > COALESCE(s.expected_start_minute, ?) + ? THEN 1 ELSE 0 END)
+        FROM employee_stats st
+        LEFT JOIN employee_sites es ON es.employee_id = st.employee_id
+        LEFT JOIN sites s ON s.site_id = es.site_id
+        WHERE st.last_work_date >= ?
+        GROUP BY es.site_id, st.last_work_date
+    ''', (EXPECTED_START_MINUTES, LATE_GRACE_MINUTES, min(dates.values()).isoformat())):
+        if last_work_date == date_at(dates, site_id).isoformat():
+            checked_in_today += checked_in
+            late_today += late
+    (open_sessions,) = conn.execute("SELECT COUNT(*) FROM open_sessions").fetchone()
+
+    risks = assess_risks(conn, None, today)["risks"]
+    return {
+        "date": dates[None].isoformat(),
+        "employees": employees,
+        "total_checkins": total_checkins,
+        "checked_in_today": checked_in_today,
+        "late_today": late_today,
+        "late_pct": round(100.0 * late_today / checked_in_today, 1) if checked_in_today else 0.0,
+        "open_sessions": open_sessions,
+        "risks": {
+            "total": len(risks),
+            "by_severity": dict(Counter(r["severity"] for r in risks)),
+            "by_type": dict(Counter(r["risk_type"] for r in risks)),
+        },
+    }
+
+@router.get("/dashboard/summary")
+async def get_dashboard_summary(request: Request):
+    return await cached_response(request, "dashboard-summary", (), dashboard_summary)
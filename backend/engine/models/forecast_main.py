@@ -1,60 +1,48 @@
 import streamlit as st
 import requests
 import pandas as pd
-from fastapi import APIRouter, Query
-from typing import List
-import sqlite3
-from datetime import datetime, timedelta
+from fastapi import APIRouter, Query, HTTPException, Request
+from typing import List, Optional
+from engine.models.forecasting import HISTORY_WEEKS, MAX_HISTORY_WEEKS, MAX_HORIZON_WEEKS, forecast_employees
+from engine.utils.cache import cached_response
+from engine.utils.precompute import precomputed_or_live
 
 router = APIRouter()
 
-DB_FILE = "../db/checkins.db"
 API_BASE_URL = "http://127.0.0.1:8000"
 
 # -------------------------------
 # 📌 FASTAPI FORECAST ENDPOINT
 @router.get("/forecast")
-def get_forecast(
-    employees: List[str] = Query(...),
+async def get_forecast(
+    request: Request,
+    employees: Optional[List[str]] = Query(None),
+    all_employees: bool = False,
     country: str = "IN",
-    region: str = "MH"
+    region: str = "MH",
+    weeks: int = Query(1, ge=1, le=MAX_HORIZON_WEEKS),
+    history_weeks: int = Query(HISTORY_WEEKS, ge=1, le=MAX_HISTORY_WEEKS),
+    fresh: bool = False
 ):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cutoff = datetime.now() - timedelta(days=14)
-
-    forecast = []
-
-    for emp in employees:
-        cursor.execute('''
-            SELECT checkin_time, checkout_time FROM checkins
-            WHERE employee_id = ?
-            AND checkin_time IS NOT NULL AND checkout_time IS NOT NULL
-            AND checkin_time >= ?
-        ''', (emp, cutoff.isoformat()))
-        
-        rows = cursor.fetchall()
-        total_seconds = 0
-        for checkin, checkout in rows:
-            try:
-                checkin_dt = datetime.fromisoformat(checkin)
-                checkout_dt = datetime.fromisoformat(checkout)
-                total_seconds += (checkout_dt - checkin_dt).total_seconds()
-            except Exception:
-                continue
-
-        total_hours = total_seconds / 3600
-        avg_weekly = round(total_hours / 2, 2)  # 14 days → 2 weeks
+    if not employees and not all_employees:
+        raise HTTPException(status_code=400, detail="Pass one or more employees or set all_employees=true.")
 
-        forecast.append({
-            "employee_id": emp,
-            "country": country,
-            "region": region,
-            "forecast_hours": avg_weekly
-        })
-
-    conn.close()
-    return {"forecast": forecast}
+    if all_employees:
+        fn, args, employees = forecast_all, (country, region, weeks, history_weeks), None
+    else:
+        fn, args = forecast_employees, (employees, country, region, weeks, None, history_weeks)
+    if not fresh:
+        # Tonight's results (utils/precompute.py) when they cover the request
+        params = {"country": country, "region": region, "weeks": weeks, "history_weeks": history_weeks}
+        fn, args = precomputed_or_live, ("forecast", params, employees, fn, *args)
+    return await cached_response(
+        request, "forecast", (tuple(employees) if employees else "all", country, region, weeks, history_weeks, fresh),
+        fn, *args, employee_ids=employees
+    )
+
+def forecast_all(conn, country, region, weeks, history_weeks=HISTORY_WEEKS):
+    employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY first_seen_id")]
+    return forecast_employees(conn, employees, country, region, weeks, history_weeks=history_weeks)
 # -------------------------------
 
 # -------------------------------
@@ -0,0 +1,193 @@
+from datetime import date, timedelta
+from functools import lru_cache
+import csv
+import os
+import numpy as np
+from engine.models.baselines import WEEKDAY_COLUMNS
+from engine.models.riskradar import MAX_INLINE_PARAMS
+from engine.utils.columnar import SNAPSHOT_MIN_DAYS, snapshot
+from engine.utils.executor import analytics
+
+############ Weekday-seasonal capacity forecast ###################
+# Each employee's history is a row of daily hours (from employee_weekly) in a
+# (employees x days) matrix. The model is an exponentially weighted mean and
+# variance of hours per weekday, fitted for every employee at once with two
+# matrix products. Holidays are left out of the fit and forecast as zero hours.
+
+HISTORY_WEEKS = 8
+MAX_HISTORY_WEEKS = 104
+HALF_LIFE_WEEKS = 2
+MAX_HORIZON_WEEKS = 12
+# Two-sided 80% normal interval
+INTERVAL_Z = 1.2816
+
+HOLIDAYS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "holidays.csv")
+
+@lru_cache(maxsize=None)
+def load_holidays(country, region=None):
+    """Nationwide holidays for country plus the ones of region, from data/holidays.csv."""
+    holidays = set()
+    with open(HOLIDAYS_FILE, newline="") as f:
+        for row in csv.DictReader(f):
+            if row["country"] == country and row["region"] in ("", region):
+                holidays.add(date.fromisoformat(row["date"]))
+    return frozenset(holidays)
+
+def _day_index(start, days):
+    return np.arange(np.datetime64(start, "D"), np.datetime64(start, "D") + days)
+
+def _unique_rows(employees):
+    """(employees without repeats in first-seen order, each given employee's row in them)."""
+    unique = list(dict.fromkeys(employees))
+    index = {e: i for i, e in enumerate(unique)}
+    return unique, [index[e] for e in employees]
+
+def load_daily_hours(conn, employees, start, days):
+    """
+    (employees x days) matrix of hours from start (a Monday). Long histories read
+    the days the Arrow snapshot covers from it (utils/columnar.py, when enabled)
+    and the weeks after that from SQLite.
+    """
+    unique, rows = _unique_rows(employees)
+    if len(unique) < len(employees):
+        # A repeated id is read once and fills every row it was asked for
+        return load_daily_hours(conn, unique, start, days)[rows]
+    split = snapshot.split_date(conn, start) if days >= SNAPSHOT_MIN_DAYS else None
+    if split is None:
+        return load_daily_hours_sqlite(conn, employees, start, days)
+
+    covered = min((split - start).days + 1, days)
+    hours = np.zeros((len(employees), days))
+    hours[:, :covered] = snapshot.daily_hours(employees, start, covered)
+    if covered < days:
+        # employee_weekly is read whole weeks at a time, from the Monday of the first uncovered day
+        week_start = start + timedelta(days=covered - covered % 7)
+        offset = (week_start - start).days
+        recent = load_daily_hours_sqlite(conn, employees, week_start, days - offset)
+        hours[:, covered:] = recent[:, covered - offset:]
+    return hours
+
+def load_daily_hours_sqlite(conn, employees, start, days):
+    """
+    One query over employee_weekly (a row per employee and week, a column per
+    weekday, see models/baselines.py) for the weeks covering [start, start + days),
+    returned as an (employees x days) matrix of hours. start must be a Monday.
+    """
+    unique, rows = _unique_rows(employees)
+    if len(unique) < len(employees):
+        return load_daily_hours_sqlite(conn, unique, start, days)[rows]
+    weeks = -(-days // 7)
+    columns = ", ".join(f"w.{c}" for c in WEEKDAY_COLUMNS)
+    base_sql = f'''
+        SELECT {{employee}}, w.week_start, {columns}
+        FROM employee_weekly w
+        {{join}}
+        WHERE w.week_start >= ? AND w.week_start < ?
+        {{where}}
+    '''
+    params = [start.isoformat(), (start + timedelta(weeks=weeks)).isoformat()]
+
+    if len(employees) <= MAX_INLINE_PARAMS:
+        placeholders = ",".join("?" * len(employees))
+        sql = base_sql.format(employee="w.employee_id", join="", where=f"AND w.employee_id IN ({placeholders})")
+        params += list(employees)
+        positions = {emp: i for i, emp in enumerate(employees)}
+    else:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS forecast_employees (employee_id TEXT PRIMARY KEY, position INTEGER)")
+        conn.execute("DELETE FROM forecast_employees")
+        conn.executemany("INSERT INTO forecast_employees VALUES (?, ?)", ((e, i) for i, e in enumerate(employees)))
+        sql = base_sql.format(employee="f.position", join="JOIN forecast_employees f ON f.employee_id = w.employee_id", where="")
+        positions = None
+    rows = conn.execute(sql, params).fetchall()
+
+    hours = np.zeros((len(employees), weeks, 7))
+    if rows:
+        week_positions = {(start + timedelta(weeks=i)).isoformat(): i for i in range(weeks)}
+        emp_idx = np.fromiter((positions[r[0]] if positions else r[0] for r in rows), dtype=int, count=len(rows))
+        week_idx = np.fromiter((week_positions[r[1]] for r in rows), dtype=int, count=len(rows))
+        hours[emp_idx, week_idx] = np.array([r[2:] for r in rows], dtype=float)
+    return hours.reshape(len(employees), weeks * 7)[:, :days]
+
+def fit_weekday_profile(hours, start, holidays=frozenset(), half_life_days=HALF_LIFE_WEEKS * 7):
+    """
+    Exponentially weighted per-weekday mean and standard deviation of daily hours.
+    Days before an employee's first worked day and holidays carry no weight.
+    Returns two (employees x 7) arrays.
+    """
+    n_days = hours.shape[1]
+    dates = _day_index(start, n_days)
+    weekday = (dates.astype(int) + 3) % 7          # 1970-01-01 was a Thursday
+    holiday = np.isin(dates, np.array(sorted(holidays), dtype="datetime64[D]"))
+
+    age = n_days - 1 - np.arange(n_days)
+    decay = np.where(holiday, 0.0, 0.5 ** (age / half_life_days))
+    # (days x 7) weekday design matrix with the decay folded in
+    weights = np.zeros((n_days, 7))
+    weights[np.arange(n_days), weekday] = decay
+
+    worked = hours > 0
+    first_day = np.where(worked.any(axis=1), worked.argmax(axis=1), n_days)
+    active = (np.arange(n_days)[None, :] >= first_day[:, None]).astype(float)
+    total_weight = active @ weights
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(total_weight > 0, ((hours * active) @ weights) / total_weight, 0.0)
+        mean_sq = np.where(total_weight > 0, ((hours ** 2 * active) @ weights) / total_weight, 0.0)
+    stddev = np.sqrt(np.maximum(mean_sq - mean ** 2, 0.0))
+    return mean, stddev
+
+def project(mean, stddev, start, weeks, holidays=frozenset()):
+    """
+    Weekly totals over weeks * 7 days from start, with holidays at zero.
+    Daily errors are treated as independent, so weekly variance is the sum of daily ones.
+    """
+    days = weeks * 7
+    dates = _day_index(start, days)
+    weekday = (dates.astype(int) + 3) % 7
+    working = ~np.isin(dates, np.array(sorted(holidays), dtype="datetime64[D]"))
+
+    daily_mean = mean[:, weekday] * working
+    daily_var = (stddev[:, weekday] * working) ** 2
+    weekly_mean = daily_mean.reshape(len(mean), weeks, 7).sum(axis=2)
+    weekly_std = np.sqrt(daily_var.reshape(len(mean), weeks, 7).sum(axis=2))
+    lower = np.maximum(weekly_mean - INTERVAL_Z * weekly_std, 0.0)
+    upper = weekly_mean + INTERVAL_Z * weekly_std
+    return weekly_mean, lower, upper
+
+def forecast_employees(conn, employees, country="IN", region="MH", weeks=1, today=None, history_weeks=HISTORY_WEEKS):
+    if analytics.sharded(employees):
+        # Shards on the analytics pool (utils/executor.py), merged in employee order
+        parts = analytics.map(forecast_employees, employees, country, region, weeks, today, history_weeks)
+        return {"forecast": [row for part in parts for row in part["forecast"]], "holidays": parts[0]["holidays"]}
+
+    today = today or date.today()
+    # history_weeks full weeks plus the days of this week before today
+    history_start = today - timedelta(days=today.weekday(), weeks=history_weeks)
+    history_days = (today - history_start).days
+    horizon_start = today + timedelta(days=1)
+    holidays = load_holidays(country.upper(), region.upper() if region else None)
+
+    hours = load_daily_hours(conn, employees, history_start, history_days)
+    mean, stddev = fit_weekday_profile(hours, history_start, holidays)
+    weekly, lower, upper = project(mean, stddev, horizon_start, weeks, holidays)
+
+    week_starts = [(horizon_start + timedelta(weeks=w)).isoformat() for w in range(weeks)]
+    weekly, lower, upper, mean = weekly.round(2).tolist(), lower.round(2).tolist(), upper.round(2).tolist(), mean.round(2).tolist()
+    forecast = []
+    for i, emp in enumerate(employees):
+        forecast.append({
+            "employee_id": emp,
+            "country": country,
+            "region": region,
+            "forecast_hours": weekly[i][0],
+            "weeks": [
+                {"week_start": week_starts[w], "hours": weekly[i][w], "lower": lower[i][w], "upper": upper[i][w]}
+                for w in range(weeks)
+            ],
+            "weekday_profile": dict(zip(WEEKDAY_COLUMNS, mean[i])),
+        })
+
+    horizon_end = horizon_start + timedelta(days=weeks * 7)
+    return {
+        "forecast": forecast,
+        "holidays": sorted(d.isoformat() for d in holidays if horizon_start <= d < horizon_end),
+    }
@@ -1,22 +1,22 @@
-from datetime import datetime
-import sqlite3
+from engine.models.sites import date_at, local_dates
+from engine.utils.db import get_pool
+from engine.utils.executor import analytics
 
-DB_FILE = "../db/checkins.db"
+# calculate_baseline/detect_shift recompute from checkins what employee_stats
+# stores (models/baselines.py); testdata/ checks the store against them.
 
-def minutes_since_midnight(dt: datetime):
-    return dt.hour * 60 + dt.minute
-
-def calculate_baseline(employee_id, conn):
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT checkin_time FROM checkins
+def recent_checkin_minutes(employee_id, conn, limit):
+    """Minute of day of the employee's latest check-ins, newest first."""
+    return [row[0] for row in conn.execute('''
+        SELECT checkin_minute FROM checkins
         WHERE employee_id = ?
-        AND checkin_time IS NOT NULL
-        ORDER BY checkin_time DESC
-        LIMIT 7
-    ''', (employee_id,))
+        AND checkin_ts IS NOT NULL
+        ORDER BY checkin_ts DESC
+        LIMIT ?
+    ''', (employee_id, limit))]
 
-    times = [minutes_since_midnight(datetime.fromisoformat(row[0])) for row in cursor.fetchall()]
+def calculate_baseline(employee_id, conn):
+    times = recent_checkin_minutes(employee_id, conn, 7)
 
     if not times:
         return None, None
@@ -26,27 +26,9 @@ def calculate_baseline(employee_id, conn):
     return mean, stddev
 
 def detect_shift(employee_id, conn):
-    cursor = conn.cursor()
-
-    # Recent 3 check-ins
-    cursor.execute('''
-        SELECT checkin_time FROM checkins
-        WHERE employee_id = ?
-        AND checkin_time IS NOT NULL
-        ORDER BY checkin_time DESC
-        LIMIT 3
-    ''', (employee_id,))
-    recent = [minutes_since_midnight(datetime.fromisoformat(row[0])) for row in cursor.fetchall()]
-
-    # Baseline (prior 7 - 3 = 4 days)
-    cursor.execute('''
-        SELECT checkin_time FROM checkins
-        WHERE employee_id = ?
-        AND checkin_time IS NOT NULL
-        ORDER BY checkin_time DESC
-        LIMIT 7 OFFSET 3
-    ''', (employee_id,))
-    baseline = [minutes_since_midnight(datetime.fromisoformat(row[0])) for row in cursor.fetchall()]
+    # Recent 3 check-ins against the 7 before them
+    minutes = recent_checkin_minutes(employee_id, conn, 10)
+    recent, baseline = minutes[:3], minutes[3:]
 
     if len(recent) < 2 or len(baseline) < 3:
         return None
@@ -55,47 +37,111 @@ def detect_shift(employee_id, conn):
     avg_baseline = sum(baseline) / len(baseline)
     return avg_recent - avg_baseline
 
-def generate_nudges():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT DISTINCT employee_id FROM checkins')
-    employees = [row[0] for row in cursor.fetchall()]
+############ Nudges from the precomputed baseline store (models/baselines.py) ############
 
-    nudges = []
+UNUSUAL_CHECKIN = "Unusual check-in"
+BEHAVIOR_SHIFT = "Behavior Shift"
+
+STATS_COLUMNS = "st.employee_id, st.baseline_mean, st.baseline_stddev, st.shift, st.last_work_date, st.first_checkin_minutes"
+# "Today" of each employee is their site's local date (models/sites.py)
+STATS_FROM = "employee_stats st LEFT JOIN employee_sites es ON es.employee_id = st.employee_id"
 
-    for employee_id in employees:
-        # Get today's check-in
-        today = datetime.now().date()
-        cursor.execute('''
-            SELECT checkin_time FROM checkins
-            WHERE employee_id = ? AND DATE(checkin_time) = ?
-        ''', (employee_id, today.isoformat()))
-        row = cursor.fetchone()
-
-        if row:
-            checkin_dt = datetime.fromisoformat(row[0])
-            checkin_minutes = minutes_since_midnight(checkin_dt)
-            mean, stddev = calculate_baseline(employee_id, conn)
-
-            if mean and abs(checkin_minutes - mean) > max(30, stddev * 1.5):
-                nudges.append({
-                    "employee_id": employee_id,
-                    "summary": "Unusual check-in",
-                    "nudge_message": f"Checked in at {checkin_dt.strftime('%H:%M')}, usual is ~{int(mean//60):02d}:{int(mean%60):02d}.",
-                    "severity": "yellow"
-                })
-
-        # Behavior shift
-        shift = detect_shift(employee_id, conn)
-        if shift and abs(shift) > 30:
-            direction = "later" if shift > 0 else "earlier"
+def employee_nudges(employee_id, mean, stddev, shift, last_work_date, checkin_minutes, today):
+    """The unusual-check-in and behavior-shift rules for one employee_stats row."""
+    nudges = []
+    if last_work_date == today and checkin_minutes is not None:
+        if mean and abs(checkin_minutes - mean) > max(30, stddev * 1.5):
             nudges.append({
                 "employee_id": employee_id,
-                "summary": "Behavior Shift",
-                "nudge_message": f"Check-in shifted {int(abs(shift))} mins {direction} over recent days.",
+                "summary": UNUSUAL_CHECKIN,
+                "nudge_message": f"Checked in at {checkin_minutes // 60:02d}:{checkin_minutes % 60:02d}, usual is ~{int(mean//60):02d}:{int(mean%60):02d}.",
                 "severity": "yellow"
             })
 
-    conn.close()
+    # Behavior shift
+    if shift and abs(shift) > 30:
+        direction = "later" if shift > 0 else "earlier"
+        nudges.append({
+            "employee_id": employee_id,
+            "summary": BEHAVIOR_SHIFT,
+            "nudge_message": f"Check-in shifted {int(abs(shift))} mins {direction} over recent days.",
+            "severity": "yellow"
+        })
+    return nudges
+
+def generate_nudges(conn=None, today=None):
+    if conn is None:
+        with get_pool().connection() as conn:
+            return generate_nudges(conn, today)
+    if analytics.workers > 1:
+        employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY first_seen_id")]
+        if analytics.sharded(employees):
+            # Shards on the analytics pool (utils/executor.py), merged in first check-in order
+            return {"nudges": [n for part in analytics.map(shard_nudges, employees, today) for n in part]}
+    dates = {site_id: day.isoformat() for site_id, day in local_dates(conn, today).items()}
+
+    rows = conn.execute(f'''
+        SELECT {STATS_COLUMNS}, es.site_id
+        FROM {STATS_FROM}
+        ORDER BY st.first_seen_id
+    ''').fetchall()
+
+    nudges = []
+    for *row, site_id in rows:
+        nudges.extend(employee_nudges(*row, date_at(dates, site_id)))
+
     return {"nudges": nudges}
 
+def nudges_for_employees(conn, employee_ids, today=None):
+    """
+    Nudges of just these employees (incremental evaluation on write), keyed by
+    employee_id. Each comes as (identity, nudge): the identity stays the same while
+    its rule keeps firing, even as the message follows the moving baseline.
+    """
+    dates = {site_id: day.isoformat() for site_id, day in local_dates(conn, today).items()}
+    employee_ids = list(employee_ids)
+    placeholders = ",".join("?" * len(employee_ids))
+    rows = conn.execute(
+        f"SELECT {STATS_COLUMNS}, es.site_id FROM {STATS_FROM} WHERE st.employee_id IN ({placeholders})",
+        employee_ids
+    ).fetchall()
+
+    result = {}
+    for employee_id, mean, stddev, shift, last_work_date, checkin_minutes, site_id in rows:
+        today = date_at(dates, site_id)
+        identities = {
+            UNUSUAL_CHECKIN: (last_work_date, checkin_minutes),
+            BEHAVIOR_SHIFT: bool(shift and shift > 0),
+        }
+        result[employee_id] = [
+            ((n["summary"], identities[n["summary"]]), n)
+            for n in employee_nudges(employee_id, mean, stddev, shift, last_work_date, checkin_minutes, today)
+        ]
+    return result
+
+def shard_nudges(conn, employees, today=None):
+    """generate_nudges' nudges of these employees, in the order given."""
+    nudges = nudges_for_employees(conn, employees, today)
+    return [nudge for employee_id in employees for _, nudge in nudges.get(employee_id, [])]
+
+def unusual_checkins(conn, today=None):
+    """
+    Today's unusual-check-in nudges keyed by employee_id, in first check-in order.
+    Only employees who worked on a "today" can have one, so this reads just their
+    employee_stats rows; /nudges applies it live over the nightly behavior-shift
+    nudges (utils/precompute.py).
+    """
+    dates = {site_id: day.isoformat() for site_id, day in local_dates(conn, today).items()}
+    rows = conn.execute(f'''
+        SELECT {STATS_COLUMNS}, es.site_id
+        FROM {STATS_FROM}
+        WHERE st.last_work_date >= ?
+        ORDER BY st.first_seen_id
+    ''', (min(dates.values()),)).fetchall()
+
+    result = {}
+    for employee_id, mean, stddev, _, last_work_date, checkin_minutes, site_id in rows:
+        nudges = employee_nudges(employee_id, mean, stddev, None, last_work_date, checkin_minutes, date_at(dates, site_id))
+        if nudges:
+            result[employee_id] = nudges
+    return result
@@ -1,69 +1,137 @@
-from datetime import datetime, timedelta
-import sqlite3
-from fastapi import APIRouter, Query
-from typing import List
+from datetime import timedelta
+from fastapi import APIRouter, Query, HTTPException, Request
+from typing import List, Optional
+from engine.models.sites import employees_by_date
+from engine.utils.cache import cached_response
+from engine.utils.columnar import SNAPSHOT_MIN_DAYS, snapshot
+from engine.utils.executor import analytics
+from engine.utils.precompute import precomputed_or_live
 
 router = APIRouter()
-DB_FILE = "../db/checkins.db"
 
-@router.get("/risk-radar")
-def risk_radar(employees: List[str] = Query(...)):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    today = datetime.now().date()
-    start_date = today - timedelta(days=14)
+LOOKBACK_DAYS = 14
+MAX_LOOKBACK_DAYS = 730
+# Above this many IDs the list goes through a temp table instead of bound IN (...) params
+MAX_INLINE_PARAMS = 500
 
-    risks = []
+def load_window(conn, start_date, end_date, employees=None):
+    """
+    Per-employee totals over [start_date, end_date]. Long windows read the days
+    the Arrow snapshot covers from it (utils/columnar.py, when enabled) and only
+    the remaining days from SQLite.
+    """
+    split = None
+    if (end_date - start_date).days + 1 >= SNAPSHOT_MIN_DAYS:
+        split = snapshot.split_date(conn, start_date)
+    if split is None:
+        return load_window_sqlite(conn, start_date, end_date, employees)
+
+    totals = {}
+    rows = snapshot.daily_totals(start_date, min(split, end_date), employees)
+    if split < end_date:
+        rows += load_window_sqlite(conn, split + timedelta(days=1), end_date, employees)
+    for employee_id, *values in rows:
+        if employee_id in totals:
+            totals[employee_id] = [a + b for a, b in zip(totals[employee_id], values)]
+        else:
+            totals[employee_id] = values
+    return [(employee_id, *values) for employee_id, values in totals.items()]
+
+def load_window_sqlite(conn, start_date, end_date, employees=None):
+    """
+    Per-employee totals over [start_date, end_date] from the precomputed
+    employee_daily aggregates (models/baselines.py), grouped in one query.
+    """
+    base_sql = '''
+        SELECT d.employee_id,
+               SUM(d.sessions), SUM(d.completed), SUM(d.hours), SUM(d.delta_sum), SUM(d.delta_sumsq)
+        FROM employee_daily d
+        {join}
+        WHERE d.work_date BETWEEN ? AND ?
+        {where}
+        GROUP BY d.employee_id
+    '''
+    params = [start_date.isoformat(), end_date.isoformat()]
+
+    if employees is None:
+        sql = base_sql.format(join="", where="")
+    elif len(employees) <= MAX_INLINE_PARAMS:
+        placeholders = ",".join("?" * len(employees))
+        sql = base_sql.format(join="", where=f"AND d.employee_id IN ({placeholders})")
+        params += list(employees)
+    else:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS risk_employees (employee_id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM risk_employees")
+        conn.executemany("INSERT INTO risk_employees VALUES (?) ON CONFLICT DO NOTHING", ((e,) for e in employees))
+        sql = base_sql.format(join="JOIN risk_employees r ON r.employee_id = d.employee_id", where="")
+
+    return conn.execute(sql, params).fetchall()
+
+def compute_risk_stats(rows):
+    """Avg hours, check-in variance (from sum/sum of squares) and missing checkouts per employee."""
+    stats = {}
+    for employee_id, sessions, completed, hours, delta_sum, delta_sumsq in rows:
+        if not sessions:
+            continue
+        if completed:
+            mean = delta_sum / completed
+            stddev_shift = max(delta_sumsq / completed - mean ** 2, 0.0) ** 0.5
+        else:
+            stddev_shift = 0
+        stats[employee_id] = {
+            "avg_hours": hours / sessions,
+            "stddev_shift": stddev_shift,
+            "missing_checkout": sessions - completed,
+        }
+    return stats
+
+def assess_risks(conn, employees=None, today=None, lookback_days=LOOKBACK_DAYS):
+    if analytics.workers > 1:
+        everyone = employees if employees is not None else [
+            row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY first_seen_id")
+        ]
+        if analytics.sharded(everyone):
+            # Shards on the analytics pool (utils/executor.py), merged in employee order
+            parts = analytics.map(assess_risks, everyone, today, lookback_days)
+            return {"risks": [risk for part in parts for risk in part["risks"]]}
+
+    # The window ends on each employee's local today (models/sites.py); one load per distinct date
+    groups = employees_by_date(conn, employees, today)
+    if employees is None:
+        # Everyone who has ever checked in, so long absences still surface as gaps
+        employees = [row[0] for row in conn.execute(
+            "SELECT employee_id FROM employee_stats ORDER BY first_seen_id"
+        )]
 
+    records = []
+    for day, group in groups.items():
+        records += load_window(conn, day - timedelta(days=lookback_days), day, group)
+
+    stats = compute_risk_stats(records)
+
+    risks = []
     for emp_id in employees:
-        cursor.execute('''
-            SELECT checkin_time, checkout_time FROM checkins
-            WHERE employee_id = ? AND DATE(checkin_time) BETWEEN ? AND ?
-            ORDER BY checkin_time ASC
-        ''', (emp_id, start_date.isoformat(), today.isoformat()))
-
-        records = cursor.fetchall()
-        if not records:
+        emp = stats.get(emp_id)
+        if emp is None:
             risks.append({
                 "employee_id": emp_id,
                 "risk_type": "Attendance Gap",
-                "signal": "No check-ins in last 14 days",
+                "signal": f"No check-ins in last {lookback_days} days",
                 "recommendation": "Reach out personally",
                 "severity": "high"
             })
             continue
 
-        total_hours = 0
-        work_days = 0
-        shift_deltas = []
-        missing_checkout = 0
-
-        for checkin_str, checkout_str in records:
-            checkin = datetime.fromisoformat(checkin_str)
-            work_days += 1
-
-            # Burnout and reliability
-            if checkout_str:
-                checkout = datetime.fromisoformat(checkout_str)
-                hours = (checkout - checkin).total_seconds() / 3600.0
-                total_hours += hours
-            else:
-                missing_checkout += 1
-                continue
-
-            # Unpredictability: deviation from 9:00 am
-            shift_delta = abs((checkin.hour * 60 + checkin.minute) - (9 * 60))
-            shift_deltas.append(shift_delta)
-
-        avg_hours = total_hours / work_days if work_days else 0
-        stddev_shift = (sum((x - sum(shift_deltas)/len(shift_deltas)) ** 2 for x in shift_deltas) / len(shift_deltas)) ** 0.5 if shift_deltas else 0
+        avg_hours = emp["avg_hours"]
+        stddev_shift = emp["stddev_shift"]
+        missing_checkout = int(emp["missing_checkout"])
 
         # Burnout Risk
         if avg_hours > 9:
             risks.append({
                 "employee_id": emp_id,
                 "risk_type": "Burnout",
-                "signal": f"Avg {avg_hours:.1f} hrs/day over last 14 days",
+                "signal": f"Avg {avg_hours:.1f} hrs/day over last {lookback_days} days",
                 "recommendation": "Suggest cooldown periods or support",
                 "severity": "high"
             })
@@ -88,6 +156,26 @@ def risk_radar(employees: List[str] = Query(...)):
                 "severity": "low"
             })
 
-    conn.close()
     return {"risks": risks}
 
+@router.get("/risk-radar")
+async def risk_radar(
+    request: Request,
+    employees: Optional[List[str]] = Query(None),
+    all_employees: bool = False,
+    lookback_days: int = Query(LOOKBACK_DAYS, ge=1, le=MAX_LOOKBACK_DAYS),
+    fresh: bool = False
+):
+    if not employees and not all_employees:
+        raise HTTPException(status_code=400, detail="Pass one or more employees or set all_employees=true.")
+
+    employees = None if all_employees else employees
+    if fresh:
+        fn, args = assess_risks, (employees, None, lookback_days)
+    else:
+        # Tonight's results (utils/precompute.py) when they cover the request
+        fn, args = precomputed_or_live, ("risks", {"lookback_days": lookback_days}, employees, assess_risks, employees, None, lookback_days)
+    return await cached_response(
+        request, "risk-radar", (tuple(employees) if employees else "all", lookback_days, fresh), fn, *args,
+        employee_ids=employees
+    )
@@ -0,0 +1,192 @@
+from datetime import datetime
+import asyncio
+import time
+from fastapi import APIRouter
+from typing import Optional
+from engine.models import baselines
+from engine.utils.cache import versions
+from engine.utils.db import database, upsert_sql, write_transaction
+
+router = APIRouter()
+
+############ Open sessions ###################
+# open_sessions has one row per employee who is checked in right now, pointing
+# at their open check-in. The form check-in path adds the row and the checkout
+# path takes it, in the same transaction as the checkins write, so checkout
+# is a primary-key lookup whatever the size of the history.
+# A new check-in replaces an employee's open session; the old check-in stays
+# in history without a checkout. Sessions open longer than
+# AUTO_CLOSE_AFTER_HOURS are closed by a background job: the check-in gets a
+# zero-length checkout (no hours, but no longer a missing checkout) and
+# auto_closed_at. A real checkout within MAX_SESSION_HOURS of the check-in
+# still replaces it (take_auto_closed_session).
+
+AUTO_CLOSE_AFTER_HOURS = 16
+MAX_SESSION_HOURS = 24
+AUTO_CLOSE_INTERVAL_SECONDS = 600
+
+def open_session(conn, employee_id, checkin_id, checkin_ts):
+    conn.execute(
+        upsert_sql("open_sessions", ("employee_id", "checkin_id", "checkin_ts"), ("employee_id",)),
+        (employee_id, checkin_id, checkin_ts)
+    )
+
+def take_open_session(conn, employee_id):
+    """
+    Remove the employee's open session and return its check-in's (id, checkin_ts,
+    work_date, checkin_minute, expected_start_minute), or None.
+    """
+    row = conn.execute('''
+        SELECT o.checkin_id, c.checkin_ts, c.work_date, c.checkin_minute, c.expected_start_minute FROM open_sessions o
+        JOIN checkins c ON c.id = o.checkin_id
+        WHERE o.employee_id = ?
+    ''', (employee_id,)).fetchone()
+    if row:
+        conn.execute("DELETE FROM open_sessions WHERE employee_id = ?", (employee_id,))
+    return row
+
+def fill_open_sessions(conn):
+    """Refill open_sessions from checkins: each employee's latest check-in, if it has no checkout. Call inside write_transaction."""
+    conn.execute("DELETE FROM open_sessions")
+    conn.execute('''
+        INSERT INTO open_sessions (employee_id, checkin_id, checkin_ts)
+        SELECT c.employee_id, c.id, c.checkin_ts FROM checkins c
+        WHERE c.checkout_time IS NULL AND c.checkin_ts IS NOT NULL
+          AND c.checkin_ts = (SELECT MAX(checkin_ts) FROM checkins WHERE employee_id = c.employee_id)
+        ON CONFLICT (employee_id) DO UPDATE SET checkin_id = excluded.checkin_id, checkin_ts = excluded.checkin_ts
+    ''')
+
+def rebuild_open_sessions(conn):
+    with write_transaction(conn):
+        fill_open_sessions(conn)
+
+def close_stale_sessions(conn, max_age_hours=AUTO_CLOSE_AFTER_HOURS, now=None):
+    """
+    Close sessions open longer than max_age_hours with a zero-length checkout, so
+    a checkout days later can't turn a forgotten check-in into a multi-day shift
+    and the check-in stops counting as a missing checkout.
+    """
+    now = int(time.time() if now is None else now)
+    cutoff = now - max_age_hours * 3600
+    with write_transaction(conn):
+        rows = conn.execute('''
+            SELECT o.employee_id, o.checkin_id, c.work_date, c.checkin_minute, c.expected_start_minute FROM open_sessions o
+            JOIN checkins c ON c.id = o.checkin_id
+            WHERE o.checkin_ts < ?
+        ''', (cutoff,)).fetchall()
+        conn.executemany(
+            "UPDATE checkins SET checkout_time = checkin_time, checkout_ts = checkin_ts, auto_closed_at = ? WHERE id = ?",
+            ((now, checkin_id) for _, checkin_id, _, _, _ in rows)
+        )
+        conn.execute("DELETE FROM open_sessions WHERE checkin_ts < ?", (cutoff,))
+        baselines.record_events(conn, checkouts=[
+            (employee_id, day, minutes, 0, expected_start) for employee_id, _, day, minutes, expected_start in rows
+        ])
+    if rows:
+        # The dashboard summary counts open sessions, the risk radar missing checkouts
+        versions.bump((row[0] for row in rows), conn)
+    return len(rows)
+
+def take_auto_closed_session(conn, employee_id, checkout_ts, max_hours=MAX_SESSION_HOURS):
+    """
+    The employee's latest check-in, when the auto-close job closed it and
+    checkout_ts is within max_hours of it: (id, checkin_ts, work_date), for the
+    caller to write the real checkout over the zero-length one. Else None.
+    """
+    row = conn.execute('''
+        SELECT id, checkin_ts, work_date FROM checkins
+        WHERE employee_id = ? AND auto_closed_at IS NOT NULL
+        ORDER BY checkin_ts DESC
+        LIMIT 1
+    ''', (employee_id,)).fetchone()
+    if row is None or not row[1] <= checkout_ts <= row[1] + max_hours * 3600:
+        return None
+    newer = conn.execute(
+        "SELECT 1 FROM checkins WHERE employee_id = ? AND checkin_ts > ? LIMIT 1", (employee_id, row[1])
+    ).fetchone()
+    return None if newer else row
+
+def list_open_sessions(conn, team_id=None, now=None):
+    now = int(time.time() if now is None else now)
+    sql = '''
+        SELECT o.employee_id, o.checkin_id, c.checkin_time, o.checkin_ts, c.context
+        FROM open_sessions o
+        JOIN checkins c ON c.id = o.checkin_id
+        {join}
+        ORDER BY o.checkin_ts
+    '''
+    if team_id is None:
+        rows = conn.execute(sql.format(join="")).fetchall()
+    else:
+        rows = conn.execute(
+            sql.format(join="JOIN employee_teams t ON t.employee_id = o.employee_id AND t.team_id = ?"),
+            (team_id,)
+        ).fetchall()
+    return {
+        "open": len(rows),
+        "sessions": [
+            {
+                "employee_id": employee_id,
+                "checkin_id": checkin_id,
+                "checkin_time": checkin_time,
+                "open_minutes": max(now - checkin_ts, 0) // 60,
+                "location": context,
+            }
+            for employee_id, checkin_id, checkin_time, checkin_ts, context in rows
+        ],
+    }
+
+class SessionAutoCloser:
+    """Background task that runs close_stale_sessions every interval."""
+
+    def __init__(self, interval=AUTO_CLOSE_INTERVAL_SECONDS, max_age_hours=AUTO_CLOSE_AFTER_HOURS):
+        self.interval = interval
+        self.max_age_hours = max_age_hours
+        self._task = None
+        self.closed_total = 0
+        self.last_run = None
+
+    async def run_once(self):
+        closed = await database.run(close_stale_sessions, self.max_age_hours)
+        self.closed_total += closed
+        self.last_run = datetime.now().isoformat(timespec="seconds")
+        return closed
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Auto-closing stale sessions failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self):
+        return {
+            "running": self._task is not None,
+            "interval_seconds": self.interval,
+            "max_age_hours": self.max_age_hours,
+            "closed_total": self.closed_total,
+            "last_run": self.last_run,
+        }
+
+session_auto_closer = SessionAutoCloser()
+
+@router.get("/sessions/open")
+async def get_open_sessions(team_id: Optional[str] = None):
+    return await database.run(list_open_sessions, team_id)
+
+@router.get("/sessions/stats")
+def session_stats():
+    return session_auto_closer.metrics()
@@ -0,0 +1,159 @@
+from datetime import datetime, time
+from zoneinfo import ZoneInfoNotFoundError
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import List, Optional
+from engine.utils.cache import versions
+from engine.utils.db import database, upsert_sql, write_transaction
+from engine.utils.timestamps import DEFAULT_TIMEZONE, local_today, zone
+
+router = APIRouter()
+
+############ Sites: timezone and expected start per location ###################
+# sites holds each site's IANA timezone and expected start time, and
+# employee_sites maps each employee to one site. Check-ins are converted once,
+# when written: checkin_ts is the UTC epoch, and work_date/checkin_minute are
+# the site's local date and minute of day (utils/timestamps.py), so every
+# day-bucketed table and query keeps comparing plain indexed columns. Each
+# check-in also stores the expected start it was written under, so changing a
+# site's start time applies from then on and rebuilds reproduce the store.
+# Employees without a site are on DEFAULT_TIMEZONE (or the legacy naive clock)
+# and the 9:00 default start. "Today" is each site's local date.
+
+SITE_LOOKUP_CHUNK_SIZE = 500
+
+# (timezone, expected start minute) of employees without a site; None start = baselines.EXPECTED_START_MINUTES
+DEFAULT_CLOCK = (zone(DEFAULT_TIMEZONE), None)
+
+class Site(BaseModel):
+    site_id: str
+    name: str
+    timezone: str                  # IANA name, e.g. "Asia/Kolkata"
+    expected_start: time = time(9, 0)
+
+class SiteAssignment(BaseModel):
+    employee_id: str
+    site_id: Optional[str] = None   # None moves the employee back to the default clock
+
+def employee_clocks(conn, employee_ids):
+    """employee_id -> (ZoneInfo or None, expected start minute or None) for writing their check-ins."""
+    employee_ids = sorted(set(employee_ids))
+    clocks = dict.fromkeys(employee_ids, DEFAULT_CLOCK)
+    for i in range(0, len(employee_ids), SITE_LOOKUP_CHUNK_SIZE):
+        chunk = employee_ids[i:i + SITE_LOOKUP_CHUNK_SIZE]
+        for employee_id, timezone, expected_start in conn.execute(f'''
+            SELECT es.employee_id, s.timezone, s.expected_start_minute FROM employee_sites es
+            JOIN sites s ON s.site_id = es.site_id
+            WHERE es.employee_id IN ({','.join('?' * len(chunk))})
+        ''', chunk):
+            clocks[employee_id] = (zone(timezone), expected_start)
+    return clocks
+
+def local_dates(conn, today=None):
+    """site_id -> today's date there; None -> today for employees without a site. A given today applies everywhere."""
+    if today is not None:
+        return {None: today}
+    dates = {None: local_today(DEFAULT_CLOCK[0])}
+    for site_id, timezone in conn.execute("SELECT site_id, timezone FROM sites"):
+        dates[site_id] = local_today(zone(timezone))
+    return dates
+
+def date_at(dates, site_id):
+    return dates.get(site_id, dates[None])
+
+def employees_by_date(conn, employees=None, today=None):
+    """
+    Today's local date -> the employees it is today for, in the given order
+    (employees=None: every employee, ordered by first check-in). When all sites
+    share one date it maps to `employees` unchanged, without reading assignments.
+    """
+    dates = local_dates(conn, today)
+    if len(set(dates.values())) == 1:
+        return {dates[None]: employees}
+
+    if employees is None:
+        rows = conn.execute('''
+            SELECT st.employee_id, es.site_id FROM employee_stats st
+            LEFT JOIN employee_sites es ON es.employee_id = st.employee_id
+            ORDER BY st.first_seen_id
+        ''').fetchall()
+    else:
+        sites = {}
+        unique = sorted(set(employees))
+        for i in range(0, len(unique), SITE_LOOKUP_CHUNK_SIZE):
+            chunk = unique[i:i + SITE_LOOKUP_CHUNK_SIZE]
+            sites.update(conn.execute(
+                f"SELECT employee_id, site_id FROM employee_sites WHERE employee_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ))
+        rows = [(e, sites.get(e)) for e in employees]
+
+    groups = {}
+    for employee_id, site_id in rows:
+        groups.setdefault(date_at(dates, site_id), []).append(employee_id)
+    return groups
+
+def upsert_sites(conn, sites):
+    invalid = []
+    for site in sites:
+        try:
+            zone(site.timezone)
+        except (ValueError, ZoneInfoNotFoundError):
+            invalid.append(site.timezone)
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown timezone(s): {', '.join(sorted(set(invalid)))}")
+
+    with write_transaction(conn):
+        conn.executemany(
+            upsert_sql("sites", ("site_id", "name", "timezone", "expected_start_minute"), ("site_id",)),
+            [(s.site_id, s.name, s.timezone, s.expected_start.hour * 60 + s.expected_start.minute) for s in sites]
+        )
+    versions.bump(conn=conn)
+
+def assign_sites(conn, assignments):
+    """Move employees between sites. Check-ins already written keep their local date, minute and expected start."""
+    known = {row[0] for row in conn.execute("SELECT site_id FROM sites")}
+    unknown = sorted({a.site_id for a in assignments if a.site_id is not None and a.site_id not in known})
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown site(s): {', '.join(unknown)}")
+
+    with write_transaction(conn, lock_keys=[a.employee_id for a in assignments]):
+        conn.executemany(
+            "DELETE FROM employee_sites WHERE employee_id = ?",
+            [(a.employee_id,) for a in assignments if a.site_id is None]
+        )
+        conn.executemany(
+            upsert_sql("employee_sites", ("employee_id", "site_id"), ("employee_id",)),
+            [(a.employee_id, a.site_id) for a in assignments if a.site_id is not None]
+        )
+    versions.bump((a.employee_id for a in assignments), conn)
+
+def list_sites(conn):
+    headcount = dict(conn.execute("SELECT site_id, COUNT(*) FROM employee_sites GROUP BY site_id").fetchall())
+    sites = []
+    for site_id, name, timezone, expected_start in conn.execute(
+        "SELECT site_id, name, timezone, expected_start_minute FROM sites ORDER BY site_id"
+    ):
+        sites.append({
+            "site_id": site_id,
+            "name": name,
+            "timezone": timezone,
+            "expected_start": f"{expected_start // 60:02d}:{expected_start % 60:02d}",
+            "headcount": headcount.get(site_id, 0),
+            "local_time": datetime.now(zone(timezone)).isoformat(timespec="seconds"),
+        })
+    return {"default_timezone": DEFAULT_TIMEZONE, "sites": sites}
+
+@router.get("/org/sites")
+async def get_sites():
+    return await database.run(list_sites)
+
+@router.put("/org/sites")
+async def put_sites(sites: List[Site]):
+    await database.run(upsert_sites, sites)
+    return {"updated": len(sites)}
+
+@router.put("/org/site-assignments")
+async def put_site_assignments(assignments: List[SiteAssignment]):
+    await database.run(assign_sites, assignments)
+    return {"updated": len(assignments)}
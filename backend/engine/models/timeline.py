@@ -0,0 +1,182 @@
+from datetime import date, timedelta
+import heapq
+from itertools import islice
+import json
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
+from engine.models.sites import employee_clocks
+from engine.utils.db import database, dialect
+from engine.utils.retention import archived_checkins
+from engine.utils.timestamps import MAX_UTC_OFFSET_SECONDS, day_start_epoch, local_minute
+
+router = APIRouter()
+
+MAX_PAGE_SIZE = 5000
+STREAM_FETCH_SIZE = 500
+
+def clock(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def raw_entry(checkin_ts, row_id, checkout_ts, day, minutes, context, tz=None):
+    """
+    One check-in from its stored integers (epoch seconds, minute of day); no
+    timestamp parsing. tz is the employee's site clock (models/sites.py), which
+    the checkout is read on: its UTC offset may differ from the check-in's (DST).
+    """
+    entry = {
+        "date": day,
+        "checkin": clock(minutes),
+        # Open check-ins (no checkout yet) are returned with empty checkout/duration
+        "checkout": None,
+        "duration_hours": None,
+        "context": context.split(",") if context else [],
+        # Closed by the stale-session job with a zero-length checkout (models/sessions.py)
+        "auto_closed": checkout_ts is not None and checkout_ts == checkin_ts
+    }
+    if checkout_ts is not None:
+        entry["checkout"] = clock(local_minute(checkout_ts, tz))
+        entry["duration_hours"] = round((checkout_ts - checkin_ts) / 3600, 2)
+    return entry
+
+def parse_cursor(cursor):
+    try:
+        ts, row_id = cursor.split(":")
+        return int(ts), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+def raw_query(employee_id, start, end, cursor, limit):
+    """Keyset-paginated SQL on (employee_id, checkin_ts, id): no OFFSET, each page is an index seek."""
+    sql = '''
+        SELECT checkin_ts, id, checkout_ts, work_date, checkin_minute, context FROM checkins
+        WHERE employee_id = ?
+    '''
+    params = [employee_id]
+    # Days are the employee's local work_date (models/sites.py); the widened checkin_ts
+    # bounds keep the index range seek, work_date trims to the exact local days
+    if start:
+        sql += " AND checkin_ts >= ? AND work_date >= ?"
+        params += [day_start_epoch(start) - MAX_UTC_OFFSET_SECONDS, start.isoformat()]
+    if end:
+        sql += " AND checkin_ts < ? AND work_date <= ?"
+        params += [day_start_epoch(end + timedelta(days=1)) + MAX_UTC_OFFSET_SECONDS, end.isoformat()]
+    if cursor:
+        sql += " AND (checkin_ts, id) > (?, ?)"
+        params += parse_cursor(cursor)
+    sql += " ORDER BY checkin_ts ASC, id ASC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def raw_rows(conn, sql, params, employee_id, start, end, after, limit):
+    """
+    Runs raw_query's SQL on the live table. Months moved to the Parquet archive
+    (utils/retention.py) are merged back in only when the range reaches them.
+    """
+    rows = conn.execute(sql, params)
+    archived = archived_checkins(conn, employee_id, start, end)
+    if not archived:
+        return rows
+    if after:
+        archived = [row for row in archived if (row[0], row[1]) > after]
+    return islice(heapq.merge(archived, rows), limit)
+
+def raw_page(conn, employee_id, start, end, after, limit):
+    """Up to limit raw rows after the (checkin_ts, id) key after, live and archived."""
+    sql, params = raw_query(employee_id, start, end, after and f"{after[0]}:{after[1]}", limit)
+    return list(raw_rows(conn, sql, params, employee_id, start, end, after, limit))
+
+def aggregate_query(employee_id, start, end, granularity, after=None, limit=None):
+    """Daily or weekly totals from the precomputed employee_daily table (models/baselines.py), after bucket after."""
+    bucket = "work_date" if granularity == "daily" else dialect().week_start("work_date")
+    sql = f'''
+        SELECT {bucket} AS bucket, SUM(sessions), SUM(completed), SUM(hours)
+        FROM employee_daily
+        WHERE employee_id = ?
+    '''
+    params = [employee_id]
+    if start:
+        sql += " AND work_date >= ?"
+        params.append(start.isoformat())
+    if end:
+        sql += " AND work_date <= ?"
+        params.append(end.isoformat())
+    if after:
+        sql += f" AND {bucket} > ?"
+        params.append(after)
+    sql += " GROUP BY bucket ORDER BY bucket"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return sql, params
+
+def aggregate_entry(bucket, sessions, completed, hours):
+    return {
+        "date": bucket,
+        "sessions": sessions,
+        "completed": completed,
+        "duration_hours": round(hours, 2)
+    }
+
+async def stream_ndjson(fetch_page, to_entry, rows, limit=None):
+    """
+    Streams one JSON line per row, starting from the first page rows. Later pages
+    are fetched with fetch_page(conn, last row, size) through the database
+    executor, so no connection is held while the client reads and a busy pool
+    answers DatabaseBusy like any other request.
+    """
+    sent = 0
+    while rows:
+        yield "".join(json.dumps(to_entry(*row)) + "\n" for row in rows)
+        sent += len(rows)
+        size = page_size(limit, sent)
+        if len(rows) < STREAM_FETCH_SIZE or not size:
+            return
+        rows = await database.run(fetch_page, rows[-1], size)
+
+def page_size(limit, sent=0):
+    return STREAM_FETCH_SIZE if limit is None else min(STREAM_FETCH_SIZE, limit - sent)
+
+# Endpoint to get behavior timeline for an employee
+@router.get("/timeline/{employee_id}")
+async def get_behavior_timeline(
+    employee_id: str,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    granularity: Literal["raw", "daily", "weekly"] = "raw",
+    format: Literal["json", "ndjson"] = "json"
+):
+    if granularity == "raw":
+        after = parse_cursor(cursor) if cursor else None
+        fetch_page = lambda conn, last, size: raw_page(
+            conn, employee_id, start, end, (last[0], last[1]) if last else after, size
+        )
+        ((tz, _),) = (await database.run(employee_clocks, [employee_id])).values()
+        to_entry = lambda *row: raw_entry(*row, tz=tz)
+    else:
+        def fetch_page(conn, last, size):
+            sql, params = aggregate_query(employee_id, start, end, granularity, last and last[0], size)
+            return conn.execute(sql, params).fetchall()
+        to_entry = aggregate_entry
+
+    if format == "ndjson":
+        # The first page is read before the response starts, so DatabaseBusy is still a 503
+        rows = await database.run(fetch_page, None, page_size(limit))
+        return StreamingResponse(stream_ndjson(fetch_page, to_entry, rows, limit), media_type="application/x-ndjson")
+
+    rows = await database.run(fetch_page, None, limit)
+    if not rows and not (start or end or cursor):
+        raise HTTPException(status_code=404, detail="No check-in records found for this employee.")
+
+    response = {
+        "employee_id": employee_id,
+        "granularity": granularity,
+        "timeline": [to_entry(*row) for row in rows]
+    }
+    if granularity == "raw" and limit:
+        response["next_cursor"] = f"{rows[-1][0]}:{rows[-1][1]}" if len(rows) == limit else None
+    return response
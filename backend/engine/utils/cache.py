@@ -0,0 +1,228 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import os
+import socket
+import threading
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from engine.utils.db import database, dialect, upsert_sql, write_transaction
+from engine.utils.timestamps import today_key
+
+#####Result cache for the analytic endpoints (/nudges, /forecast, /risk-radar)
+# Entries are keyed by endpoint + parameters + data version. Write paths bump the
+# version of the employees they touched after committing, so a cached result is
+# never served once its inputs change, and nothing has to be deleted eagerly.
+
+MAX_ENTRIES = 256
+
+# Writes are also recorded in data_versions and every API process polls it this
+# often, so a write in one process (another worker on the same SQLite file, or
+# another PostgreSQL node) invalidates the caches of the others. 0 turns the
+# sync off; only safe when a single process serves the API.
+CACHE_SYNC_SECONDS = float(os.environ.get("CACHE_SYNC_SECONDS", 1))
+# Versions re-read on every poll: PostgreSQL sequence values can commit out of order
+SYNC_OVERLAP = 1000
+NODE_ID = f"{socket.gethostname()}:{os.getpid()}"
+GLOBAL_SCOPE = "*"
+
+class DataVersions:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.global_version = 0
+        self.employee_versions = {}
+        # Version of employees not bumped individually since the last bump-everything
+        self._floor = 0
+
+    def bump(self, employee_ids=None, conn=None):
+        """
+        Call after a write commits. None means "everything changed" (rebuilds, bulk repairs).
+        Pass the writer's conn so the other API processes hear of it too (VersionSync).
+        """
+        if employee_ids is not None:
+            employee_ids = set(employee_ids)
+        if conn is not None and CACHE_SYNC_SECONDS:
+            publish_versions(conn, employee_ids)
+        self._bump_local(employee_ids)
+
+    def _bump_local(self, employee_ids=None):
+        with self._lock:
+            self.global_version += 1
+            if employee_ids is None:
+                self.employee_versions.clear()
+                self._floor = self.global_version
+                return
+            for employee_id in employee_ids:
+                self.employee_versions[employee_id] = self.global_version
+
+    def version_for(self, employee_ids=None):
+        """Whole-org results depend on every write; per-employee results only on their own rows."""
+        with self._lock:
+            if employee_ids is None:
+                return self.global_version
+            return tuple(self.employee_versions.get(e, self._floor) for e in employee_ids)
+
+class ResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+versions = DataVersions()
+result_cache = ResultCache()
+
+def publish_versions(conn, employee_ids=None):
+    """Record a committed write in data_versions, one row per employee (or the global scope)."""
+    scopes = [GLOBAL_SCOPE] if employee_ids is None else sorted(employee_ids)
+    with write_transaction(conn, lock_keys=()):
+        version = dialect(conn).next_data_version(conn)
+        conn.executemany(
+            upsert_sql("data_versions", ("scope", "version", "origin"), ("scope",)),
+            ((scope, version, NODE_ID) for scope in scopes)
+        )
+
+class VersionSync:
+    """Background task applying other processes' data_versions rows to the local cache versions."""
+
+    def __init__(self, interval=CACHE_SYNC_SECONDS):
+        self.interval = interval
+        self.last_seen = None
+        self._applied = {}   # scope -> version, for rows inside the overlap window
+        # Called as fn(conn, employee_ids) on the DB thread with the employees others wrote
+        self.listeners = []
+        self._task = None
+        self.polls = 0
+        self.remote_changes = 0
+
+    def poll(self, conn):
+        if self.last_seen is None:
+            # Start from now: the local caches are empty anyway
+            self.last_seen = conn.execute("SELECT COALESCE(MAX(version), 0) FROM data_versions").fetchone()[0]
+            return
+        floor = self.last_seen - SYNC_OVERLAP
+        rows = conn.execute(
+            "SELECT scope, version FROM data_versions WHERE version > ? AND origin <> ?", (floor, NODE_ID)
+        ).fetchall()
+        self.polls += 1
+        changed = set()
+        for scope, version in rows:
+            if self._applied.get(scope) != version:
+                self._applied[scope] = version
+                changed.add(scope)
+            self.last_seen = max(self.last_seen, version)
+        floor = self.last_seen - SYNC_OVERLAP
+        self._applied = {scope: version for scope, version in self._applied.items() if version > floor}
+        if not changed:
+            return
+        self.remote_changes += len(changed)
+        if GLOBAL_SCOPE in changed:
+            versions._bump_local()
+            return
+        versions._bump_local(changed)
+        for listener in self.listeners:
+            listener(conn, changed)
+
+    async def _run(self):
+        while True:
+            try:
+                await database.run(self.poll)
+            except Exception as e:
+                print(f"Cache version sync failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.interval:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self):
+        return {
+            "running": self._task is not None,
+            "node_id": NODE_ID,
+            "interval_seconds": self.interval,
+            "last_seen_version": self.last_seen,
+            "polls": self.polls,
+            "remote_changes": self.remote_changes,
+        }
+
+version_sync = VersionSync()
+
+def etag_for(content):
+    # From the rendered body: the version counters start over in every process,
+    # so a tag built from them could match a stale copy after a restart
+    return '"' + hashlib.sha1(content).hexdigest() + '"'
+
+def if_none_match(request: Request):
+    """The entity tags listed in If-None-Match (weak ones by their opaque tag)."""
+    tags = (tag.strip() for tag in request.headers.get("if-none-match", "").split(","))
+    return {tag.removeprefix("W/") for tag in tags if tag}
+
+async def cached_response(request: Request, endpoint, params, fn, *args, employee_ids=None):
+    """
+    Serve fn(conn, *args) through the cache; on a miss it runs and is rendered on a
+    DB thread (utils/db.py). employee_ids scopes the version to those employees;
+    None ties the entry to the global version. Today's date, here and at every
+    site (utils/timestamps.py), is part of the key since every endpoint looks at
+    a window ending today. The ETag is a hash of the body, so a 304 always means
+    the client holds exactly what would be sent.
+    """
+    key = (endpoint, params, today_key(), versions.version_for(employee_ids))
+
+    # Entries hold the rendered JSON and its ETag so hits skip serialization too
+    entry = result_cache.get(key)
+    if entry is None:
+        content = await database.run(lambda conn: JSONResponse(fn(conn, *args)).body)
+        entry = (content, etag_for(content))
+        result_cache.put(key, entry)
+    content, etag = entry
+
+    tags = if_none_match(request)
+    if etag in tags or "*" in tags:
+        result_cache.not_modified += 1
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=content, media_type="application/json", headers={"ETag": etag})
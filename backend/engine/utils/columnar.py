@@ -0,0 +1,264 @@
+from datetime import date, timedelta
+import json
+import os
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from engine.models.baselines import EXPECTED_START_MINUTES
+from engine.models.sessions import MAX_SESSION_HOURS, close_stale_sessions
+from engine.utils.db import DATABASE, DB_FILE
+
+#####Columnar history: Parquet export and a memory-mapped Arrow snapshot
+# export_parquet() appends check-ins to EXPORT_DIR/checkins/month=YYYY-MM/ with
+# typed columns, starting after the id recorded in the watermark file. It only
+# goes as far as rows that can no longer change: an open session may still get
+# its checkout. (Locations resolved after a row was exported are not re-exported.)
+# build_snapshot() folds the export into per-employee daily totals (the same
+# numbers as employee_daily, see models/baselines.py) in one Arrow IPC file.
+# With ANALYTICS_SOURCE=arrow, risk and forecast read days the snapshot covers
+# from the memory map and only the rest from SQLite once a look-back is at
+# least SNAPSHOT_MIN_DAYS long.
+
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(os.path.dirname(DB_FILE), "export"))
+SNAPSHOT_MIN_DAYS = int(os.environ.get("SNAPSHOT_MIN_DAYS", 60))
+EXPORT_CHUNK_SIZE = 100000
+WATERMARK_FILE = "_watermark.json"
+SNAPSHOT_FILE = "employee_daily.arrow"
+
+CHECKINS_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("employee_id", pa.string()),
+    ("checkin_time", pa.timestamp("s", tz="UTC")),
+    ("checkout_time", pa.timestamp("s", tz="UTC")),
+    ("duration", pa.duration("s")),
+    ("work_date", pa.date32()),
+    # Minute of day as recorded (the wall clock the baselines use) and the expected start it is scored
+    # against (null: baselines.EXPECTED_START_MINUTES; files exported before sites lack the column)
+    ("checkin_minute", pa.int16()),
+    ("expected_start_minute", pa.int16()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("context", pa.string()),
+])
+
+EXPORT_SQL = '''
+    SELECT id, employee_id, checkin_ts, checkout_ts, checkout_ts - checkin_ts, work_date, checkin_minute,
+           expected_start_minute, latitude, longitude, context
+    FROM checkins
+    WHERE id > ? AND id <= ? AND checkin_ts IS NOT NULL
+    ORDER BY id
+    LIMIT ?
+'''
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def read_watermark(export_dir=EXPORT_DIR):
+    path = os.path.join(export_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {"last_id": 0, "rows": 0}
+    with open(path) as f:
+        return json.load(f)
+
+def settled_upper_id(conn):
+    """Highest id such that no check-in up to it can still get a checkout (see models/sessions.py)."""
+    upper = conn.execute("SELECT COALESCE(MAX(id), 0) FROM checkins").fetchone()[0]
+    (first_open,) = conn.execute("SELECT MIN(checkin_id) FROM open_sessions").fetchone()
+    # An auto-closed check-in still takes a late checkout for MAX_SESSION_HOURS
+    (first_auto_closed,) = conn.execute(
+        "SELECT MIN(id) FROM checkins WHERE auto_closed_at IS NOT NULL AND checkin_ts > ?",
+        (int(time.time()) - MAX_SESSION_HOURS * 3600,)
+    ).fetchone()
+    for first in (first_open, first_auto_closed):
+        if first is not None:
+            upper = min(upper, first - 1)
+    return upper
+
+def _to_table(rows):
+    columns = list(zip(*rows))
+    return pa.table([pa.array(values, type=field.type) if field.type != pa.date32()
+                     else pa.array(values, type=pa.string()).cast(pa.date32())
+                     for values, field in zip(columns, CHECKINS_SCHEMA)], schema=CHECKINS_SCHEMA)
+
+def export_parquet(conn, export_dir=EXPORT_DIR, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Append check-ins after the watermark as Parquet, one file per month touched
+    per chunk. File names carry the first id they hold, so a rerun after a crash
+    overwrites the partial files instead of duplicating rows.
+    """
+    # Same policy as the background job; a forgotten check-in would otherwise hold the watermark back
+    close_stale_sessions(conn)
+    os.makedirs(export_dir, exist_ok=True)
+    watermark = read_watermark(export_dir)
+    last_id, upper = watermark["last_id"], settled_upper_id(conn)
+
+    exported = 0
+    while last_id < upper:
+        rows = conn.execute(EXPORT_SQL, (last_id, upper, chunk_size)).fetchall()
+        if not rows:
+            last_id = upper
+            break
+        by_month = {}
+        for row in rows:
+            by_month.setdefault(row[5][:7], []).append(row)
+        for month, month_rows in by_month.items():
+            month_dir = os.path.join(export_dir, "checkins", f"month={month}")
+            os.makedirs(month_dir, exist_ok=True)
+            pq.write_table(_to_table(month_rows), os.path.join(month_dir, f"part-{month_rows[0][0]:012d}.parquet"))
+        last_id = rows[-1][0] if len(rows) == chunk_size else upper
+        exported += len(rows)
+        _write_json(os.path.join(export_dir, WATERMARK_FILE), {"last_id": last_id, "rows": watermark["rows"] + exported})
+
+    return {"exported": exported, "last_id": last_id, "rows": watermark["rows"] + exported}
+
+def compact_month(month, export_dir=EXPORT_DIR):
+    """Merge the part files of one month (YYYY-MM) into a single file."""
+    month_dir = os.path.join(export_dir, "checkins", f"month={month}")
+    parts = sorted(f for f in os.listdir(month_dir) if f.startswith("part-"))
+    if len(parts) < 2:
+        return len(parts)
+    table = pa.concat_tables(pq.read_table(os.path.join(month_dir, p), schema=CHECKINS_SCHEMA) for p in parts)
+    tmp = os.path.join(month_dir, ".compact.tmp")
+    pq.write_table(table, tmp)
+    for part in parts:
+        os.remove(os.path.join(month_dir, part))
+    os.replace(tmp, os.path.join(month_dir, parts[0]))
+    return 1
+
+############ Daily-totals snapshot ###################
+
+def build_snapshot(conn, export_dir=EXPORT_DIR):
+    """
+    Per-employee daily totals from the Parquet export, written as an uncompressed
+    Arrow IPC file that readers memory-map. Also records the last day whose
+    check-ins are all exported, so readers know where SQLite has to take over.
+    """
+    watermark = read_watermark(export_dir)
+    checkins_dir = os.path.join(export_dir, "checkins")
+    table = ds.dataset(checkins_dir, format="parquet", partitioning="hive", schema=CHECKINS_SCHEMA).to_table(
+        columns=["employee_id", "work_date", "duration", "checkin_minute", "expected_start_minute"]
+    ) if os.path.isdir(checkins_dir) else CHECKINS_SCHEMA.empty_table()
+
+    completed = pc.is_valid(table["duration"])
+    hours = pc.divide(pc.cast(pc.fill_null(pc.cast(table["duration"], pa.int64()), 0), pa.float64()), 3600.0)
+    expected = pc.fill_null(pc.cast(table["expected_start_minute"], pa.float64()), float(EXPECTED_START_MINUTES))
+    delta = pc.if_else(completed, pc.abs(pc.subtract(pc.cast(table["checkin_minute"], pa.float64()), expected)), 0.0)
+    values = ["sessions", "completed", "hours", "delta_sum", "delta_sumsq"]
+    grouped = pa.table({
+        "employee_id": table["employee_id"],
+        "work_date": table["work_date"],
+        "sessions": pa.array(np.ones(len(table), dtype=np.int64)),
+        "completed": pc.cast(completed, pa.int64()),
+        "hours": hours,
+        "delta_sum": delta,
+        "delta_sumsq": pc.multiply(delta, delta),
+    }).group_by(["employee_id", "work_date"]).aggregate([(c, "sum") for c in values])
+    daily = pa.table(
+        [grouped["employee_id"], grouped["work_date"]] + [grouped[f"{c}_sum"] for c in values],
+        names=["employee_id", "work_date"] + values
+    ).sort_by([("work_date", "ascending"), ("employee_id", "ascending")])
+
+    (first_unexported,) = conn.execute("SELECT MIN(work_date) FROM checkins WHERE id > ?", (watermark["last_id"],)).fetchone()
+    if first_unexported is not None:
+        through = date.fromisoformat(first_unexported) - timedelta(days=1)
+    elif len(daily):
+        through = pc.max(daily["work_date"]).as_py()
+    else:
+        through = date.min
+    daily = daily.replace_schema_metadata({"last_id": str(watermark["last_id"]), "through": through.isoformat()})
+
+    path = os.path.join(export_dir, SNAPSHOT_FILE)
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, daily.schema) as writer:
+        writer.write_table(daily)
+    os.replace(tmp, path)
+    return {"days": len(daily), "last_id": watermark["last_id"], "through": through.isoformat()}
+
+class ArrowSnapshot:
+    def __init__(self, path=os.path.join(EXPORT_DIR, SNAPSHOT_FILE), enabled=os.environ.get("ANALYTICS_SOURCE") == "arrow"):
+        self.path = path
+        self.enabled = enabled
+        self._source = None
+        self._table = None
+        self._mtime = None
+
+    def table(self):
+        """The memory-mapped snapshot, reopened when build_snapshot() replaced the file."""
+        mtime = os.path.getmtime(self.path)
+        if mtime != self._mtime:
+            # The table's buffers point into the map, so keep it open as long as the table
+            self._source = pa.memory_map(self.path)
+            self._table = pa.ipc.open_file(self._source).read_all()
+            self._mtime = mtime
+        return self._table
+
+    def split_date(self, conn, start):
+        """
+        Last day to read from the snapshot for a look-back starting at start, or
+        None to use SQLite alone. Check-ins written after the export but dated
+        earlier (back-filled ones) pull the split back before their day.
+        """
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        metadata = self.table().schema.metadata
+        through = date.fromisoformat(metadata[b"through"].decode())
+        (first_late,) = conn.execute(
+            "SELECT MIN(work_date) FROM checkins WHERE id > ?", (int(metadata[b"last_id"]),)
+        ).fetchone()
+        if first_late is not None:
+            through = min(through, date.fromisoformat(first_late) - timedelta(days=1))
+        return through if through >= start else None
+
+    def _window(self, start, end, employees, columns):
+        table = self.table()
+        mask = pc.and_(pc.greater_equal(table["work_date"], pa.scalar(start, pa.date32())),
+                       pc.less_equal(table["work_date"], pa.scalar(end, pa.date32())))
+        if employees is not None:
+            mask = pc.and_(mask, pc.is_in(table["employee_id"], value_set=pa.array(list(employees), pa.string())))
+        return table.filter(mask).select(columns)
+
+    def daily_totals(self, start, end, employees=None):
+        """Rows shaped like riskradar.load_window: (employee_id, sessions, completed, hours, delta_sum, delta_sumsq)."""
+        columns = ["sessions", "completed", "hours", "delta_sum", "delta_sumsq"]
+        totals = self._window(start, end, employees, ["employee_id"] + columns).group_by("employee_id").aggregate(
+            [(c, "sum") for c in columns]
+        )
+        return list(zip(*(totals[c].to_pylist() for c in ["employee_id"] + [f"{c}_sum" for c in columns])))
+
+    def daily_hours(self, employees, start, days):
+        """(employees x days) matrix of hours from start, like forecasting.load_daily_hours."""
+        hours = np.zeros((len(employees), days))
+        window = self._window(start, start + timedelta(days=days - 1), employees, ["employee_id", "work_date", "hours"])
+        if len(window):
+            emp_idx = pc.index_in(window["employee_id"], value_set=pa.array(list(employees), pa.string())).to_numpy()
+            day_idx = window["work_date"].cast(pa.int32()).to_numpy() - (start - date(1970, 1, 1)).days
+            np.add.at(hours, (emp_idx, day_idx), window["hours"].to_numpy())
+        return hours
+
+snapshot = ArrowSnapshot()
+
+if __name__ == "__main__":
+    # Run from backend/: python -m engine.utils.columnar [export|snapshot|compact YYYY-MM] [--db path] [--dir path]
+    import argparse
+    from engine.utils.db import connect
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["export", "snapshot", "compact"])
+    parser.add_argument("month", nargs="?", help="YYYY-MM, for compact")
+    parser.add_argument("--db", default=DATABASE)
+    parser.add_argument("--dir", default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "export":
+        print(export_parquet(conn, args.dir))
+    elif args.command == "snapshot":
+        print(build_snapshot(conn, args.dir))
+    else:
+        print(f"{args.month}: {compact_month(args.month, args.dir)} file(s)")
+    conn.close()
@@ -0,0 +1,114 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+import multiprocessing
+import os
+import threading
+import time
+from engine.utils import db
+
+############ Process-pool analytics executor ###################
+# Nudges, the risk radar and the forecast evaluate every employee on their own,
+# in one loop. With ANALYTICS_WORKERS > 1, requests over more than one shard of
+# employees run on a pool of worker processes instead: the list (in the order
+# the result is returned) is cut into shards of SHARD_SIZE, each worker
+# evaluates whole shards on its own read-only connection (db.connect; WAL lets
+# it read while the API writes), and the shard results come back in shard order,
+# so the merged result is the same as in one process whatever finishes first.
+# The pool is started on first use and kept. 1, the default, keeps everything
+# in the calling thread.
+
+ANALYTICS_WORKERS = int(os.environ.get("ANALYTICS_WORKERS", 1))
+# Employees per shard; at most the IN (...) lists the analytics bind inline
+SHARD_SIZE = int(os.environ.get("ANALYTICS_SHARD_SIZE", 500))
+
+# Worker process state: one read-only connection per database
+_connections = {}
+
+def _init_worker():
+    # Shards are evaluated whole; a worker never fans out again
+    analytics.workers = 1
+
+def _run_shard(database, fn, shard, args):
+    conn = _connections.get(database)
+    if conn is None:
+        conn = _connections[database] = db.connect(database, read_only=True)
+    return fn(conn, shard, *args)
+
+class AnalyticsExecutor:
+    def __init__(self, workers=ANALYTICS_WORKERS, shard_size=SHARD_SIZE):
+        self.workers = workers
+        self.shard_size = shard_size
+        self._pool = None
+        self._lock = threading.Lock()
+        self.tasks = 0
+        self.shards = 0
+        self.last_ms = None
+        self.max_ms = 0.0
+
+    def sharded(self, employees):
+        """Whether evaluating these employees goes to the pool."""
+        return self.workers > 1 and len(employees) > self.shard_size
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: the API process has DB and event loop threads that must not be forked
+                self._pool = ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+                )
+            return self._pool
+
+    def map(self, fn, employees, *args, database=None):
+        """
+        [fn(conn, shard, *args) for each shard of employees], in shard order. fn must
+        be a module-level function (workers import it by name) that only reads.
+        """
+        database = database or db.DATABASE
+        shards = [employees[i:i + self.shard_size] for i in range(0, len(employees), self.shard_size)]
+        started = time.perf_counter()
+        if self.workers <= 1 or len(shards) <= 1:
+            conn = db.connect(database, read_only=True)
+            try:
+                results = [fn(conn, shard, *args) for shard in shards]
+            finally:
+                conn.close()
+        else:
+            try:
+                results = list(self._get_pool().map(_run_shard, repeat(database), repeat(fn), shards, repeat(args)))
+            except BrokenProcessPool:
+                # A worker died (killed, out of memory): start a new pool on the next call
+                self.shutdown()
+                raise
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.tasks += 1
+            self.shards += len(shards)
+            self.last_ms = round(elapsed_ms, 1)
+            self.max_ms = max(self.max_ms, self.last_ms)
+        return results
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def metrics(self):
+        return {
+            "workers": self.workers,
+            "shard_size": self.shard_size,
+            "pool_running": self._pool is not None,
+            "tasks": self.tasks,
+            "shards": self.shards,
+            "last_ms": self.last_ms,
+            "max_ms": self.max_ms,
+        }
+
+analytics = AnalyticsExecutor()
@@ -0,0 +1,288 @@
+from collections import OrderedDict
+import asyncio
+import os
+import threading
+import time
+import httpx
+from engine.utils.db import database, upsert_sql
+from engine.utils.metrics import registry
+
+#####Reverse geocoding off the request path
+# Check-ins are written first; coordinates are resolved by a background worker
+# and cached per geohash bucket, so one office is geocoded once, not every morning.
+
+UNKNOWN_LOCATION = "Unknown Location"
+GEOHASH_PRECISION = 7          # ~150m x 150m cells
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+CACHE_MAX_ENTRIES = 10000      # persistent table, LRU by last_used
+MEMORY_CACHE_SIZE = 1024       # in-process front for the hottest buckets
+LAST_USED_FLUSH_SECONDS = 60   # hits (memory ones too) reach last_used in one batched UPDATE this often
+QUEUE_SIZE = 1000
+HTTP_TIMEOUT_SECONDS = 5
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    bits, bit_count, even, chars = 0, 0, True, []
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+############ Providers ############
+
+class OpenCageProvider:
+    """OpenCage (https://opencagedata.com) over an async HTTP client."""
+
+    def __init__(self, api_key, timeout=HTTP_TIMEOUT_SECONDS):
+        self.api_key = api_key
+        self.client = httpx.AsyncClient(timeout=timeout)
+
+    async def reverse(self, lat, lon):
+        response = await self.client.get(
+            "https://api.opencagedata.com/geocode/v1/json",
+            params={"q": f"{lat},{lon}", "key": self.api_key}
+        )
+        if response.status_code == 200:
+            results = response.json()
+            if results['results']:
+                return results['results'][0]['formatted']  # Full address
+        return None
+
+    async def close(self):
+        await self.client.aclose()
+
+class StaticProvider:
+    """Local stand-in: answers from a fixed address (or a geohash -> address map)."""
+
+    def __init__(self, address="Test Office", by_bucket=None):
+        self.address = address
+        self.by_bucket = by_bucket or {}
+        self.calls = 0
+
+    async def reverse(self, lat, lon):
+        self.calls += 1
+        return self.by_bucket.get(geohash(lat, lon), self.address)
+
+    async def close(self):
+        pass
+
+class NullProvider:
+    """No geocoding configured: every check-in gets UNKNOWN_LOCATION."""
+
+    async def reverse(self, lat, lon):
+        return None
+
+    async def close(self):
+        pass
+
+def provider_from_env():
+    # GEOCODER_PROVIDER: opencage (the default when OPENCAGE_API_KEY is set), static or none
+    api_key = os.environ.get("OPENCAGE_API_KEY", "")
+    name = os.environ.get("GEOCODER_PROVIDER", "opencage" if api_key else "none")
+    if name == "static":
+        return StaticProvider(os.environ.get("GEOCODER_STATIC_ADDRESS", "Test Office"))
+    if name == "opencage" and api_key:
+        return OpenCageProvider(api_key)
+    return NullProvider()
+
+############ Cache ############
+
+class GeocodeCache:
+    def __init__(self, ttl=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES, memory_size=MEMORY_CACHE_SIZE,
+                 flush_seconds=LAST_USED_FLUSH_SECONDS):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_size = memory_size
+        self.flush_seconds = flush_seconds
+        # Used from every DB thread (ingest batches, the worker): guard the LRU order
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # bucket -> last hit not yet written to geocode_cache.last_used
+        self._touched = {}
+        self._flushed_at = time.time()
+
+    def get(self, bucket, conn):
+        now = int(time.time())
+        with self._lock:
+            hit = self._memory.get(bucket)
+            if hit and now - hit[1] < self.ttl:
+                self._memory.move_to_end(bucket)
+                self._touched[bucket] = now
+                address = hit[0]
+            else:
+                address = None
+        if address is None:
+            row = conn.execute(
+                "SELECT address, resolved_at FROM geocode_cache WHERE bucket = ?", (bucket,)
+            ).fetchone()
+            if not row or now - row[1] >= self.ttl:
+                return None
+            address = row[0]
+            self._remember(bucket, address, row[1], touched=now)
+        if now - self._flushed_at >= self.flush_seconds:
+            self.flush(conn)
+        return address
+
+    def flush(self, conn):
+        """Write the batched last_used of buckets hit since the last flush."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+            self._flushed_at = time.time()
+        if touched:
+            conn.executemany(
+                "UPDATE geocode_cache SET last_used = ? WHERE bucket = ? AND last_used < ?",
+                [(last_used, bucket, last_used) for bucket, last_used in sorted(touched.items())]
+            )
+            conn.commit()
+
+    def put(self, bucket, address, conn):
+        now = int(time.time())
+        conn.execute(
+            upsert_sql("geocode_cache", ("bucket", "address", "resolved_at", "last_used"), ("bucket",)),
+            (bucket, address, now, now)
+        )
+        conn.commit()
+        self._remember(bucket, address, now)
+        (entries,) = conn.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()
+        if entries > self.max_entries:
+            # Pruning goes by last_used: bring it up to date first
+            self.flush(conn)
+            conn.execute('''
+                DELETE FROM geocode_cache WHERE bucket IN (
+                    SELECT bucket FROM geocode_cache
+                    ORDER BY last_used
+                    LIMIT ?
+                )
+            ''', (entries - self.max_entries,))
+            conn.commit()
+
+    def _remember(self, bucket, address, resolved_at, touched=None):
+        with self._lock:
+            self._memory[bucket] = (address, resolved_at)
+            self._memory.move_to_end(bucket)
+            if touched is not None:
+                self._touched[bucket] = touched
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+############ Background resolver ############
+
+class GeocodeWorker:
+    def __init__(self, provider=None, cache=None, queue_size=QUEUE_SIZE):
+        self.provider = provider
+        self._owns_provider = provider is None
+        self.cache = cache or GeocodeCache()
+        self.queue_size = queue_size
+        self.queue = None
+        self._task = None
+        self.resolved = 0
+        self.failed = 0
+        self.last_error = None
+
+    def lookup_cached(self, lat, lon, conn):
+        if lat is None or lon is None:
+            return UNKNOWN_LOCATION
+        return self.cache.get(geohash(lat, lon), conn)
+
+    def submit(self, checkin_id, lat, lon):
+        """Queue a check-in for resolution. Rows dropped when full are picked up at next start."""
+        if self.queue is None:
+            return False
+        try:
+            self.queue.put_nowait((checkin_id, lat, lon))
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def resolve(self, lat, lon):
+        bucket = geohash(lat, lon)
+        cached = await database.run(lambda conn: self.cache.get(bucket, conn))
+        if cached:
+            return cached
+
+        started = time.perf_counter()
+        try:
+            address = await self.provider.reverse(lat, lon)
+        except Exception as e:
+            registry.observe_external("geocoder", "error", time.perf_counter() - started)
+            print(f"Reverse geocoding failed: {e}")
+            return UNKNOWN_LOCATION
+        registry.observe_external("geocoder", "ok" if address else "empty", time.perf_counter() - started)
+        if not address:
+            return UNKNOWN_LOCATION
+
+        await database.run(lambda conn: self.cache.put(bucket, address, conn))
+        return address
+
+    async def _run(self):
+        while True:
+            checkin_id, lat, lon = await self.queue.get()
+            try:
+                address = await self.resolve(lat, lon)
+                await database.run(_store_location, checkin_id, address)
+                self.resolved += 1
+            except Exception as e:
+                # DatabaseBusy, a locked database: the row keeps context NULL and is requeued at next start
+                self.failed += 1
+                self.last_error = repr(e)
+                print(f"Geocoding check-in {checkin_id} failed: {e!r}")
+            finally:
+                self.queue.task_done()
+
+    async def _requeue_pending(self):
+        rows = await database.run(lambda conn: conn.execute('''
+            SELECT id, latitude, longitude FROM checkins
+            WHERE context IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL
+            LIMIT ?
+        ''', (self.queue_size,)).fetchall())
+        for row in rows:
+            self.submit(*row)
+
+    async def start(self):
+        if self.provider is None:
+            self.provider = provider_from_env()
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        await self._requeue_pending()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.queue = None
+        if self.provider and self._owns_provider:
+            await self.provider.close()
+            self.provider = None
+
+    def metrics(self):
+        return {
+            "running": self._task is not None,
+            "provider": type(self.provider).__name__ if self.provider else None,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "resolved": self.resolved,
+            "failed": self.failed,
+            "last_error": self.last_error,
+        }
+
+def _store_location(conn, checkin_id, address):
+    conn.execute("UPDATE checkins SET context = ? WHERE id = ?", (address, checkin_id))
+    conn.commit()
+
+geocoder = GeocodeWorker()
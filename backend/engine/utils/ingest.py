@@ -0,0 +1,364 @@
+from datetime import datetime
+import asyncio
+import json
+import os
+import time
+import uuid
+from engine.models import baselines, sessions
+from engine.models.sites import employee_clocks
+from engine.utils.cache import versions
+from engine.utils.db import DB_FILE, database, upsert_sql, write_transaction
+from engine.utils.geocoding import geocoder
+from engine.utils.nudge_stream import nudge_hub
+from engine.utils.timestamps import local_fields, server_time
+
+#####Write-behind queue for the check-in/checkout forms
+# Handlers enqueue an event and return; one writer task drains the queue and
+# commits events in groups, so a morning peak costs a handful of fsyncs
+# instead of one write-lock round trip per employee. The handlers have already
+# answered by then, so a batch that fails to commit (DatabaseBusy, a locked or
+# unreachable database) is retried with backoff; after FLUSH_ATTEMPTS it goes to
+# ingest_dead_letters, which `python -m engine.utils.ingest replay` writes back.
+# A batch that can't be dead-lettered either while the queue is stopping is
+# appended to SPILL_FILE instead, which replay loads first.
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 200
+MAX_LATENCY_SECONDS = 0.05   # flush a partial batch after this long
+ENQUEUE_TIMEOUT_SECONDS = 2  # backpressure: callers wait this long for room, then get QueueFull
+FLUSH_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 0.1  # doubled after every failed attempt
+MAX_RETRY_BACKOFF_SECONDS = 5
+SPILL_FILE = os.environ.get("INGEST_SPILL_FILE", os.path.join(os.path.dirname(DB_FILE), "ingest_spill.jsonl"))
+
+_STOP = object()
+
+class IngestQueueFull(Exception):
+    pass
+
+def checkin_event(employee_id, checkin_time, latitude=None, longitude=None):
+    return {"type": "checkin", "employee_id": employee_id, "time": checkin_time,
+            "latitude": latitude, "longitude": longitude}
+
+def checkout_event(employee_id, checkout_time):
+    return {"type": "checkout", "employee_id": employee_id, "time": checkout_time}
+
+def apply_events(conn, events, dead_letter_id=None):
+    """
+    Write a group of events in one transaction. Returns the check-ins still needing
+    geocoding and the number of checkouts matching no session (nothing written).
+    A dead-lettered batch (dead_letter_id) leaves ingest_dead_letters in the same
+    transaction; None when it is already gone, i.e. replayed by someone else.
+    """
+    # Cache lookups first: they touch geocode_cache and must not run inside the write transaction
+    locations = [
+        geocoder.lookup_cached(event["latitude"], event["longitude"], conn) if event["type"] == "checkin" else None
+        for event in events
+    ]
+    # Form times are this server's clock; rows are written on the employee's site clock (models/sites.py)
+    clocks = employee_clocks(conn, (event["employee_id"] for event in events))
+
+    to_geocode, checkins, checkouts, late_checkouts, unmatched = [], [], [], [], 0
+    with write_transaction(conn, lock_keys=[event["employee_id"] for event in events]):
+        if dead_letter_id is not None and not conn.execute(
+            "DELETE FROM ingest_dead_letters WHERE batch_id = ?", (dead_letter_id,)
+        ).rowcount:
+            return None
+        for event, location_name in zip(events, locations):
+            tz, expected_start = clocks[event["employee_id"]]
+            local = server_time(event["time"], tz)
+            ts, day, minutes = local_fields(local)
+            if event["type"] == "checkin":
+                lat, lon = event["latitude"], event["longitude"]
+                (checkin_id,) = conn.execute('''
+                    INSERT INTO checkins (employee_id, checkin_time, checkout_time, latitude, longitude, context,
+                                          checkin_ts, work_date, checkin_minute, expected_start_minute)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    RETURNING id
+                ''', (
+                    event["employee_id"],
+                    local.isoformat(),
+                    None,
+                    lat,
+                    lon,
+                    location_name,
+                    ts,
+                    day,
+                    minutes,
+                    expected_start
+                )).fetchone()
+                sessions.open_session(conn, event["employee_id"], checkin_id, ts)
+                checkins.append((checkin_id, event["employee_id"], ts, day, minutes))
+                if location_name is None:
+                    to_geocode.append((checkin_id, lat, lon))
+            else:
+                row = sessions.take_open_session(conn, event["employee_id"])
+                if row:
+                    checkin_id, checkin_ts, checkin_day, checkin_minutes, checkin_expected = row
+                    conn.execute('''
+                        UPDATE checkins
+                        SET checkout_time = ?, checkout_ts = ?
+                        WHERE id = ?
+                    ''', (local.isoformat(), ts, checkin_id))
+                    checkouts.append((event["employee_id"], checkin_day, checkin_minutes, ts - checkin_ts, checkin_expected))
+                    continue
+                # Checked out after the auto-close job closed the session
+                row = sessions.take_auto_closed_session(conn, event["employee_id"], ts)
+                if row is None:
+                    unmatched += 1
+                    continue
+                checkin_id, checkin_ts, checkin_day = row
+                conn.execute('''
+                    UPDATE checkins
+                    SET checkout_time = ?, checkout_ts = ?, auto_closed_at = NULL
+                    WHERE id = ?
+                ''', (local.isoformat(), ts, checkin_id))
+                late_checkouts.append((event["employee_id"], checkin_day, ts - checkin_ts))
+        baselines.record_events(conn, checkins, checkouts, late_checkouts)
+    return to_geocode, unmatched
+
+def _event_json(event):
+    return {**event, "time": event["time"].isoformat()}
+
+def _event_from_json(event):
+    return {**event, "time": datetime.fromisoformat(event["time"])}
+
+def dead_letter_row(events, error):
+    return (uuid.uuid4().hex, datetime.now().isoformat(timespec="seconds"), repr(error),
+            json.dumps([_event_json(event) for event in events]))
+
+def dead_letter(conn, events, error):
+    """Keep a batch that could not be written, for replay_dead_letters."""
+    conn.execute(
+        "INSERT INTO ingest_dead_letters (batch_id, failed_at, error, events) VALUES (?, ?, ?, ?)",
+        dead_letter_row(events, error)
+    )
+    conn.commit()
+
+def spill(events, error, path=SPILL_FILE):
+    """Append a batch the database took neither way to a local file, for load_spill."""
+    with open(path, "a") as f:
+        f.write(json.dumps(dead_letter_row(events, error)) + "\n")
+
+def load_spill(conn, path=SPILL_FILE):
+    """Move spilled batches into ingest_dead_letters; returns how many."""
+    # Renamed first: a queue still spilling starts a new file, a concurrent load finds none
+    loading = f"{path}.{uuid.uuid4().hex}"
+    try:
+        os.rename(path, loading)
+    except FileNotFoundError:
+        return 0
+    with open(loading) as f:
+        rows = [tuple(json.loads(line)) for line in f if line.strip()]
+    conn.executemany(upsert_sql("ingest_dead_letters", ("batch_id", "failed_at", "error", "events"), ("batch_id",)), rows)
+    conn.commit()
+    os.remove(loading)
+    return len(rows)
+
+def replay_dead_letters(conn):
+    """Write dead-lettered batches, oldest first; returns the number of events written."""
+    written = 0
+    batches = conn.execute("SELECT batch_id, events FROM ingest_dead_letters ORDER BY failed_at").fetchall()
+    for batch_id, events in batches:
+        events = [_event_from_json(event) for event in json.loads(events)]
+        if apply_events(conn, events, dead_letter_id=batch_id) is None:
+            continue
+        versions.bump((event["employee_id"] for event in events), conn)
+        written += len(events)
+    return written
+
+class WriteBehindQueue:
+    def __init__(self, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, max_latency=MAX_LATENCY_SECONDS):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.queue = None
+        self._task = None
+        self._stopping = False
+        self.stats = {
+            "events_written": 0,
+            "batches_committed": 0,
+            "rejected_full": 0,
+            "failed_attempts": 0,
+            "batches_retried": 0,
+            "events_dead_lettered": 0,
+            "events_spilled": 0,
+            "checkouts_unmatched": 0,
+            "post_commit_errors": 0,
+            "last_error": None,
+            "max_queue_depth": 0,
+            "last_commit_ms": 0.0,
+            "max_commit_ms": 0.0,
+            "total_commit_ms": 0.0,
+        }
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    async def enqueue(self, event):
+        if not self.running:
+            # No writer (scripts, tests without startup): write through, errors go to the caller
+            self._submit_geocoding(await database.run(self._write, [event]))
+            return
+        try:
+            await asyncio.wait_for(self.queue.put(event), timeout=ENQUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            self.stats["rejected_full"] += 1
+            raise IngestQueueFull()
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.queue.qsize())
+
+    def _write(self, conn, events):
+        start = time.perf_counter()
+        to_geocode, unmatched = apply_events(conn, events)
+        if unmatched:
+            # The form already answered; nothing was written for these
+            self.stats["checkouts_unmatched"] += unmatched
+            print(f"ingest: {unmatched} checkout(s) matched no open or auto-closed session")
+        # Committed: a failure from here on must not send the batch back for another write
+        try:
+            versions.bump((event["employee_id"] for event in events), conn)
+            # Checkouts don't touch the check-in stats the nudge rules read
+            nudge_hub.evaluate(conn, {event["employee_id"] for event in events if event["type"] == "checkin"})
+        except Exception as e:
+            self.stats["post_commit_errors"] += 1
+            self.stats["last_error"] = repr(e)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats["events_written"] += len(events)
+        self.stats["batches_committed"] += 1
+        self.stats["last_commit_ms"] = round(elapsed_ms, 3)
+        self.stats["max_commit_ms"] = round(max(self.stats["max_commit_ms"], elapsed_ms), 3)
+        self.stats["total_commit_ms"] += elapsed_ms
+        return to_geocode
+
+    async def _next_batch(self):
+        """Collect up to batch_size events, waiting at most max_latency after the first."""
+        first = await self.queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(self.queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if event is _STOP:
+                return batch, True
+            batch.append(event)
+        return batch, False
+
+    def _submit_geocoding(self, to_geocode):
+        for checkin_id, lat, lon in to_geocode:
+            geocoder.submit(checkin_id, lat, lon)
+
+    async def _flush(self, batch):
+        """Write a batch, retrying with backoff; dead-letter it when every attempt fails."""
+        backoff = RETRY_BACKOFF_SECONDS
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                to_geocode = await database.run(self._write, batch)
+            except Exception as e:
+                # apply_events rolled back: nothing of the batch was written
+                self.stats["failed_attempts"] += 1
+                self.stats["last_error"] = repr(e)
+                if attempt == 1:
+                    self.stats["batches_retried"] += 1
+                error = e
+            else:
+                self._submit_geocoding(to_geocode)
+                return
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_RETRY_BACKOFF_SECONDS)
+        await self._dead_letter(batch, error)
+
+    async def _dead_letter(self, batch, error):
+        # Keep trying: while the database can't take the batch the queue fills up
+        # and new events get QueueFull instead of being accepted and lost. Once
+        # stopping, the batch goes to SPILL_FILE so shutdown isn't held up.
+        while True:
+            try:
+                await database.run(dead_letter, batch, error)
+                self.stats["events_dead_lettered"] += len(batch)
+                return
+            except Exception as e:
+                self.stats["failed_attempts"] += 1
+                self.stats["last_error"] = repr(e)
+                error = e
+            if self._stopping:
+                break
+            await asyncio.sleep(MAX_RETRY_BACKOFF_SECONDS)
+        try:
+            spill(batch, error)
+            self.stats["events_spilled"] += len(batch)
+            print(f"ingest: spilled {len(batch)} events to {SPILL_FILE}")
+        except OSError as e:
+            # Last resort: the events are in the log
+            print(f"ingest: could not spill batch ({e!r}): {json.dumps([_event_json(event) for event in batch])}")
+
+    async def _run(self):
+        while True:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._flush(batch)
+            if stopping:
+                return
+
+    def metrics(self):
+        batches = self.stats["batches_committed"]
+        return {
+            "running": self.running,
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "queue_size": self.queue_size,
+            "events_written": self.stats["events_written"],
+            "batches_committed": batches,
+            "rejected_full": self.stats["rejected_full"],
+            "failed_attempts": self.stats["failed_attempts"],
+            "batches_retried": self.stats["batches_retried"],
+            "events_dead_lettered": self.stats["events_dead_lettered"],
+            "events_spilled": self.stats["events_spilled"],
+            "checkouts_unmatched": self.stats["checkouts_unmatched"],
+            "post_commit_errors": self.stats["post_commit_errors"],
+            "last_error": self.stats["last_error"],
+            "max_queue_depth": self.stats["max_queue_depth"],
+            "last_commit_ms": self.stats["last_commit_ms"],
+            "max_commit_ms": self.stats["max_commit_ms"],
+            "avg_commit_ms": round(self.stats["total_commit_ms"] / batches, 3) if batches else 0.0,
+            "avg_batch_size": round(self.stats["events_written"] / batches, 2) if batches else 0.0,
+        }
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting events, let the writer drain everything queued before the stop marker."""
+        if not self._task:
+            return
+        task, self._task = self._task, None
+        self._stopping = True
+        await self.queue.put(_STOP)
+        await task
+        self.queue = None
+        self._stopping = False
+
+ingest_queue = WriteBehindQueue()
+
+if __name__ == "__main__":
+    # Run from backend/: python -m engine.utils.ingest replay [--db path or DATABASE_URL]
+    import argparse
+    from engine.utils import db
+    from engine.utils.migrations import migrate
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["replay"])
+    parser.add_argument("--db", default=db.DATABASE)
+    args = parser.parse_args()
+
+    conn = db.connect(args.db)
+    migrate(conn)
+    print(f"Loaded {load_spill(conn)} spilled batches")
+    print(f"Replayed {replay_dead_letters(conn)} events")
+    conn.close()
@@ -0,0 +1,301 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+from datetime import datetime
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from starlette.datastructures import MutableHeaders
+
+#####Request metrics and an opt-in sampling profiler
+# MetricsMiddleware times every request by route template and gives it a
+# RequestStats in a context variable. Pooled connections (utils/db.py,
+# utils/postgres.py) add statement count, time and rows fetched to it whenever
+# one is set, including on the DB threads (database.run copies the context).
+# Totals per route plus external calls (the geocoder) and the workers' own
+# stats are rendered in the Prometheus text format at GET /metrics; each
+# response also carries a Server-Timing header with its SQL share (for streamed
+# responses, only the SQL that ran before the first chunk).
+# With PROFILE_SAMPLE_RATE > 0 (or POST /metrics/profiling) that fraction of
+# requests is profiled: a thread samples the stacks running on their behalf
+# (their coroutine on the event loop, their database.run jobs) every
+# PROFILE_INTERVAL_SECONDS and writes them in collapsed-stack form (one
+# "frame;frame;frame count" line per stack, the input of flamegraph.pl and
+# speedscope) to PROFILE_DIR.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_INTERVAL_SECONDS", 0.005))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "palantir-profiles"))
+PROFILE_MAX_FILES = 200
+MAX_STACK_DEPTH = 128
+# Rows per timed fetch when a traced cursor is iterated (a timed row costs more than the row)
+TRACED_ITER_BATCH = 256
+
+class RequestStats:
+    __slots__ = ("queries", "sql_seconds", "rows", "samples", "_lock")
+
+    def __init__(self, profiled=False):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        # Collapsed stack -> sample count, only for profiled requests
+        self.samples = Counter() if profiled else None
+        self._lock = threading.Lock()
+
+    def add_sql(self, seconds, queries=0, rows=0):
+        # A request's database.run jobs can run on several DB threads at once
+        with self._lock:
+            self.queries += queries
+            self.sql_seconds += seconds
+            self.rows += rows
+
+_current = ContextVar("request_stats", default=None)
+
+def current():
+    """Stats of the request being served, or None outside one (background jobs, scripts)."""
+    return _current.get()
+
+############ Registry ###################
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _labels(**labels):
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()                 # (method, route, status)
+        self.latency = defaultdict(Histogram)     # (method, route)
+        self.sql_seconds = defaultdict(Histogram)
+        self.sql_queries = Counter()
+        self.sql_rows = Counter()
+        self.external = defaultdict(Histogram)    # (service, outcome)
+        self.collectors = []                      # (prefix, fn returning a dict)
+
+    def observe_request(self, method, route, status, seconds, stats):
+        key = (method, route)
+        with self._lock:
+            self.requests[method, route, status] += 1
+            self.latency[key].observe(seconds)
+            self.sql_seconds[key].observe(stats.sql_seconds)
+            self.sql_queries[key] += stats.queries
+            self.sql_rows[key] += stats.rows
+
+    def observe_external(self, service, outcome, seconds):
+        with self._lock:
+            self.external[service, outcome].observe(seconds)
+
+    def add_collector(self, prefix, fn):
+        """Expose the numeric values of fn()'s dict (a worker's metrics()/stats()) as gauges."""
+        self.collectors.append((prefix, fn))
+
+    @staticmethod
+    def _histogram(lines, name, labels, histogram):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le='+Inf' if bound == float('inf') else bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += ["# HELP palantir_http_requests_total Requests served, by route template and status.",
+                      "# TYPE palantir_http_requests_total counter"]
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"palantir_http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+            for name, help_text, histograms in (
+                ("palantir_http_request_duration_seconds", "Request latency.", self.latency),
+                ("palantir_request_sql_seconds", "Time spent in SQL per request.", self.sql_seconds),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (method, route), histogram in sorted(histograms.items()):
+                    self._histogram(lines, name, {"method": method, "route": route}, histogram)
+            for name, help_text, counter in (
+                ("palantir_sql_queries_total", "SQL statements executed.", self.sql_queries),
+                ("palantir_sql_rows_fetched_total", "Rows fetched from the database.", self.sql_rows),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (method, route), count in sorted(counter.items()):
+                    lines.append(f"{name}{_labels(method=method, route=route)} {count}")
+            lines += ["# HELP palantir_external_request_duration_seconds Calls to external services.",
+                      "# TYPE palantir_external_request_duration_seconds histogram"]
+            for (service, outcome), histogram in sorted(self.external.items()):
+                self._histogram(lines, "palantir_external_request_duration_seconds",
+                                {"service": service, "outcome": outcome}, histogram)
+
+        for prefix, fn in self.collectors:
+            for key, value in fn().items():
+                if isinstance(value, (bool, int, float)):
+                    name = f"palantir_{prefix}_{re.sub('[^a-zA-Z0-9_]', '_', key)}"
+                    lines += [f"# TYPE {name} gauge", f"{name} {int(value) if isinstance(value, (bool, int)) else value}"]
+        return "\n".join(lines) + "\n"
+
+registry = Metrics()
+
+############ Sampling profiler ###################
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, interval=PROFILE_INTERVAL_SECONDS, out_dir=PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.out_dir = out_dir
+        # Frame a profiled request's work runs under -> its RequestStats
+        self._roots = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.profiled_total = 0
+        self.samples_total = 0
+        self.recent = deque(maxlen=PROFILE_MAX_FILES)
+
+    def should_profile(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def enter(self, frame, stats):
+        with self._lock:
+            self._roots[frame] = stats
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def leave(self, frame):
+        with self._lock:
+            self._roots.pop(frame, None)
+
+    def call(self, fn, *args, **kwargs):
+        """fn(*args, **kwargs), sampled for the current request if it is being profiled (DB threads)."""
+        stats = _current.get()
+        if stats is None or stats.samples is None:
+            return fn(*args, **kwargs)
+        frame = sys._getframe()
+        self.enter(frame, stats)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.leave(frame)
+
+    def _sample(self):
+        me = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stats = self._roots.get(frame)
+                if stats is not None:
+                    # Innermost frames first; flame graphs read root first
+                    stats.samples[";".join(reversed(stack))] += 1
+                    break
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+
+    def _run(self):
+        while True:
+            if not self._roots:
+                self._wake.clear()
+                self._wake.wait()
+            with self._lock:
+                self._sample()
+            time.sleep(self.interval)
+
+    def dump(self, method, route, seconds, stats):
+        """Write one request's samples as a .folded file; returns its name."""
+        self.profiled_total += 1
+        self.samples_total += sum(stats.samples.values())
+        os.makedirs(self.out_dir, exist_ok=True)
+        slug = re.sub("[^a-zA-Z0-9]+", "-", route).strip("-") or "root"
+        name = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{method}-{slug}.folded"
+        with open(os.path.join(self.out_dir, name), "w") as f:
+            for stack, count in stats.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        if len(self.recent) == self.recent.maxlen:
+            oldest = self.recent[0]["file"]
+            try:
+                os.remove(os.path.join(self.out_dir, oldest))
+            except FileNotFoundError:
+                pass
+        self.recent.append({"file": name, "method": method, "route": route, "duration_ms": round(seconds * 1000, 1),
+                            "samples": sum(stats.samples.values()), "sql_queries": stats.queries})
+        return name
+
+    def metrics(self):
+        return {
+            "sample_rate": self.sample_rate,
+            "interval_seconds": self.interval,
+            "dir": self.out_dir,
+            "profiled_total": self.profiled_total,
+            "samples_total": self.samples_total,
+            "recent": list(self.recent),
+        }
+
+profiler = SamplingProfiler()
+
+############ Middleware ###################
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed until their last chunk."""
+
+    def __init__(self, app, metrics=registry, sampler=profiler):
+        self.app = app
+        self.metrics = metrics
+        self.sampler = sampler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(profiled=self.sampler.should_profile())
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append(
+                    "Server-Timing",
+                    f'sql;dur={stats.sql_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f'app;dur={(time.perf_counter() - started) * 1000:.1f}'
+                )
+            await send(message)
+
+        frame = sys._getframe()
+        if stats.samples is not None:
+            self.sampler.enter(frame, stats)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            if stats.samples is not None:
+                self.sampler.leave(frame)
+                self.sampler.dump(scope["method"], route, elapsed, stats)
+            self.metrics.observe_request(scope["method"], route, status, elapsed, stats)
@@ -0,0 +1,526 @@
+from datetime import datetime
+from engine.utils.db import DATABASE, connect, dialect, write_transaction
+from engine.models import baselines, sessions
+
+# Each migration is applied once, in order, and recorded in schema_migrations.
+# Add new ones to the end of MIGRATIONS; never edit one that has shipped.
+# migrate() runs each one in a write transaction together with its
+# schema_migrations row, so a migration must not commit (or open a
+# write_transaction) itself.
+# Migrations that add baseline-store tables return True instead of filling them:
+# rebuild() writes every store table, so it runs once after the last pending one.
+
+BACKFILL_CHUNK_SIZE = 5000
+MIGRATION_LOCK_TIMEOUT_MS = 10 * 60 * 1000
+
+def _create_checkins(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS checkins (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_id TEXT,
+            checkin_time TEXT,
+            checkout_time TEXT,
+            latitude REAL,
+            longitude REAL,
+            context TEXT
+        )
+    ''')
+
+def _columns(conn, table):
+    """Column names of table, on either backend."""
+    if dialect(conn).name == "sqlite":
+        return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    return {row[0] for row in conn.execute(
+        "SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = ?", (table,)
+    )}
+
+def _add_time_columns(conn):
+    existing = _columns(conn, "checkins")
+    for column, col_type in (("checkin_ts", "INTEGER"), ("checkout_ts", "INTEGER"), ("work_date", "TEXT")):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE checkins ADD COLUMN {column} {col_type}")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_checkins_employee_ts ON checkins (employee_id, checkin_ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_checkins_work_date ON checkins (work_date)")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkins_open ON checkins (employee_id, checkin_ts)
+        WHERE checkout_time IS NULL
+    ''')
+
+    # Writers that bypass the API (scripts in testdata/, manual inserts) still get the columns
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS checkins_fill_ts AFTER INSERT ON checkins
+        WHEN NEW.checkin_ts IS NULL AND NEW.checkin_time IS NOT NULL
+        BEGIN
+            UPDATE checkins SET
+                checkin_ts = CAST(strftime('%s', NEW.checkin_time) AS INTEGER),
+                checkout_ts = CAST(strftime('%s', NEW.checkout_time) AS INTEGER),
+                work_date = DATE(NEW.checkin_time)
+            WHERE id = NEW.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS checkins_fill_checkout_ts AFTER UPDATE OF checkout_time ON checkins
+        WHEN NEW.checkout_time IS NOT NULL AND NEW.checkout_ts IS NULL
+        BEGIN
+            UPDATE checkins SET checkout_ts = CAST(strftime('%s', NEW.checkout_time) AS INTEGER)
+            WHERE id = NEW.id;
+        END
+    ''')
+    backfill_time_columns(conn, commit=False)
+
+def _create_geocode_cache(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            bucket TEXT PRIMARY KEY,
+            address TEXT,
+            resolved_at INTEGER,
+            last_used INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_geocode_cache_last_used ON geocode_cache (last_used)")
+
+def _create_baseline_store(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS employee_stats (
+            employee_id TEXT PRIMARY KEY,
+            first_seen_id INTEGER,
+            recent TEXT,
+            checkin_count INTEGER,
+            lifetime_mean REAL,
+            lifetime_m2 REAL,
+            baseline_mean REAL,
+            baseline_stddev REAL,
+            shift REAL,
+            last_work_date TEXT,
+            first_checkin_minutes INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employee_stats_first_seen ON employee_stats (first_seen_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS employee_daily (
+            employee_id TEXT,
+            work_date TEXT,
+            sessions INTEGER,
+            completed INTEGER,
+            hours REAL,
+            delta_sum REAL,
+            delta_sumsq REAL,
+            PRIMARY KEY (employee_id, work_date)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employee_daily_work_date ON employee_daily (work_date)")
+    return True
+
+def _create_weekly_hours(conn):
+    weekday_columns = ",\n            ".join(f"{day} REAL DEFAULT 0" for day in baselines.WEEKDAY_COLUMNS)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS employee_weekly (
+            employee_id TEXT,
+            week_start TEXT,
+            {weekday_columns},
+            PRIMARY KEY (employee_id, week_start)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employee_weekly_week_start ON employee_weekly (week_start)")
+    return True
+
+def _create_org_hierarchy(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS org_units (
+            unit_id TEXT PRIMARY KEY,
+            name TEXT,
+            kind TEXT,
+            parent_id TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_org_units_parent ON org_units (parent_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS employee_teams (
+            employee_id TEXT PRIMARY KEY,
+            team_id TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employee_teams_team ON employee_teams (team_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS team_daily (
+            team_id TEXT,
+            work_date TEXT,
+            sessions INTEGER,
+            completed INTEGER,
+            hours REAL,
+            PRIMARY KEY (team_id, work_date)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_team_daily_work_date ON team_daily (work_date)")
+    return True
+
+def _create_open_sessions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS open_sessions (
+            employee_id TEXT PRIMARY KEY,
+            checkin_id INTEGER,
+            checkin_ts INTEGER
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_open_sessions_checkin_ts ON open_sessions (checkin_ts)")
+    sessions.fill_open_sessions(conn)
+
+def backfill_time_columns(conn, chunk_size=BACKFILL_CHUNK_SIZE, commit=True):
+    """Fill checkin_ts/checkout_ts/work_date for old rows, committing every chunk (unless in a migration)."""
+    total = 0
+    while True:
+        cursor = conn.execute('''
+            UPDATE checkins SET
+                checkin_ts = CAST(strftime('%s', checkin_time) AS INTEGER),
+                checkout_ts = CAST(strftime('%s', checkout_time) AS INTEGER),
+                work_date = DATE(checkin_time)
+            WHERE id IN (
+                SELECT id FROM checkins
+                WHERE checkin_ts IS NULL AND checkin_time IS NOT NULL
+                LIMIT ?
+            )
+        ''', (chunk_size,))
+        if commit:
+            total += cursor.rowcount
+        if cursor.rowcount < chunk_size:
+            return total
+
+def _create_data_versions(conn):
+    # Cache versions shared by the API processes (utils/cache.py VersionSync)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER,
+            origin TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_data_versions_version ON data_versions (version)")
+
+def _create_archived_months(conn):
+    # Months whose raw check-ins moved to the Parquet archive (utils/retention.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archived_months (
+            month TEXT PRIMARY KEY,
+            last_id BIGINT,
+            row_count BIGINT,
+            archived_at TEXT
+        )
+    ''')
+
+# Minute of day as written in the ISO text, the clock the baselines use (utils/timestamps.py minute_of_day)
+CHECKIN_MINUTE_SQL = "CAST(substr({0}, 12, 2) AS INTEGER) * 60 + CAST(substr({0}, 15, 2) AS INTEGER)"
+
+def _add_checkin_minute(conn):
+    # Analytics and rebuilds read integers (epoch seconds, minute of day, work date) instead of parsing checkin_time
+    if "checkin_minute" not in _columns(conn, "checkins"):
+        conn.execute("ALTER TABLE checkins ADD COLUMN checkin_minute INTEGER")
+    if dialect(conn).name == "sqlite":
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS checkins_fill_minute AFTER INSERT ON checkins
+            WHEN NEW.checkin_minute IS NULL AND NEW.checkin_time IS NOT NULL
+            BEGIN
+                UPDATE checkins SET checkin_minute = {CHECKIN_MINUTE_SQL.format("NEW.checkin_time")}
+                WHERE id = NEW.id;
+            END
+        ''')
+    while True:
+        cursor = conn.execute(f'''
+            UPDATE checkins SET checkin_minute = {CHECKIN_MINUTE_SQL.format("checkin_time")}
+            WHERE id IN (
+                SELECT id FROM checkins
+                WHERE checkin_minute IS NULL AND checkin_time IS NOT NULL
+                LIMIT ?
+            )
+        ''', (BACKFILL_CHUNK_SIZE,))
+        if cursor.rowcount < BACKFILL_CHUNK_SIZE:
+            break
+
+def _create_sites(conn):
+    # Site timezones and expected start times (models/sites.py); check-ins keep the expected start they were written under
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sites (
+            site_id TEXT PRIMARY KEY,
+            name TEXT,
+            timezone TEXT,
+            expected_start_minute INTEGER
+        )
+    ''')
+    conn.execute("CREATE TABLE IF NOT EXISTS employee_sites (employee_id TEXT PRIMARY KEY, site_id TEXT)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_employee_sites_site ON employee_sites (site_id)")
+    # NULL: the default start (baselines.EXPECTED_START_MINUTES), which every existing row was scored against
+    if "expected_start_minute" not in _columns(conn, "checkins"):
+        conn.execute("ALTER TABLE checkins ADD COLUMN expected_start_minute INTEGER")
+
+def _create_precomputed_results(conn):
+    # Nightly nudges, risks and forecasts per employee (utils/precompute.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS precomputed_results (
+            kind TEXT NOT NULL,
+            employee_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            computed_at TEXT NOT NULL,
+            PRIMARY KEY (kind, employee_id)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_precomputed_results_position ON precomputed_results (kind, position)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS precomputed_runs (
+            kind TEXT PRIMARY KEY,
+            params TEXT,
+            as_of TEXT,
+            computed_at TEXT,
+            employees INTEGER,
+            seconds REAL,
+            meta TEXT
+        )
+    ''')
+
+def _create_ingest_dead_letters(conn):
+    # Write-behind batches that kept failing, kept for replay (utils/ingest.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_dead_letters (
+            batch_id TEXT PRIMARY KEY,
+            failed_at TEXT NOT NULL,
+            error TEXT,
+            events TEXT NOT NULL
+        )
+    ''')
+
+def _create_precompute_claims(conn):
+    # One row per day: the process that inserts it runs that day's precomputation
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS precompute_claims (
+            as_of TEXT PRIMARY KEY,
+            claimed_at TEXT NOT NULL,
+            owner TEXT
+        )
+    ''')
+
+def _add_auto_closed(conn):
+    # Check-ins closed by the stale-session job (models/sessions.py): a zero-length checkout plus when it was written
+    if "auto_closed_at" not in _columns(conn, "checkins"):
+        conn.execute("ALTER TABLE checkins ADD COLUMN auto_closed_at BIGINT")
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_checkins_auto_closed ON checkins (employee_id, checkin_ts)
+        WHERE auto_closed_at IS NOT NULL
+    ''')
+
+# Work date as written in the ISO text: the site-local date, like CHECKIN_MINUTE_SQL (utils/timestamps.py work_date)
+WORK_DATE_SQL = "substr({0}, 1, 10)"
+
+def _local_work_dates(conn):
+    # DATE() in checkins_fill_ts turned times written with a UTC offset into the UTC date
+    if dialect(conn).name == "sqlite":
+        conn.execute("DROP TRIGGER IF EXISTS checkins_fill_ts")
+        conn.execute(f'''
+            CREATE TRIGGER checkins_fill_ts AFTER INSERT ON checkins
+            WHEN NEW.checkin_ts IS NULL AND NEW.checkin_time IS NOT NULL
+            BEGIN
+                UPDATE checkins SET
+                    checkin_ts = CAST(strftime('%s', NEW.checkin_time) AS INTEGER),
+                    checkout_ts = CAST(strftime('%s', NEW.checkout_time) AS INTEGER),
+                    work_date = {WORK_DATE_SQL.format("NEW.checkin_time")}
+                WHERE id = NEW.id;
+            END
+        ''')
+    fixed = conn.execute(f'''
+        UPDATE checkins SET work_date = {WORK_DATE_SQL.format("checkin_time")}
+        WHERE work_date <> {WORK_DATE_SQL.format("checkin_time")}
+    ''').rowcount
+    # The store is keyed on work_date
+    return fixed > 0
+
+MIGRATIONS = [
+    (1, "create checkins", _create_checkins),
+    (2, "epoch/work-date columns and time-range indexes", _add_time_columns),
+    (3, "geocode cache", _create_geocode_cache),
+    (4, "incremental baseline store", _create_baseline_store),
+    (5, "weekly hours by weekday", _create_weekly_hours),
+    (6, "org hierarchy and team daily rollups", _create_org_hierarchy),
+    (7, "open sessions", _create_open_sessions),
+    (8, "shared cache versions", _create_data_versions),
+    (9, "archived months", _create_archived_months),
+    (10, "check-in minute of day", _add_checkin_minute),
+    (11, "sites and local check-in clocks", _create_sites),
+    (12, "precomputed analytics", _create_precomputed_results),
+    (13, "ingest dead letters", _create_ingest_dead_letters),
+    (14, "precompute run claims", _create_precompute_claims),
+    (15, "auto-closed check-ins", _add_auto_closed),
+    (16, "site-local work dates", _local_work_dates),
+]
+
+############ PostgreSQL ############
+# A new PostgreSQL database gets the schema of migrations 1-8 in one go (the
+# SQLite ones above rely on PRAGMAs and triggers for upgrading old files) and
+# has them recorded as applied. Migrations after POSTGRES_BASELINE_VERSION run
+# on both backends, so they must stick to SQL both understand.
+
+POSTGRES_BASELINE_VERSION = 8
+
+POSTGRES_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS checkins (
+        id BIGSERIAL PRIMARY KEY,
+        employee_id TEXT,
+        checkin_time TEXT,
+        checkout_time TEXT,
+        latitude DOUBLE PRECISION,
+        longitude DOUBLE PRECISION,
+        context TEXT,
+        checkin_ts BIGINT,
+        checkout_ts BIGINT,
+        work_date TEXT
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_checkins_employee_ts ON checkins (employee_id, checkin_ts)",
+    "CREATE INDEX IF NOT EXISTS idx_checkins_work_date ON checkins (work_date)",
+    "CREATE INDEX IF NOT EXISTS idx_checkins_open ON checkins (employee_id, checkin_ts) WHERE checkout_time IS NULL",
+    '''
+    CREATE TABLE IF NOT EXISTS geocode_cache (
+        bucket TEXT PRIMARY KEY,
+        address TEXT,
+        resolved_at BIGINT,
+        last_used BIGINT
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_geocode_cache_last_used ON geocode_cache (last_used)",
+    '''
+    CREATE TABLE IF NOT EXISTS employee_stats (
+        employee_id TEXT PRIMARY KEY,
+        first_seen_id BIGINT,
+        recent TEXT,
+        checkin_count INTEGER,
+        lifetime_mean DOUBLE PRECISION,
+        lifetime_m2 DOUBLE PRECISION,
+        baseline_mean DOUBLE PRECISION,
+        baseline_stddev DOUBLE PRECISION,
+        shift DOUBLE PRECISION,
+        last_work_date TEXT,
+        first_checkin_minutes INTEGER
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_employee_stats_first_seen ON employee_stats (first_seen_id)",
+    '''
+    CREATE TABLE IF NOT EXISTS employee_daily (
+        employee_id TEXT,
+        work_date TEXT,
+        sessions INTEGER,
+        completed INTEGER,
+        hours DOUBLE PRECISION,
+        delta_sum DOUBLE PRECISION,
+        delta_sumsq DOUBLE PRECISION,
+        PRIMARY KEY (employee_id, work_date)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_employee_daily_work_date ON employee_daily (work_date)",
+    f'''
+    CREATE TABLE IF NOT EXISTS employee_weekly (
+        employee_id TEXT,
+        week_start TEXT,
+        {", ".join(f"{day} DOUBLE PRECISION DEFAULT 0" for day in baselines.WEEKDAY_COLUMNS)},
+        PRIMARY KEY (employee_id, week_start)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_employee_weekly_week_start ON employee_weekly (week_start)",
+    '''
+    CREATE TABLE IF NOT EXISTS org_units (
+        unit_id TEXT PRIMARY KEY,
+        name TEXT,
+        kind TEXT,
+        parent_id TEXT
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_org_units_parent ON org_units (parent_id)",
+    "CREATE TABLE IF NOT EXISTS employee_teams (employee_id TEXT PRIMARY KEY, team_id TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_employee_teams_team ON employee_teams (team_id)",
+    '''
+    CREATE TABLE IF NOT EXISTS team_daily (
+        team_id TEXT,
+        work_date TEXT,
+        sessions INTEGER,
+        completed INTEGER,
+        hours DOUBLE PRECISION,
+        PRIMARY KEY (team_id, work_date)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_team_daily_work_date ON team_daily (work_date)",
+    "CREATE TABLE IF NOT EXISTS open_sessions (employee_id TEXT PRIMARY KEY, checkin_id BIGINT, checkin_ts BIGINT)",
+    "CREATE INDEX IF NOT EXISTS idx_open_sessions_checkin_ts ON open_sessions (checkin_ts)",
+    "CREATE TABLE IF NOT EXISTS data_versions (scope TEXT PRIMARY KEY, version BIGINT, origin TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_data_versions_version ON data_versions (version)",
+    "CREATE SEQUENCE IF NOT EXISTS data_versions_seq",
+)
+
+SCHEMA_MIGRATIONS_SQL = '''
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TEXT
+    )
+'''
+
+def _create_postgres_baseline(conn):
+    """On an empty PostgreSQL database, create the baseline schema. Safe to race from several nodes."""
+    with write_transaction(conn):
+        conn.execute(SCHEMA_MIGRATIONS_SQL)
+        if conn.execute("SELECT COUNT(*) FROM schema_migrations").fetchone()[0]:
+            return
+        for statement in POSTGRES_SCHEMA:
+            conn.execute(statement)
+        conn.executemany(
+            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+            [(version, name, datetime.now().isoformat()) for version, name, _ in MIGRATIONS if version <= POSTGRES_BASELINE_VERSION]
+        )
+
+def _applied(conn):
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+def migrate(conn):
+    """
+    Apply pending migrations. Safe to run from several processes at once (every
+    API worker does at startup): each migration runs in a write transaction that
+    excludes every other writer (BEGIN IMMEDIATE on SQLite, the store-wide
+    advisory lock on PostgreSQL), re-reads schema_migrations inside it and
+    commits together with its row, so exactly one process applies it.
+    """
+    sqlite = dialect(conn).name == "sqlite"
+    if sqlite:
+        # Wait out another process's migration (a backfill can hold the lock for minutes)
+        busy_timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+        conn.execute(f"PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT_MS}")
+    try:
+        if sqlite:
+            with write_transaction(conn):
+                conn.execute(SCHEMA_MIGRATIONS_SQL)
+        else:
+            _create_postgres_baseline(conn)
+
+        rebuild_store = False
+        for version, name, apply in MIGRATIONS:
+            if version in _applied(conn):
+                continue
+            with write_transaction(conn):
+                if version in _applied(conn):
+                    continue   # another process got there first
+                rebuild_store = apply(conn) or rebuild_store
+                conn.execute(
+                    "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                    (version, name, datetime.now().isoformat())
+                )
+    finally:
+        if sqlite:
+            conn.execute(f"PRAGMA busy_timeout = {busy_timeout}")
+
+    if rebuild_store:
+        baselines.rebuild(conn)
+
+if __name__ == "__main__":
+    # Run from backend/: python -m engine.utils.migrations [db_path or DATABASE_URL]
+    import sys
+    conn = connect(sys.argv[1] if len(sys.argv) > 1 else DATABASE)
+    migrate(conn)
+    if dialect(conn).name == "sqlite":
+        print(f"Backfilled {backfill_time_columns(conn)} rows")
+    conn.close()
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import threading
+from engine.models.nudges import nudges_for_employees
+
+#####Live nudges over Server-Sent Events
+# After a write commits, the writer re-evaluates the nudge rules of just the
+# employees it touched (one indexed employee_stats lookup) and hands nudges it
+# hasn't pushed before to the event loop, which fans them out to subscribers.
+# Each subscriber has a bounded buffer: a slow dashboard loses its oldest
+# nudges (and is told how many) instead of growing memory.
+
+SUBSCRIBER_BUFFER = 100
+MAX_SUBSCRIBERS = 500
+KEEPALIVE_SECONDS = 15
+RETRY_MILLISECONDS = 5000
+
+_CLOSE = object()
+
+class TooManySubscribers(Exception):
+    pass
+
+class Subscriber:
+    def __init__(self, employees=None, buffer_size=SUBSCRIBER_BUFFER):
+        self.employees = frozenset(employees) if employees else None
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = 0
+        self.reported_dropped = 0
+
+    def wants(self, employee_id):
+        return self.employees is None or employee_id in self.employees
+
+    def offer(self, item):
+        """Queue item, dropping the oldest one when the buffer is full. Event loop only."""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(item)
+
+class NudgeHub:
+    def __init__(self, buffer_size=SUBSCRIBER_BUFFER, max_subscribers=MAX_SUBSCRIBERS):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._loop = None
+        self._lock = threading.Lock()
+        # Identities of the nudges last pushed per employee, so a re-evaluation only sends new ones
+        self._sent = {}
+        self.stats = {"evaluations": 0, "published": 0, "delivered": 0, "dropped": 0}
+
+    def subscribe(self, employees=None):
+        if len(self._subscribers) >= self.max_subscribers:
+            raise TooManySubscribers()
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(employees, self.buffer_size)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+        self.stats["dropped"] += subscriber.dropped
+
+    def _watched(self):
+        """The employees some subscriber listens to; None if one listens to everyone."""
+        watched = set()
+        for subscriber in list(self._subscribers):
+            if subscriber.employees is None:
+                return None
+            watched |= subscriber.employees
+        return watched
+
+    def evaluate(self, conn, employee_ids):
+        """Called by writers after their commit, on the DB thread. A no-op without subscribers."""
+        if not self._subscribers:
+            return
+        employee_ids = set(employee_ids)
+        watched = self._watched()
+        if watched is not None:
+            employee_ids &= watched
+        if not employee_ids:
+            return
+
+        current = nudges_for_employees(conn, employee_ids)
+        new = []
+        with self._lock:
+            self.stats["evaluations"] += len(employee_ids)
+            for employee_id in employee_ids:
+                nudges = current.get(employee_id, [])
+                sent = self._sent.get(employee_id, set())
+                new.extend(n for identity, n in nudges if identity not in sent)
+                if nudges:
+                    self._sent[employee_id] = {identity for identity, _ in nudges}
+                else:
+                    self._sent.pop(employee_id, None)
+        if new and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._publish, new)
+
+    def _publish(self, nudges):
+        self.stats["published"] += len(nudges)
+        for subscriber in list(self._subscribers):
+            for nudge in nudges:
+                if subscriber.wants(nudge["employee_id"]):
+                    subscriber.offer(nudge)
+                    self.stats["delivered"] += 1
+
+    async def events(self, subscriber, keepalive=KEEPALIVE_SECONDS):
+        """SSE frames for one subscriber until it disconnects or the hub closes."""
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            while True:
+                try:
+                    item = await asyncio.wait_for(subscriber.queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is _CLOSE:
+                    return
+                if subscriber.dropped > subscriber.reported_dropped:
+                    # The client missed some; it can refetch /nudges to catch up
+                    yield f"event: dropped\ndata: {json.dumps({'dropped': subscriber.dropped - subscriber.reported_dropped})}\n\n"
+                    subscriber.reported_dropped = subscriber.dropped
+                yield f"event: nudge\ndata: {json.dumps(item)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def close(self):
+        """End every open stream (shutdown)."""
+        for subscriber in list(self._subscribers):
+            subscriber.offer(_CLOSE)
+
+    def metrics(self):
+        return {
+            "subscribers": len(self._subscribers),
+            "max_subscribers": self.max_subscribers,
+            "buffer_size": self.buffer_size,
+            "employees_tracked": len(self._sent),
+            "evaluations": self.stats["evaluations"],
+            "published": self.stats["published"],
+            "delivered": self.stats["delivered"],
+            "dropped": self.stats["dropped"] + sum(s.dropped for s in list(self._subscribers)),
+        }
+
+nudge_hub = NudgeHub()
@@ -0,0 +1,181 @@
+from functools import lru_cache
+import time
+from engine.utils.metrics import TRACED_ITER_BATCH, current as current_request
+
+try:
+    import psycopg
+    from psycopg.adapt import Loader
+    from psycopg.pq import TransactionStatus
+except ImportError:   # only needed when DATABASE_URL points at PostgreSQL
+    psycopg = None
+
+#####PostgreSQL storage
+# The engine's SQL is written for sqlite3 (qmark parameters, conn.execute(),
+# commit()/rollback(), `with conn:`). PostgresConnection gives a psycopg
+# connection that same surface, so the models run unchanged on either backend;
+# the few statements that really differ go through the dialect (utils/db.py).
+# Connections run in autocommit mode: reads never hold a transaction open, and
+# write_transaction() issues an explicit BEGIN plus the advisory locks below.
+
+# psycopg prepares a statement server-side once it has run this many times on a connection
+PREPARE_THRESHOLD = 5
+# Taken shared by keyed writers and exclusively by whole-store writers (rebuilds, org changes)
+STORE_LOCK = 0x50414C41
+
+ERRORS = (psycopg.Error,) if psycopg else ()
+
+if psycopg:
+    class NumericLoader(Loader):
+        """SUM() over integers comes back as numeric; load it as int/float like SQLite does."""
+
+        def load(self, data):
+            text = bytes(data).decode()
+            try:
+                return int(text)
+            except ValueError:
+                return float(text)
+
+def is_postgres_url(database):
+    return database.startswith(("postgresql://", "postgres://"))
+
+@lru_cache(maxsize=1024)
+def translate(sql):
+    """qmark placeholders to psycopg's %s (literal % doubled first)."""
+    return sql.replace("%", "%%").replace("?", "%s")
+
+class PostgresCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        # Stats of the request being served, if any (utils/metrics.py)
+        self._stats = current_request()
+
+    def _timed(self, method, *args, queries=0):
+        if self._stats is None:
+            return method(*args)
+        started = time.perf_counter()
+        result = method(*args)
+        rows = len(result) if isinstance(result, list) else int(result is not None and not queries)
+        self._stats.add_sql(time.perf_counter() - started, queries, rows)
+        return result
+
+    def execute(self, sql, params=()):
+        self._timed(self._cursor.execute, translate(sql), params, queries=1)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._timed(self._cursor.executemany, translate(sql), seq_of_params, queries=1)
+        return self
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchmany(self, size):
+        return self._timed(self._cursor.fetchmany, size)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def __iter__(self):
+        if self._stats is None:
+            return iter(self._cursor)
+        return self._traced_iter()
+
+    def _traced_iter(self):
+        # Timed per batch, not per row
+        while True:
+            rows = self.fetchmany(TRACED_ITER_BATCH)
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        self._cursor.close()
+
+class PostgresConnection:
+    def __init__(self, raw):
+        self.raw = raw
+
+    @property
+    def dialect(self):
+        return POSTGRES
+
+    def cursor(self):
+        return PostgresCursor(self.raw.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    @property
+    def in_transaction(self):
+        return self.raw.info.transaction_status != TransactionStatus.IDLE
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        # Like sqlite3: the block is one transaction, committed on success
+        if not self.in_transaction:
+            self.raw.execute("BEGIN")
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+def connect(url):
+    if psycopg is None:
+        raise RuntimeError("DATABASE_URL points at PostgreSQL but psycopg is not installed (pip install 'psycopg[binary]').")
+    raw = psycopg.connect(url, autocommit=True, prepare_threshold=PREPARE_THRESHOLD)
+    raw.adapters.register_loader("numeric", NumericLoader)
+    return PostgresConnection(raw)
+
+class PostgresDialect:
+    name = "postgresql"
+
+    def begin_write(self, conn, lock_keys=None):
+        """
+        BEGIN plus advisory locks instead of SQLite's database-wide write lock:
+        writers that name the employees they touch only wait for writers of the
+        same employees (on any API node); lock_keys=None locks the whole store.
+        """
+        conn.execute("BEGIN")
+        if lock_keys is None:
+            conn.execute("SELECT pg_advisory_xact_lock(?)", (STORE_LOCK,))
+            return
+        conn.execute("SELECT pg_advisory_xact_lock_shared(?)", (STORE_LOCK,))
+        keys = sorted(set(lock_keys))   # one order everywhere, so writers can't deadlock
+        if keys:
+            conn.execute('''
+                SELECT pg_advisory_xact_lock(hashtextextended(k, 0))
+                FROM unnest(?::text[]) WITH ORDINALITY AS u(k, n)
+                ORDER BY n
+            ''', (keys,))
+
+    def week_start(self, column):
+        return f"TO_CHAR(DATE_TRUNC('week', CAST({column} AS DATE)), 'YYYY-MM-DD')"
+
+    def allocate_ids(self, conn, table, count):
+        return [row[0] for row in conn.execute(
+            "SELECT nextval(pg_get_serial_sequence(?, 'id')) FROM generate_series(1, ?)", (table, count)
+        )]
+
+    def next_data_version(self, conn):
+        return conn.execute("SELECT nextval('data_versions_seq')").fetchone()[0]
+
+POSTGRES = PostgresDialect()
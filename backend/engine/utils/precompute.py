@@ -0,0 +1,335 @@
+from datetime import date, datetime, timedelta
+import asyncio
+import json
+import os
+import socket
+import time
+from engine.utils import db
+from engine.utils.cache import versions
+from engine.utils.db import database, upsert_sql, write_transaction
+from engine.utils.executor import SHARD_SIZE, AnalyticsExecutor
+
+############ Nightly precomputed analytics ###################
+# /nudges, /risk-radar and /forecast compute on request, which is when managers
+# open the dashboard. This job computes all three for every employee once a
+# day, after the day closes (PRECOMPUTE_AT, server time), and stores one row
+# per kind and employee in precomputed_results with the run's computed_at. The
+# endpoints serve today's run when it was computed with the parameters asked
+# for (precomputed_or_live) and compute on request otherwise or with
+# ?fresh=true. Check-ins written since the run show up in fresh results and on
+# /nudges/stream. Nudges are split: only the history-based behavior-shift
+# nudges are stored, and /nudges adds today's unusual check-ins live from
+# employee_stats (precomputed_nudges), since at PRECOMPUTE_AT nobody has
+# checked in yet today. Employees are split into shards computed by a process pool
+# of its own (utils/executor.py, PRECOMPUTE_WORKERS, stopped after the run);
+# the parent stores the merged results in one transaction, in first check-in
+# order like the on-request results.
+#
+# Run it in its own process: python -m engine.utils.precompute serve
+# or set PRECOMPUTE_AT to have the API processes schedule it. Scheduled runs
+# first claim the day in precompute_claims (claim_run), so of all the processes
+# waking up at PRECOMPUTE_AT exactly one computes; a claim left by a process
+# that died is taken over after PRECOMPUTE_CLAIM_SECONDS.
+
+# "HH:MM" server time; empty: the API processes don't schedule the job
+PRECOMPUTE_AT = os.environ.get("PRECOMPUTE_AT", "")
+PRECOMPUTE_WORKERS = int(os.environ.get("PRECOMPUTE_WORKERS", os.cpu_count() or 1))
+PRECOMPUTE_CLAIM_SECONDS = int(os.environ.get("PRECOMPUTE_CLAIM_SECONDS", 6 * 3600))
+
+KINDS = ("nudges", "risks", "forecast")
+LOOKUP_CHUNK_SIZE = 500
+
+def precompute_params():
+    """The parameters each kind is precomputed with: the endpoints' defaults."""
+    # Imported here (and in compute_shard): the endpoints serving these results import this module
+    from engine.models.forecasting import HISTORY_WEEKS
+    from engine.models.riskradar import LOOKBACK_DAYS
+    from engine.models.nudges import BEHAVIOR_SHIFT
+    return {
+        "nudges": {"rules": [BEHAVIOR_SHIFT]},
+        "risks": {"lookback_days": LOOKBACK_DAYS},
+        "forecast": {
+            "country": os.environ.get("PRECOMPUTE_FORECAST_COUNTRY", "IN"),
+            "region": os.environ.get("PRECOMPUTE_FORECAST_REGION", "MH"),
+            "weeks": 1,
+            "history_weeks": HISTORY_WEEKS,
+        },
+    }
+
+def compute_shard(conn, employees):
+    """Every kind for one shard: ({kind: {employee_id: items}}, forecast holidays)."""
+    from engine.models.forecasting import forecast_employees
+    from engine.models.nudges import BEHAVIOR_SHIFT, nudges_for_employees
+    from engine.models.riskradar import assess_risks
+
+    params = precompute_params()
+    results = {kind: {employee_id: [] for employee_id in employees} for kind in KINDS}
+    for employee_id, nudges in nudges_for_employees(conn, employees).items():
+        results["nudges"][employee_id] = [nudge for _, nudge in nudges if nudge["summary"] == BEHAVIOR_SHIFT]
+    for risk in assess_risks(conn, employees, None, params["risks"]["lookback_days"])["risks"]:
+        results["risks"][risk["employee_id"]].append(risk)
+    forecast_params = params["forecast"]
+    forecast = forecast_employees(
+        conn, employees, forecast_params["country"], forecast_params["region"], forecast_params["weeks"],
+        None, forecast_params["history_weeks"]
+    )
+    for row in forecast["forecast"]:
+        results["forecast"][row["employee_id"]].append(row)
+    return results, forecast["holidays"]
+
+def compute_all(database_url=None, workers=PRECOMPUTE_WORKERS, shard_size=SHARD_SIZE):
+    """
+    Every kind for every employee: ({kind: [(employee_id, items), ...]} in first
+    check-in order, {kind: extra response fields}).
+    """
+    database_url = database_url or db.DATABASE
+    conn = db.connect(database_url, read_only=True)
+    try:
+        employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY first_seen_id")]
+    finally:
+        conn.close()
+
+    workers = max(1, min(workers, -(-len(employees) // shard_size)))
+    with AnalyticsExecutor(workers, shard_size) as executor:
+        parts = executor.map(compute_shard, employees, database=database_url)
+
+    merged = {kind: [] for kind in KINDS}
+    holidays = []
+    for results, holidays in parts:
+        for kind, items in results.items():
+            merged[kind] += list(items.items())
+    return merged, {"forecast": {"holidays": holidays}}
+
+RUN_COLUMNS = ("kind", "params", "as_of", "computed_at", "employees", "seconds", "meta")
+
+def save_results(conn, merged, meta, as_of, computed_at, seconds):
+    params = precompute_params()
+    with write_transaction(conn):
+        for kind, rows in merged.items():
+            conn.execute("DELETE FROM precomputed_results WHERE kind = ?", (kind,))
+            conn.executemany('''
+                INSERT INTO precomputed_results (kind, employee_id, position, payload, computed_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', ((kind, employee_id, i, json.dumps(items), computed_at) for i, (employee_id, items) in enumerate(rows)))
+            conn.execute(upsert_sql("precomputed_runs", RUN_COLUMNS, ("kind",)), (
+                kind, json.dumps(params[kind], sort_keys=True), as_of, computed_at,
+                len(rows), seconds, json.dumps(meta.get(kind, {}))
+            ))
+    # Cached responses were computed on request or from the previous run
+    versions.bump(conn=conn)
+
+def precompute(conn, database_url=None, workers=PRECOMPUTE_WORKERS):
+    """Compute and store every kind for every employee; returns a summary of the run."""
+    as_of, computed_at = date.today().isoformat(), datetime.now().isoformat(timespec="seconds")
+    started = time.perf_counter()
+    merged, meta = compute_all(database_url, workers)
+    seconds = round(time.perf_counter() - started, 3)
+    save_results(conn, merged, meta, as_of, computed_at, seconds)
+    return {"as_of": as_of, "computed_at": computed_at, "employees": len(merged["nudges"]), "workers": workers, "seconds": seconds}
+
+############ Serving ###################
+
+def todays_run(conn, kind, params):
+    """(params, as_of, computed_at, meta) of today's `kind` run with these parameters, else None."""
+    run = conn.execute(
+        "SELECT params, as_of, computed_at, meta FROM precomputed_runs WHERE kind = ?", (kind,)
+    ).fetchone()
+    if run is None or run[0] != json.dumps(params, sort_keys=True) or run[1] != date.today().isoformat():
+        return None
+    return run
+
+def precomputed(conn, kind, params, employees=None):
+    """
+    `kind` items of today's run with its computed_at, for every employee or for
+    `employees` in the order given; None when there is no run for today, it used
+    other parameters or it lacks one of the employees.
+    """
+    run = todays_run(conn, kind, params)
+    if run is None:
+        return None
+
+    if employees is None:
+        rows = conn.execute("SELECT payload FROM precomputed_results WHERE kind = ? ORDER BY position", (kind,))
+        items = [item for (payload,) in rows for item in json.loads(payload)]
+    else:
+        payloads = {}
+        unique = sorted(set(employees))
+        for i in range(0, len(unique), LOOKUP_CHUNK_SIZE):
+            chunk = unique[i:i + LOOKUP_CHUNK_SIZE]
+            payloads.update(conn.execute(
+                f"SELECT employee_id, payload FROM precomputed_results WHERE kind = ? AND employee_id IN ({','.join('?' * len(chunk))})",
+                [kind, *chunk]
+            ))
+        if len(payloads) < len(unique):
+            return None
+        items = [item for employee_id in employees for item in json.loads(payloads[employee_id])]
+    return {kind: items, **json.loads(run[3]), "computed_at": run[2]}
+
+def precomputed_or_live(conn, kind, params, employees, live, *args):
+    """The precomputed result when today's run covers the request, else live(conn, *args)."""
+    result = precomputed(conn, kind, params, employees)
+    return result if result is not None else live(conn, *args)
+
+def precomputed_nudges(conn):
+    """
+    Tonight's behavior-shift nudges with today's unusual check-ins applied live,
+    in generate_nudges' order; None when there is no run for today.
+    """
+    from engine.models.nudges import unusual_checkins
+    run = todays_run(conn, "nudges", precompute_params()["nudges"])
+    if run is None:
+        return None
+    unusual = unusual_checkins(conn)
+    nudges = []
+    for employee_id, payload in conn.execute(
+        "SELECT employee_id, payload FROM precomputed_results WHERE kind = ? ORDER BY position", ("nudges",)
+    ):
+        nudges += unusual.pop(employee_id, []) + json.loads(payload)
+    # Employees first seen after the run come last in first check-in order too
+    nudges += [nudge for items in unusual.values() for nudge in items]
+    return {"nudges": nudges, **json.loads(run[3]), "computed_at": run[2]}
+
+def precomputed_nudges_or_live(conn):
+    from engine.models.nudges import generate_nudges
+    result = precomputed_nudges(conn)
+    return result if result is not None else generate_nudges(conn)
+
+############ Run claims ###################
+
+def claim_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def claim_run(conn, as_of, owner, stale_seconds=PRECOMPUTE_CLAIM_SECONDS):
+    """
+    Claim the run for as_of in one statement; True for the one caller that gets
+    it. A claim older than stale_seconds (its process died) can be taken over.
+    """
+    now = datetime.now()
+    stale_before = (now - timedelta(seconds=stale_seconds)).isoformat(timespec="seconds")
+    with write_transaction(conn, lock_keys=[]):
+        claimed = conn.execute('''
+            INSERT INTO precompute_claims (as_of, claimed_at, owner) VALUES (?, ?, ?)
+            ON CONFLICT (as_of) DO UPDATE SET claimed_at = excluded.claimed_at, owner = excluded.owner
+            WHERE precompute_claims.claimed_at < ?
+        ''', (as_of, now.isoformat(timespec="seconds"), owner, stale_before)).rowcount
+    return claimed == 1
+
+def release_claim(conn, as_of, owner):
+    """Give up a claim after a failed run, so another process (or the next attempt) can run it."""
+    with write_transaction(conn, lock_keys=[]):
+        conn.execute("DELETE FROM precompute_claims WHERE as_of = ? AND owner = ?", (as_of, owner))
+
+############ Scheduler ###################
+
+def seconds_until(at, now=None):
+    """Seconds from now to the next "HH:MM" (server time)."""
+    now = now or datetime.now()
+    hour, minute = map(int, at.split(":"))
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+class Precomputer:
+    """Background task that runs the precomputation daily at `at` (disabled when it is empty)."""
+
+    def __init__(self, at=PRECOMPUTE_AT, workers=PRECOMPUTE_WORKERS):
+        self.at = at
+        self.workers = workers
+        self._task = None
+        self.runs = 0
+        self.skipped = 0
+        self.last_run = None
+        self.last_result = None
+
+    async def run_once(self, force=False):
+        as_of, computed_at = date.today().isoformat(), datetime.now().isoformat(timespec="seconds")
+        owner = claim_owner()
+        # Every API process schedules the job; only the one that claims the day starts a pool
+        if not force and not await database.run(claim_run, as_of, owner):
+            self.skipped += 1
+            return None
+        started = time.perf_counter()
+        try:
+            # The shards run in worker processes; this only holds a DB thread for the write
+            merged, meta = await asyncio.to_thread(compute_all, db.DATABASE, self.workers)
+            seconds = round(time.perf_counter() - started, 3)
+            await database.run(save_results, merged, meta, as_of, computed_at, seconds)
+        except BaseException:
+            if not force:
+                await database.run(release_claim, as_of, owner)
+            raise
+        self.runs += 1
+        self.last_run = computed_at
+        self.last_result = {"as_of": as_of, "employees": len(merged["nudges"]), "seconds": seconds}
+        return self.last_result
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(seconds_until(self.at))
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Precomputing analytics failed: {e}")
+
+    async def start(self):
+        if self.at:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self):
+        return {
+            "running": self._task is not None,
+            "at": self.at,
+            "workers": self.workers,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+            "last_result": self.last_result,
+        }
+
+precomputer = Precomputer()
+
+if __name__ == "__main__":
+    # Run from backend/: python -m engine.utils.precompute [run|serve|status] [--at HH:MM] [--workers N] [--db path]
+    import argparse
+    from engine.utils.migrations import migrate
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["run", "serve", "status"])
+    parser.add_argument("--at", default=PRECOMPUTE_AT or "01:00", help="daily run time for serve (server time)")
+    parser.add_argument("--workers", type=int, default=PRECOMPUTE_WORKERS)
+    parser.add_argument("--db", default=db.DATABASE)
+    args = parser.parse_args()
+
+    conn = db.connect(args.db)
+    migrate(conn)
+    if args.command == "run":
+        print(precompute(conn, args.db, args.workers))
+    elif args.command == "serve":
+        owner = claim_owner()
+        while True:
+            time.sleep(seconds_until(args.at))
+            as_of = date.today().isoformat()
+            try:
+                if claim_run(conn, as_of, owner):
+                    try:
+                        print(precompute(conn, args.db, args.workers), flush=True)
+                    except BaseException:
+                        release_claim(conn, as_of, owner)
+                        raise
+            except Exception as e:
+                print(f"Precomputing analytics failed: {e}", flush=True)
+    else:
+        for kind, as_of, computed_at, employees, seconds in conn.execute(
+            "SELECT kind, as_of, computed_at, employees, seconds FROM precomputed_runs ORDER BY kind"
+        ):
+            print(f"{kind}: {employees} employees as of {as_of}, computed {computed_at} in {seconds}s")
+    conn.close()
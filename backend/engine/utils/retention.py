@@ -0,0 +1,271 @@
+import asyncio
+from datetime import date, datetime
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from engine.utils.columnar import CHECKINS_SCHEMA, EXPORT_DIR, export_parquet
+from engine.utils.db import database, upsert_sql, write_transaction
+
+#####Retention: the live checkins table keeps recent months, older ones are archived
+# The Parquet export (utils/columnar.py) already partitions check-ins by month
+# (EXPORT_DIR/checkins/month=YYYY-MM/). Once a month is older than
+# RETENTION_MONTHS full months, archive_expired() rewrites its partition as one
+# zstd file sorted by employee and time, checks that every live row of the month
+# is in it, and deletes those rows from checkins in one transaction, recording
+# the month and the highest id it covers in archived_months.
+# The daily/weekly aggregates (employee_daily, employee_weekly, team_daily) are
+# never deleted, so nudges, risk, forecast, capacity and the dashboard keep their
+# full history and only ever read the maintained stores and a small live table.
+# Raw history reads go through archived_checkins()/archived_rows(): the raw
+# timeline only opens Parquet files when its range reaches an archived month,
+# and baselines.rebuild() merges archived rows back in id order.
+# A check-in written late for an archived month stays in checkins (its id is
+# above the month's last_id) until the next run archives it too.
+# Run the archiver on one API node only (ARCHIVE_INTERVAL_SECONDS=0 on the
+# others) and put EXPORT_DIR on storage every node can read.
+
+# 0 keeps every check-in in the live table
+RETENTION_MONTHS = int(os.environ.get("RETENTION_MONTHS", 0))
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get("ARCHIVE_INTERVAL_SECONDS", 24 * 3600))
+ARCHIVE_COMPRESSION = "zstd"
+# Files are sorted by employee, so row-group statistics let per-employee reads skip most of a month
+ARCHIVE_ROW_GROUP_SIZE = 16384
+
+def add_months(day, months):
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    return date(year, month + 1, 1)
+
+def retention_cutoff(today=None, months=RETENTION_MONTHS):
+    """First day kept in the live table: the current month and `months` full months before it."""
+    today = today or date.today()
+    return add_months(today.replace(day=1), -months)
+
+def month_dir(month, export_dir=EXPORT_DIR):
+    return os.path.join(export_dir, "checkins", f"month={month}")
+
+def month_files(month, export_dir=EXPORT_DIR):
+    path = month_dir(month, export_dir)
+    if not os.path.isdir(path):
+        return []
+    return [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.startswith("part-")]
+
+def archived_months(conn):
+    """month (YYYY-MM) -> highest check-in id of that month moved out of the live table."""
+    return dict(conn.execute("SELECT month, last_id FROM archived_months ORDER BY month").fetchall())
+
+def write_archive_month(month, export_dir=EXPORT_DIR):
+    """
+    Rewrite one month of the export as a single compressed file sorted by
+    (employee_id, checkin_time, id); returns the ids it holds. The new file
+    replaces the first part before the others are removed, so a crash in
+    between leaves duplicates, which the next run drops, never a gap.
+    """
+    parts = month_files(month, export_dir)
+    table = pa.concat_tables(pq.read_table(p, schema=CHECKINS_SCHEMA) for p in parts)
+    _, first = np.unique(table["id"].to_numpy(), return_index=True)
+    if len(first) < len(table):
+        table = table.take(pa.array(first))
+    table = table.sort_by([("employee_id", "ascending"), ("checkin_time", "ascending"), ("id", "ascending")])
+
+    tmp = os.path.join(month_dir(month, export_dir), ".archive.tmp")
+    pq.write_table(table, tmp, compression=ARCHIVE_COMPRESSION, row_group_size=ARCHIVE_ROW_GROUP_SIZE)
+    os.replace(tmp, parts[0])
+    for part in parts[1:]:
+        os.remove(part)
+    return table["id"]
+
+def archive_month(conn, month, exported_id, export_dir=EXPORT_DIR):
+    """
+    Move the live check-ins of one month to its Parquet partition. Returns the
+    number of rows deleted, or None when some are not exported yet (an open
+    session holds the export watermark back).
+    """
+    start = date.fromisoformat(f"{month}-01")
+    bounds = (start.isoformat(), add_months(start, 1).isoformat())
+    live = np.array([row[0] for row in conn.execute(
+        "SELECT id FROM checkins WHERE work_date >= ? AND work_date < ? ORDER BY id", bounds
+    )], dtype=np.int64)
+    if not len(live):
+        return 0
+    if live[-1] > exported_id:
+        return None
+
+    ids = write_archive_month(month, export_dir)
+    missing = np.count_nonzero(~np.isin(live, ids.to_numpy()))
+    if missing:
+        raise RuntimeError(f"{month}: {missing} check-ins are missing from the Parquet export; not archiving it")
+
+    last_id = int(live[-1])
+    with write_transaction(conn, lock_keys=()):
+        deleted = conn.execute(
+            "DELETE FROM checkins WHERE work_date >= ? AND work_date < ? AND id <= ?", bounds + (last_id,)
+        ).rowcount
+        (rows,) = conn.execute("SELECT COALESCE(SUM(row_count), 0) FROM archived_months WHERE month = ?", (month,)).fetchone()
+        conn.execute(
+            upsert_sql("archived_months", ("month", "last_id", "row_count", "archived_at"), ("month",)),
+            (month, last_id, rows + deleted, datetime.now().isoformat(timespec="seconds"))
+        )
+    return deleted
+
+def archive_expired(conn, export_dir=EXPORT_DIR, months=RETENTION_MONTHS, today=None):
+    """Export, then archive every month before the retention cutoff that still has live rows."""
+    cutoff = retention_cutoff(today, months)
+    export = export_parquet(conn, export_dir)
+    result = {"cutoff": cutoff.isoformat(), "exported": export["exported"], "archived": {}, "pending": []}
+
+    (first,) = conn.execute("SELECT MIN(work_date) FROM checkins").fetchone()
+    month = date.fromisoformat(first).replace(day=1) if first else cutoff
+    while month < cutoff:
+        key = month.strftime("%Y-%m")
+        deleted = archive_month(conn, key, export["last_id"], export_dir)
+        if deleted is None:
+            result["pending"].append(key)
+        elif deleted:
+            result["archived"][key] = deleted
+        month = add_months(month, 1)
+    return result
+
+############ Reading archived check-ins ###################
+
+def _read_month(month, last_id, columns, filter, export_dir):
+    files = month_files(month, export_dir)
+    if not files:
+        return None
+    # Parts exported after the month was archived hold rows that are still live: only up to last_id
+    condition = pc.field("id") <= last_id
+    if filter is not None:
+        condition = condition & filter
+    return ds.dataset(files, format="parquet", schema=CHECKINS_SCHEMA).to_table(columns=columns, filter=condition)
+
+def archived_checkins(conn, employee_id, start=None, end=None, export_dir=EXPORT_DIR):
+    """
+    One employee's archived check-ins between start and end (dates, inclusive)
+    as the timeline's (checkin_ts, id, checkout_ts, work_date, checkin_minute,
+    context) rows, ordered by (checkin_ts, id). Empty without opening any file
+    when no archived month overlaps the range.
+    """
+    months = archived_months(conn)
+    first = start.strftime("%Y-%m") if start else ""
+    last = end.strftime("%Y-%m") if end else "9999-12"
+    tables = []
+    for month, last_id in months.items():
+        if first <= month <= last:
+            table = _read_month(month, last_id, ["id", "checkin_time", "checkout_time", "work_date", "checkin_minute", "context"],
+                                pc.field("employee_id") == employee_id, export_dir)
+            if table is not None:
+                tables.append(table)
+    if not tables:
+        return []
+
+    table = pa.concat_tables(tables)
+    rows = list(zip(
+        pc.cast(table["checkin_time"], pa.int64()).to_pylist(), table["id"].to_pylist(),
+        pc.cast(table["checkout_time"], pa.int64()).to_pylist(), pc.cast(table["work_date"], pa.string()).to_pylist(),
+        pc.cast(table["checkin_minute"], pa.int64()).to_pylist(), table["context"].to_pylist()
+    ))
+    # By local work date, like the live query
+    first, last = start.isoformat() if start else "", end.isoformat() if end else "9999-12-31"
+    return sorted(r for r in rows if first <= r[3] <= last)
+
+def archived_rows(conn, export_dir=EXPORT_DIR, batch_size=65536):
+    """
+    Every archived check-in as the (id, employee_id, checkin_ts, checkout_ts,
+    work_date, checkin_minute, expected_start_minute) rows baselines.rebuild()
+    reads, in id order.
+    """
+    tables = []
+    columns = ["id", "employee_id", "checkin_time", "checkout_time", "work_date", "checkin_minute", "expected_start_minute"]
+    for month, last_id in archived_months(conn).items():
+        table = _read_month(month, last_id, columns, None, export_dir)
+        if table is not None:
+            tables.append(table)
+    if not tables:
+        return
+    table = pa.concat_tables(tables).sort_by("id")
+    for batch in table.to_batches(max_chunksize=batch_size):
+        yield from zip(
+            batch["id"].to_pylist(), batch["employee_id"].to_pylist(),
+            pc.cast(batch["checkin_time"], pa.int64()).to_pylist(), pc.cast(batch["checkout_time"], pa.int64()).to_pylist(),
+            pc.cast(batch["work_date"], pa.string()).to_pylist(), pc.cast(batch["checkin_minute"], pa.int64()).to_pylist(),
+            pc.cast(batch["expected_start_minute"], pa.int64()).to_pylist()
+        )
+
+############ Background job ###################
+
+class Archiver:
+    """Background task that runs archive_expired every interval (disabled when RETENTION_MONTHS is 0)."""
+
+    def __init__(self, months=RETENTION_MONTHS, interval=ARCHIVE_INTERVAL_SECONDS, export_dir=EXPORT_DIR):
+        self.months = months
+        self.interval = interval
+        self.export_dir = export_dir
+        self._task = None
+        self.archived_total = 0
+        self.last_run = None
+        self.last_result = None
+
+    async def run_once(self):
+        result = await database.run(archive_expired, self.export_dir, self.months)
+        self.archived_total += sum(result["archived"].values())
+        self.last_run = datetime.now().isoformat(timespec="seconds")
+        self.last_result = result
+        return result
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Archiving check-ins failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if self.months > 0 and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self):
+        return {
+            "running": self._task is not None,
+            "retention_months": self.months,
+            "interval_seconds": self.interval,
+            "archived_total": self.archived_total,
+            "last_run": self.last_run,
+            "last_result": self.last_result,
+        }
+
+archiver = Archiver()
+
+if __name__ == "__main__":
+    # Run from backend/: python -m engine.utils.retention [archive|status] [--months N] [--db path] [--dir path]
+    import argparse
+    from engine.utils.db import DATABASE, connect
+    from engine.utils.migrations import migrate
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["archive", "status"])
+    parser.add_argument("--months", type=int, default=RETENTION_MONTHS or 3)
+    parser.add_argument("--db", default=DATABASE)
+    parser.add_argument("--dir", default=EXPORT_DIR)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    migrate(conn)
+    if args.command == "archive":
+        print(archive_expired(conn, args.dir, args.months))
+    else:
+        for month, last_id, rows, archived_at in conn.execute(
+            "SELECT month, last_id, row_count, archived_at FROM archived_months ORDER BY month"
+        ):
+            print(f"{month}: {rows} check-ins up to id {last_id}, archived {archived_at}")
+    conn.close()
@@ -0,0 +1,81 @@
+from datetime import datetime, date, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+import calendar
+import os
+import threading
+
+# Integer columns written next to the ISO text ones so range filters can hit an index.
+# Naive datetimes are treated as UTC wall-clock, which is what SQLite's strftime('%s')
+# does with the stored strings; work date and minute of day are the clock as written
+# (substr of the text in SQL), so backfilled and freshly written rows agree.
+
+# Employees at a site (models/sites.py) are recorded on its timezone's clock. Others
+# use DEFAULT_TIMEZONE, or when it is unset, times as they arrive (naive ones as they
+# are) and this server's clock for the form check-ins.
+DEFAULT_TIMEZONE = os.environ.get("DEFAULT_TIMEZONE") or None
+# UTC offsets run from -12:00 to +14:00: a local day starts within this of the UTC one
+MAX_UTC_OFFSET_SECONDS = 14 * 3600
+
+_zones_seen = set()
+_zones_lock = threading.Lock()
+
+def epoch_seconds(dt: datetime):
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        return calendar.timegm(dt.timetuple())
+    return int(dt.timestamp())
+
+def work_date(dt: datetime):
+    """The date on the clock the time was recorded with: a site's local date, like minute_of_day()."""
+    if dt is None:
+        return None
+    return dt.date().isoformat()
+
+def minute_of_day(dt: datetime):
+    """Minutes since midnight on the clock the time was recorded with (what the baselines compare)."""
+    if dt is None:
+        return None
+    return dt.hour * 60 + dt.minute
+
+def local_minute(ts, tz):
+    """minute_of_day() of epoch seconds on the site's clock; without one, the UTC wall clock epoch_seconds() assumed."""
+    return minute_of_day(datetime.fromtimestamp(ts, tz or timezone.utc))
+
+def day_start_epoch(day: date):
+    return calendar.timegm(day.timetuple())
+
+@lru_cache(maxsize=None)
+def zone(name):
+    """ZoneInfo for an IANA name, None for None. Zones resolved here are part of today_key()."""
+    if name is None:
+        return None
+    tz = ZoneInfo(name)
+    with _zones_lock:
+        _zones_seen.add(name)
+    return tz
+
+def site_time(dt: datetime, tz):
+    """A time sent by a client, on the site's clock: naive times are the site's wall clock."""
+    if tz is None:
+        return dt
+    return dt.replace(tzinfo=tz) if dt.tzinfo is None else dt.astimezone(tz)
+
+def server_time(dt: datetime, tz):
+    """A time stamped by this server (datetime.now()), on the site's clock."""
+    # astimezone() reads a naive time as this server's local time
+    return dt if tz is None else dt.astimezone(tz)
+
+def local_fields(dt: datetime):
+    """(epoch seconds, work date, minute of day) of a time already on its site's clock."""
+    return epoch_seconds(dt), work_date(dt), minute_of_day(dt)
+
+def local_today(tz=None):
+    return datetime.now(tz).date() if tz is not None else date.today()
+
+def today_key():
+    """Today's date on this server and in every zone resolved so far: changes whenever any site's day does."""
+    with _zones_lock:
+        names = sorted(_zones_seen)
+    return (date.today().isoformat(),) + tuple(local_today(zone(name)).isoformat() for name in names)
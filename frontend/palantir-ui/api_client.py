@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --------------------------------------
+# HTTP client for the Palantir API
+# One pooled requests.Session (keep-alive, so reruns reuse TCP connections), a
+# small TTL cache keyed on path + params, and get_many() to fetch the endpoints
+# a page needs in parallel. Expired entries are revalidated with the ETag the
+# backend returned, so an unchanged result costs a 304 and no JSON.
+
+API_BASE_URL = "http://127.0.0.1:8000"
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 30
+POOL_SIZE = 8
+DEFAULT_TTL_SECONDS = 30
+MAX_CACHE_ENTRIES = 256
+
+class ApiClient:
+    def __init__(self, base_url=API_BASE_URL, pool_size=POOL_SIZE, max_entries=MAX_CACHE_ENTRIES):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        retries = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.max_entries = max_entries
+        self._cache = OrderedDict()   # key -> (expires_at, etag, body)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="api")
+        self.stats = {"hits": 0, "revalidated": 0, "fetched": 0}
+
+    @staticmethod
+    def _key(path, params):
+        if params is None:
+            return (path, ())
+        items = params.items() if isinstance(params, dict) else params
+        return (path, tuple((k, str(v)) for k, v in items))
+
+    def get(self, path, params=None, ttl=DEFAULT_TTL_SECONDS):
+        """GET path and return the decoded JSON, from the cache while it is fresh."""
+        key = self._key(path, params)
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            self.stats["hits"] += 1
+            return entry[2]
+
+        headers = {"If-None-Match": entry[1]} if entry and entry[1] else {}
+        response = self.session.get(
+            self.base_url + path, params=params, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)
+        )
+        if response.status_code == 304 and entry:
+            self.stats["revalidated"] += 1
+            body = entry[2]
+        else:
+            response.raise_for_status()
+            self.stats["fetched"] += 1
+            body = response.json()
+
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, response.headers.get("ETag"), body)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return body
+
+    def get_many(self, calls):
+        """
+        Run several get() calls concurrently. calls maps a name to (path, params, ttl);
+        returns name -> JSON, or the exception that call raised.
+        """
+        futures = {name: self._executor.submit(self.get, *call) for name, call in calls.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+        return results
+
+    def stream_lines(self, path, params=None, read_timeout=60):
+        """Yield decoded lines of a streaming response (Server-Sent Events)."""
+        with self.session.get(
+            self.base_url + path, params=params, stream=True, timeout=(CONNECT_TIMEOUT, read_timeout)
+        ) as response:
+            response.raise_for_status()
+            yield from response.iter_lines(decode_unicode=True)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -1,6 +1,7 @@
 import streamlit as st
-import requests
 import pandas as pd
+import json
+from api_client import ApiClient
 
 API_BASE_URL = "http://127.0.0.1:8000"
 
@@ -10,54 +11,130 @@ st.title("🧠 SmartOps AI Manager Dashboard")
 st.markdown("---")
 
 # Sidebar Navigation
-page = st.sidebar.selectbox("Select Page", ["🏠 Overview", "📊 Nudges", "📈 Employee Timeline", "📅 Forecast Capacity", "🚨 Risk Radar"])
+page = st.sidebar.selectbox("Select Page", ["🏠 Overview", "📊 Nudges", "📈 Employee Timeline", "📅 Forecast Capacity", "🏢 Team Capacity", "🚨 Risk Radar"])
 
 # --------------------------------------
 # UTILITY FUNCTIONS
+# One client per server process: its connection pool and response cache are
+# shared by every rerun and session (api_client.py).
+@st.cache_resource
+def get_client():
+    return ApiClient(API_BASE_URL)
+
+client = get_client()
+
+if st.sidebar.button("🔄 Refresh data"):
+    client.clear()
+
+# Seconds a response is reused before it is revalidated
+SUMMARY_TTL = 30
+NUDGES_TTL = 30
+ANALYTICS_TTL = 300
+
 def fetch_nudges():
     try:
-        response = requests.get(f"{API_BASE_URL}/nudges")
-        if response.status_code == 200:
-            return response.json()["nudges"]
+        return client.get("/nudges", ttl=NUDGES_TTL)["nudges"]
     except Exception as e:
         st.error(f"Error fetching nudges: {e}")
     return []
 
-def fetch_timeline(employee_id):
+def stream_nudges(employees=None):
+    """Yields nudges from /nudges/stream as they are pushed (runs until the page reruns)."""
+    params = [("employees", emp) for emp in employees or []]
+    event = None
+    for line in client.stream_lines("/nudges/stream", params=params):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:") and event == "nudge":
+            yield json.loads(line[len("data:"):])
+
+def show_nudge(nudge):
+    st.markdown(f"""
+        <div style='background:#fff3cd; padding:1rem; border-radius:8px;'>
+            <strong>👤 {nudge['employee_id']}</strong><br>
+            <b>{nudge['summary']}:</b> {nudge['nudge_message']}<br>
+            <b>Severity:</b> {nudge['severity']}
+        </div>
+    """, unsafe_allow_html=True)
+
+def fetch_timeline(employee_id, granularity="raw"):
     try:
-        response = requests.get(f"{API_BASE_URL}/timeline/" + employee_id)
-        if response.status_code == 200:
-            return response.json()
+        return client.get("/timeline/" + employee_id, {"granularity": granularity}, ttl=ANALYTICS_TTL)
     except Exception as e:
         st.error(f"Error fetching timeline: {e}")
     return None
 
-def fetch_forecast(employees, country="IN", region="MH"):
+def fetch_forecast(employees, country="IN", region="MH", weeks=1):
     try:
         params = [("employees", emp) for emp in employees]
-        params += [("country", country), ("region", region)]
-        response = requests.get(f"{API_BASE_URL}/forecast", params=params)
-        if response.status_code == 200:
-            return response.json()["forecast"]
+        params += [("country", country), ("region", region), ("weeks", weeks)]
+        return client.get("/forecast", params, ttl=ANALYTICS_TTL)["forecast"]
     except Exception as e:
         st.error(f"Error fetching forecast: {e}")
     return []
 
-def fetch_risks(employees):
+def fetch_capacity_rollup(level=None, unit_id=None):
     try:
-        params = [("employees", emp) for emp in employees]
-        response = requests.get(f"{API_BASE_URL}/risk-radar", params=params)
-        if response.status_code == 200:
-            return response.json()["risks"]
+        params = {k: v for k, v in {"level": level, "unit_id": unit_id}.items() if v}
+        return client.get("/capacity/rollup", params, ttl=ANALYTICS_TTL)
+    except Exception as e:
+        st.error(f"Error fetching capacity rollup: {e}")
+    return None
+
+def fetch_risks(employees, all_employees=False):
+    try:
+        if all_employees:
+            params = [("all_employees", "true")]
+        else:
+            params = [("employees", emp) for emp in employees]
+        return client.get("/risk-radar", params, ttl=ANALYTICS_TTL)["risks"]
     except Exception as e:
         st.error(f"Error fetching risks: {e}")
     return []
 
+def fetch_overview():
+    """Summary, nudges and the org capacity rollup, fetched concurrently."""
+    results = client.get_many({
+        "summary": ("/dashboard/summary", None, SUMMARY_TTL),
+        "nudges": ("/nudges", None, NUDGES_TTL),
+        "capacity": ("/capacity/rollup", {"level": "org"}, ANALYTICS_TTL),
+    })
+    for name, result in results.items():
+        if isinstance(result, Exception):
+            st.error(f"Error fetching {name}: {result}")
+            results[name] = None
+    return results
+
 # --------------------------------------
 # 🏠 Overview
 if page == "🏠 Overview":
     st.header("🏠 SmartOps Overview")
-    st.write("This page can show total check-ins, late % trends, etc.")
+    overview = fetch_overview()
+    summary = overview["summary"]
+    if summary:
+        cols = st.columns(5)
+        cols[0].metric("Total check-ins", f"{summary['total_checkins']:,}")
+        cols[1].metric("Checked in today", f"{summary['checked_in_today']:,}", help=f"of {summary['employees']:,} employees")
+        cols[2].metric("Late today", f"{summary['late_pct']}%", help=f"{summary['late_today']} first check-ins after the expected start")
+        cols[3].metric("Open sessions", f"{summary['open_sessions']:,}")
+        cols[4].metric("Risks", f"{summary['risks']['total']:,}")
+
+        if summary["risks"]["total"]:
+            left, right = st.columns(2)
+            left.subheader("Risks by severity")
+            left.bar_chart(pd.Series(summary["risks"]["by_severity"], name="risks"))
+            right.subheader("Risks by type")
+            right.bar_chart(pd.Series(summary["risks"]["by_type"], name="risks"))
+
+    capacity = overview["capacity"]
+    if capacity and capacity["units"]:
+        st.metric("Org weekly capacity (last 14 days)", f"{round(sum(u['avg_weekly_hours'] for u in capacity['units']), 1)} hrs")
+
+    nudges = overview["nudges"]
+    if nudges and nudges["nudges"]:
+        st.subheader(f"📊 Latest nudges ({len(nudges['nudges'])})")
+        for nudge in nudges["nudges"][:5]:
+            show_nudge(nudge)
 
 # 📊 Nudges
 elif page == "📊 Nudges":
@@ -69,22 +146,31 @@ elif page == "📊 Nudges":
         for nudge in nudges:
             if selected_emp != "All" and nudge["employee_id"] != selected_emp:
                 continue
-            st.markdown(f"""
-                <div style='background:#fff3cd; padding:1rem; border-radius:8px;'>
-                    <strong>👤 {nudge['employee_id']}</strong><br>
-                    <b>{nudge['summary']}:</b> {nudge['nudge_message']}<br>
-                    <b>Severity:</b> {nudge['severity']}
-                </div>
-            """, unsafe_allow_html=True)
+            show_nudge(nudge)
     else:
         st.info("No nudges found.")
 
+    if st.checkbox("Live updates"):
+        watch = st.text_input("Only these employees (comma-separated, empty for all)")
+        st.subheader("🔴 Live")
+        live = st.empty()
+        received = []
+        try:
+            for nudge in stream_nudges([e.strip() for e in watch.split(",") if e.strip()]):
+                received = [nudge] + received[:19]
+                with live.container():
+                    for n in received:
+                        show_nudge(n)
+        except Exception as e:
+            st.error(f"Live nudge stream interrupted: {e}")
+
 # 📈 Timeline
 elif page == "📈 Employee Timeline":
     st.header("📈 Employee Timeline")
     employee_id = st.text_input("Enter Employee ID (e.g. EMP001)")
+    granularity = st.selectbox("Granularity", ["daily", "weekly", "raw"])
     if st.button("Fetch Timeline") and employee_id:
-        timeline_data = fetch_timeline(employee_id)
+        timeline_data = fetch_timeline(employee_id, granularity)
         if timeline_data:
             df = pd.DataFrame(timeline_data["timeline"])
             st.dataframe(df)
@@ -97,22 +183,42 @@ elif page == "📅 Forecast Capacity":
     employee_ids = st.text_input("Enter comma-separated employee IDs", value="EMP001,EMP002")
     country = st.text_input("Country Code (e.g. IN, US)", value="IN")
     region = st.text_input("Region Code (e.g. MH, CA)", value="MH")
+    weeks = st.number_input("Weeks ahead", min_value=1, max_value=12, value=4)
     if st.button("Generate Forecast"):
         employees = [e.strip() for e in employee_ids.split(",") if e.strip()]
-        forecast = fetch_forecast(employees, country, region)
+        forecast = fetch_forecast(employees, country, region, weeks)
         if forecast:
             df = pd.DataFrame(forecast)
-            st.dataframe(df)
+            st.dataframe(df[["employee_id", "country", "region", "forecast_hours"]])
             total = df["forecast_hours"].sum()
-            st.success(f"Total Forecasted Hours: {total} hrs")
+            st.success(f"Total Forecasted Hours (next week): {round(total, 2)} hrs")
+
+            weekly = pd.DataFrame([week for emp in forecast for week in emp["weeks"]])
+            team = weekly.groupby("week_start")[["lower", "hours", "upper"]].sum()
+            st.subheader("Team hours per week (80% interval)")
+            st.line_chart(team)
+
+# 🏢 Team Capacity
+elif page == "🏢 Team Capacity":
+    st.header("🏢 Team, Department & Org Capacity (last 14 days)")
+    level = st.selectbox("Level", ["team", "department", "org"])
+    unit_id = st.text_input("Limit to org unit (optional, e.g. DEPT001)")
+    rollup = fetch_capacity_rollup(level, unit_id.strip() or None)
+    if rollup and rollup["units"]:
+        df = pd.DataFrame(rollup["units"])
+        st.dataframe(df[["unit_id", "name", "headcount", "hours", "avg_weekly_hours", "sessions", "completed"]])
+        st.success(f"Total Weekly Capacity: {round(df['avg_weekly_hours'].sum(), 2)} hrs")
+    else:
+        st.info("No org units defined yet.")
 
 # 🚨 Risk Radar
 elif page == "🚨 Risk Radar":
     st.header("🚨 Risk Radar - Behavioral Risk Detection")
     employee_ids = st.text_input("Enter comma-separated employee IDs to assess risk", value="EMP001,EMP002")
+    all_employees = st.checkbox("Scan all employees")
     if st.button("Run Risk Analysis"):
         employees = [e.strip() for e in employee_ids.split(",") if e.strip()]
-        risks = fetch_risks(employees)
+        risks = fetch_risks(employees, all_employees)
         if risks:
             for risk in risks:
                 color = {
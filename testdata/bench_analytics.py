@@ -0,0 +1,76 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+# Run from the repo root: python testdata/bench_analytics.py [--employees 50000] [--workers 1 2 4 8 16]
+# Times nudges, the risk radar and the forecast over a whole generated org with
+# the process-pool analytics executor (utils/executor.py) at each worker count,
+# after a warm-up call that starts the pool, and checks that every worker count
+# returns exactly the single-process result. Speedups need that many cores: the
+# core count is printed next to the table.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+sys.path.insert(0, TESTDATA_DIR)
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+logging.disable(logging.WARNING)
+
+import generate_org
+from engine.utils import db
+
+RUNS = 3
+
+def best_of(fn):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--employees", type=int, default=20000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--lookback-days", type=int, default=90)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "analytics.db")
+    started = time.perf_counter()
+    rows = generate_org.generate(db_path, args.employees, args.days, seed=42, end=date.today())
+    print(f"generated {rows} check-ins for {args.employees} employees in {time.perf_counter() - started:.1f}s")
+    print(f"{os.cpu_count()} cores\n")
+    db.configure(db_path)
+
+    from engine.models.forecasting import forecast_employees
+    from engine.models.nudges import generate_nudges
+    from engine.models.riskradar import assess_risks
+    from engine.utils.executor import analytics
+
+    conn = db.connect(db_path)
+    employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY first_seen_id")]
+    runs = {
+        "nudges": lambda: generate_nudges(conn),
+        "risk radar": lambda: assess_risks(conn, None, None, args.lookback_days),
+        "forecast": lambda: forecast_employees(conn, employees, "PL", None, 4),
+    }
+
+    print(f"{'workers':>7} " + " ".join(f"{name:>12}" for name in runs) + f" {'speedup':>8}  same result")
+    baseline, expected = None, None
+    for workers in args.workers:
+        analytics.shutdown()
+        analytics.workers = workers
+        results = {name: run() for name, run in runs.items()}   # warm-up: starts the pool
+        seconds = {name: best_of(run) for name, run in runs.items()}
+        total = sum(seconds.values())
+        if baseline is None:
+            baseline, expected = total, results
+        print(f"{workers:>7} " + " ".join(f"{seconds[name]:>11.3f}s" for name in runs)
+              + f" {baseline / total:>7.2f}x  {results == expected}")
+    analytics.shutdown()
+    conn.close()
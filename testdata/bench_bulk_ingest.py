@@ -0,0 +1,60 @@
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Run from the repo root: python testdata/bench_bulk_ingest.py
+# Rows/sec through POST /checkin (one row per request) vs. POST /checkin/bulk.
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+logging.disable(logging.WARNING)
+
+from engine.utils import db
+db.configure(os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from fastapi.testclient import TestClient
+from engine.Palantirengine import app
+
+SINGLE_ROWS = 2000
+BULK_ROWS = 20000
+
+def make_rows(count, prefix):
+    start = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    rows = []
+    for i in range(count):
+        checkin = start - timedelta(days=i // 50, minutes=i % 50)
+        rows.append({
+            "employee_id": f"{prefix}{i % 50:03d}",
+            "checkin_time": checkin.isoformat(),
+            "checkout_time": (checkin + timedelta(hours=8)).isoformat(),
+        })
+    return rows
+
+def report(label, count, seconds):
+    print(f"{label:<28} {count:>7} rows {seconds:>7.2f}s {count / seconds:>10.0f} rows/s")
+
+if __name__ == "__main__":
+    client = TestClient(app)
+
+    rows = make_rows(SINGLE_ROWS, "S")
+    start = time.perf_counter()
+    for row in rows:
+        assert client.post("/checkin", json=row).status_code == 200
+    report("POST /checkin", SINGLE_ROWS, time.perf_counter() - start)
+
+    rows = make_rows(BULK_ROWS, "B")
+    start = time.perf_counter()
+    result = client.post("/checkin/bulk", json=rows).json()
+    assert result["accepted"] == BULK_ROWS, result["rejected"]
+    report("POST /checkin/bulk (JSON)", BULK_ROWS, time.perf_counter() - start)
+
+    rows = make_rows(BULK_ROWS, "N")
+    body = "\n".join(json.dumps(row) for row in rows)
+    start = time.perf_counter()
+    result = client.post("/checkin/bulk", content=body, headers={"content-type": "application/x-ndjson"}).json()
+    assert result["accepted"] == BULK_ROWS, result["rejected"]
+    report("POST /checkin/bulk (NDJSON)", BULK_ROWS, time.perf_counter() - start)
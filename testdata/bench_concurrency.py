@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+from typing import List
+
+# Run from the repo root:
+#   python testdata/bench_concurrency.py                    # generates a small org first
+#   python testdata/bench_concurrency.py --db /tmp/org.db   # DB from generate_org.py
+# Fires 50/200/1000 concurrent clients at the per-employee endpoints, once against
+# sync handlers with a get_db connection per request in the generic threadpool
+# (how the routes used to be written) and once against the app's async handlers
+# on the DB executor (utils/db.py). Every client asks about its own employees, so
+# requests miss the result cache and reach SQLite.
+# The sync handlers hold a threadpool thread while they wait for a pooled
+# connection, and get_db's cleanup needs a thread of its own, so with more
+# clients than threads they stall until the pool wait times out. The legacy app
+# waits --pool-timeout seconds instead of 30 so those runs finish; each timeout
+# shows up as an error.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+sys.path.insert(0, TESTDATA_DIR)
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+logging.disable(logging.WARNING)
+
+import httpx
+import generate_org
+from engine.utils import db
+
+CLIENT_COUNTS = (50, 200, 1000)
+
+def legacy_app(pool_timeout):
+    """The sync-handler versions of the benchmarked routes."""
+    from fastapi import Depends, FastAPI, Query
+    from engine.models.forecasting import forecast_employees
+    from engine.models.riskradar import assess_risks
+    from engine.models.timeline import aggregate_entry, aggregate_query
+
+    app = FastAPI()
+
+    def get_db():
+        with db.get_pool().connection(timeout=pool_timeout) as conn:
+            yield conn
+
+    @app.get("/risk-radar")
+    def risk_radar(employees: List[str] = Query(...), conn=Depends(get_db)):
+        return assess_risks(conn, employees)
+
+    @app.get("/forecast")
+    def forecast(employees: List[str] = Query(...), conn=Depends(get_db)):
+        return forecast_employees(conn, employees)
+
+    @app.get("/timeline/{employee_id}")
+    def timeline(employee_id: str, granularity: str = "daily", conn=Depends(get_db)):
+        sql, params = aggregate_query(employee_id, None, None, granularity)
+        return {"employee_id": employee_id, "timeline": [aggregate_entry(*row) for row in conn.execute(sql, params)]}
+
+    return app
+
+def requests_for(employee):
+    return [
+        ("/risk-radar", {"employees": employee}),
+        ("/forecast", {"employees": employee}),
+        (f"/timeline/{employee}", {"granularity": "daily"}),
+    ]
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def run_clients(app, employees, clients):
+    latencies, errors = [], 0
+
+    async def client_loop(client, employee):
+        nonlocal errors
+        for path, params in requests_for(employee):
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, employees[i % len(employees)]) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "errors": errors,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="existing database (see generate_org.py); default: generate one")
+    parser.add_argument("--employees", type=int, default=2000, help="size of the generated org")
+    parser.add_argument("--days", type=int, default=90, help="history of the generated org")
+    parser.add_argument("--clients", type=int, nargs="+", default=CLIENT_COUNTS)
+    parser.add_argument("--pool-timeout", type=float, default=2.0, help="connection wait of the sync handlers")
+    args = parser.parse_args()
+
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(tempfile.mkdtemp(), "org.db")
+        started = time.perf_counter()
+        rows = generate_org.generate(db_path, args.employees, args.days, seed=42, end=date.today())
+        print(f"generated {rows} check-ins in {time.perf_counter() - started:.1f}s")
+    db.configure(os.path.abspath(db_path))
+
+    from engine.Palantirengine import app
+    from engine.utils.cache import result_cache
+
+    with db.get_pool().connection() as conn:
+        employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY employee_id")]
+    print(f"{len(employees)} employees, {len(requests_for('x'))} requests per client\n")
+
+    print(f"{'handlers':<8} {'clients':>8} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'errors':>7}")
+    for clients in args.clients:
+        for name, target in (("sync", legacy_app(args.pool_timeout)), ("async", app)):
+            result_cache.clear()
+            result = asyncio.run(run_clients(target, employees, clients))
+            print(f"{name:<8} {clients:>8} {result['requests']:>9} {result['rps']:>9.0f} "
+                  f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['errors']:>7}")
+    db.database.shutdown()
@@ -0,0 +1,149 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+# Run from the repo root:
+#   python testdata/bench_endpoints.py                      # generates a small org first
+#   python testdata/bench_endpoints.py --db /tmp/org.db     # DB from generate_org.py
+#   python testdata/bench_endpoints.py --save base.json     # record results
+#   python testdata/bench_endpoints.py --compare base.json  # exit 1 on a p95 regression
+# Drives each analytic endpoint through the ASGI test client and reports p50/p95
+# latency with the result cache cleared (cold) and warm, SQLite VM steps per
+# request and peak Python memory.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+sys.path.insert(0, TESTDATA_DIR)
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+logging.disable(logging.WARNING)
+
+import generate_org
+from engine.utils import db
+
+# sqlite3 doesn't expose per-statement rows scanned, so the progress handler counts
+# virtual machine steps instead: every row visited costs a handful of them.
+PROGRESS_INTERVAL = 100
+vm_steps = [0]
+
+def count_steps():
+    vm_steps[0] += PROGRESS_INTERVAL
+    return 0
+
+db.CONNECT_HOOKS.append(lambda conn: conn.set_progress_handler(count_steps, PROGRESS_INTERVAL))
+
+SAMPLE_EMPLOYEES = 20
+REGRESSION_FACTOR = 1.5
+
+def cases(employees):
+    sample = [("employees", e) for e in employees[:SAMPLE_EMPLOYEES]]
+    first = employees[0]
+    return [
+        ("nudges", "/nudges", None),
+        ("dashboard summary", "/dashboard/summary", None),
+        ("forecast (20 employees)", "/forecast", sample),
+        ("risk-radar (20 employees)", "/risk-radar", sample),
+        ("risk-radar (all)", "/risk-radar", {"all_employees": "true"}),
+        ("capacity rollup (all units)", "/capacity/rollup", None),
+        ("capacity rollup (90d, teams)", "/capacity/rollup", {"start": (date.today() - timedelta(days=89)).isoformat(), "level": "team"}),
+        ("timeline raw page", f"/timeline/{first}", {"limit": 500}),
+        ("timeline daily", f"/timeline/{first}", {"granularity": "daily"}),
+        ("timeline weekly", f"/timeline/{first}", {"granularity": "weekly"}),
+        ("timeline ndjson (full)", f"/timeline/{first}", {"format": "ndjson"}),
+    ]
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def run_case(client, result_cache, path, params, runs):
+    def request(cold):
+        if cold:
+            result_cache.clear()
+        response = client.get(path, params=params)
+        assert response.status_code == 200, (path, response.status_code, response.text[:200])
+
+    cold, warm, steps = [], [], []
+    for _ in range(runs):
+        vm_steps[0] = 0
+        started = time.perf_counter()
+        request(cold=True)
+        cold.append((time.perf_counter() - started) * 1000)
+        steps.append(vm_steps[0])
+    for _ in range(runs):
+        started = time.perf_counter()
+        request(cold=False)
+        warm.append((time.perf_counter() - started) * 1000)
+
+    # Separate pass: tracemalloc slows allocation-heavy code down too much to time it
+    tracemalloc.start()
+    request(cold=True)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": percentile(cold, 50),
+        "p95_ms": percentile(cold, 95),
+        "warm_p50_ms": percentile(warm, 50),
+        "vm_steps": int(percentile(steps, 50)),
+        "peak_mb": peak / 2 ** 20,
+    }
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before and result["p95_ms"] > before["p95_ms"] * REGRESSION_FACTOR:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", help="existing database (see generate_org.py); default: generate one")
+    parser.add_argument("--employees", type=int, default=2000, help="size of the generated org")
+    parser.add_argument("--days", type=int, default=180, help="history of the generated org")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--compare", help="fail if p95 regressed more than 1.5x against this JSON")
+    args = parser.parse_args()
+
+    db_path = args.db
+    if not db_path:
+        db_path = os.path.join(tempfile.mkdtemp(), "org.db")
+        started = time.perf_counter()
+        rows = generate_org.generate(db_path, args.employees, args.days, seed=42, end=date.today())
+        print(f"generated {rows} check-ins in {time.perf_counter() - started:.1f}s")
+    db.configure(os.path.abspath(db_path))
+
+    from fastapi.testclient import TestClient
+    from engine.Palantirengine import app
+    from engine.utils.cache import result_cache
+
+    with db.get_pool().connection() as conn:
+        employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY employee_id")]
+        rows = conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0]
+    print(f"{len(employees)} employees, {rows} check-ins, {args.runs} runs per endpoint\n")
+
+    client = TestClient(app)
+    results = {}
+    print(f"{'endpoint':<28} {'p50 ms':>9} {'p95 ms':>9} {'warm p50':>9} {'VM steps':>12} {'peak MB':>8}")
+    for name, path, params in cases(employees):
+        result = results[name] = run_case(client, result_cache, path, params, args.runs)
+        print(f"{name:<28} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['warm_p50_ms']:>9.2f} "
+              f"{result['vm_steps']:>12} {result['peak_mb']:>8.1f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare)
+        for regression in regressions:
+            print("REGRESSION:", regression)
+        sys.exit(1 if regressions else 0)
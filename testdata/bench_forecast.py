@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# Run from the repo root: python testdata/bench_forecast.py [--employees 10000]
+# Times the weekday-seasonal forecast for a whole generated org, in-process and
+# through GET /forecast?all_employees=true, next to the old 14-day sum / 2.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+sys.path.insert(0, TESTDATA_DIR)
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+logging.disable(logging.WARNING)
+
+import generate_org
+from engine.utils import db
+
+RUNS = 5
+
+# The pre-engine implementation: 14 days of hours per employee, halved
+def legacy_forecast(conn, employees):
+    cutoff = (date.today() - timedelta(days=14)).isoformat()
+    forecast = []
+    for emp in employees:
+        total = conn.execute(
+            "SELECT SUM(hours) FROM employee_daily WHERE employee_id = ? AND work_date >= ?", (emp, cutoff)
+        ).fetchone()[0] or 0
+        forecast.append({"employee_id": emp, "forecast_hours": round(total / 2, 2)})
+    return {"forecast": forecast}
+
+def best_of(fn):
+    timings = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--employees", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=63)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "forecast.db")
+    started = time.perf_counter()
+    rows = generate_org.generate(db_path, args.employees, args.days, seed=42, end=date.today())
+    print(f"generated {rows} check-ins for {args.employees} employees in {time.perf_counter() - started:.1f}s\n")
+    db.configure(db_path)
+
+    from fastapi.testclient import TestClient
+    from engine.Palantirengine import app
+    from engine.models.forecasting import forecast_employees
+    from engine.utils.cache import result_cache
+
+    client = TestClient(app)
+    with db.get_pool().connection() as conn:
+        employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY first_seen_id")]
+
+        print(f"{'forecast':<44} {'seconds':>8}")
+        print(f"{'legacy 14-day sum / 2 (per-employee query)':<44} {best_of(lambda: legacy_forecast(conn, employees)):>8.3f}")
+        for weeks in (1, 4, 12):
+            seconds = best_of(lambda: forecast_employees(conn, employees, "PL", None, weeks))
+            print(f"{f'seasonal, {weeks} week(s), in-process':<44} {seconds:>8.3f}")
+
+    def via_api():
+        result_cache.clear()
+        response = client.get("/forecast", params={"all_employees": "true", "country": "PL", "region": "", "weeks": 4})
+        assert response.status_code == 200, response.text[:200]
+    print(f"{'seasonal, 4 weeks, GET /forecast (cold cache)':<44} {best_of(via_api):>8.3f}")
@@ -0,0 +1,78 @@
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Run from the repo root: python testdata/bench_nudges.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from engine.models.nudges import calculate_baseline, detect_shift, generate_nudges
+from engine.models import baselines
+from engine.utils.migrations import migrate
+from engine.utils.timestamps import minute_of_day
+
+DAYS = 10
+EMPLOYEE_COUNTS = [100, 500, 1000, 2000]
+
+# Generate a throwaway DB with DAYS check-ins per employee
+def build_db(path, employee_count):
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    rng = random.Random(42)
+    today = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    rows = []
+    for day in range(DAYS):
+        for e in range(employee_count):
+            checkin = today - timedelta(days=day) + timedelta(minutes=rng.randint(-30, 150))
+            checkout = checkin + timedelta(hours=rng.choice([3, 5, 8, 8, 10]))
+            rows.append((f"EMP{e:05d}", checkin.isoformat(), checkout.isoformat()))
+    conn.executemany("INSERT INTO checkins (employee_id, checkin_time, checkout_time) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    # Rows were inserted behind the API's back, so regenerate the baseline store
+    baselines.rebuild(conn)
+    return conn
+
+# The pre-batch implementation: one round of queries per employee
+def legacy_generate_nudges(conn):
+    cursor = conn.cursor()
+    cursor.execute('SELECT DISTINCT employee_id FROM checkins')
+    employees = [row[0] for row in cursor.fetchall()]
+    nudges = []
+    for employee_id in employees:
+        today = datetime.now().date()
+        cursor.execute('''
+            SELECT checkin_time FROM checkins
+            WHERE employee_id = ? AND DATE(checkin_time) = ?
+        ''', (employee_id, today.isoformat()))
+        row = cursor.fetchone()
+        if row:
+            checkin_dt = datetime.fromisoformat(row[0])
+            checkin_minutes = minute_of_day(checkin_dt)
+            mean, stddev = calculate_baseline(employee_id, conn)
+            if mean and abs(checkin_minutes - mean) > max(30, stddev * 1.5):
+                nudges.append((employee_id, "Unusual check-in"))
+        shift = detect_shift(employee_id, conn)
+        if shift and abs(shift) > 30:
+            nudges.append((employee_id, "Behavior Shift"))
+    return nudges
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    print(f"{'employees':>10} {'rows':>8} {'legacy (s)':>11} {'store (s)':>10} {'speedup':>8}")
+    for count in EMPLOYEE_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = build_db(os.path.join(tmp, "bench.db"), count)
+            legacy, legacy_s = timed(legacy_generate_nudges, conn)
+            batch, batch_s = timed(generate_nudges, conn)
+            conn.close()
+
+        batch_keys = [(n["employee_id"], n["summary"]) for n in batch["nudges"]]
+        assert sorted(batch_keys) == sorted(legacy), "baseline store diverged from the per-employee loop"
+        print(f"{count:>10} {count * DAYS:>8} {legacy_s:>11.3f} {batch_s:>10.3f} {legacy_s / batch_s:>7.1f}x")
@@ -0,0 +1,145 @@
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Run from the repo root: python testdata/check_baselines.py
+# Writes a random history through the API write paths, then checks the
+# incremental baseline store against the row-by-row functions and a rebuild.
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+logging.disable(logging.WARNING)
+
+from engine.utils import db
+db.configure(os.path.join(tempfile.mkdtemp(), "baselines.db"))
+
+from fastapi.testclient import TestClient
+from engine.Palantirengine import app
+from engine.models import baselines, nudges, riskradar
+
+EMPLOYEES = 40
+DAYS = 20
+
+def close_enough(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+def assign_teams(client, rng):
+    """Two teams; a third of the employees stay unassigned."""
+    units = [
+        {"unit_id": "ORG", "name": "Org", "kind": "org"},
+        {"unit_id": "T1", "name": "Team 1", "kind": "team", "parent_id": "ORG"},
+        {"unit_id": "T2", "name": "Team 2", "kind": "team", "parent_id": "ORG"},
+    ]
+    assert client.put("/org/units", json=units).status_code == 200
+    assignments = [{"employee_id": f"EMP{e:03d}", "team_id": rng.choice(["T1", "T2", None])} for e in range(EMPLOYEES)]
+    assert client.put("/org/assignments", json=assignments).status_code == 200
+
+def seed(client, rng):
+    now = datetime.now().replace(microsecond=0)
+    rows = []
+    for e in range(EMPLOYEES):
+        for day in rng.sample(range(DAYS), rng.randint(1, DAYS)):
+            checkin = (now - timedelta(days=day)).replace(hour=rng.randint(6, 12), minute=rng.randint(0, 59), second=rng.randint(0, 59))
+            checkout = checkin + timedelta(hours=rng.choice([3, 5, 8, 10, 12]), minutes=rng.randint(0, 59))
+            rows.append({"employee_id": f"EMP{e:03d}", "checkin_time": checkin.isoformat(), "checkout_time": checkout.isoformat()})
+    # Out of order on purpose: the ring buffer must still keep the newest check-ins
+    rng.shuffle(rows)
+    assert client.post("/checkin/bulk", json=rows).json()["rejected"] == 0
+
+    # Form path: open check-ins today, half of them closed again
+    for e in range(0, EMPLOYEES, 3):
+        client.post("/submit-checkin", data={"employee_id": f"EMP{e:03d}"}, follow_redirects=False)
+        if e % 2:
+            client.post("/submit-checkout", data={"employee_id": f"EMP{e:03d}"}, follow_redirects=False)
+
+def legacy_risk(conn, emp_id, start_date, today):
+    records = conn.execute('''
+        SELECT checkin_time, checkout_time FROM checkins
+        WHERE employee_id = ? AND DATE(checkin_time) BETWEEN ? AND ?
+    ''', (emp_id, start_date.isoformat(), today.isoformat())).fetchall()
+    if not records:
+        return None
+    total_hours, deltas, missing = 0, [], 0
+    for checkin_str, checkout_str in records:
+        checkin = datetime.fromisoformat(checkin_str)
+        if not checkout_str:
+            missing += 1
+            continue
+        total_hours += (datetime.fromisoformat(checkout_str) - checkin).total_seconds() / 3600.0
+        deltas.append(abs((checkin.hour * 60 + checkin.minute) - 540))
+    mean = sum(deltas) / len(deltas) if deltas else 0
+    stddev = (sum((x - mean) ** 2 for x in deltas) / len(deltas)) ** 0.5 if deltas else 0
+    return total_hours / len(records), stddev, missing
+
+def store_snapshot(conn):
+    stats = {row[0]: row[1:] for row in conn.execute("SELECT * FROM employee_stats")}
+    daily = {row[:2]: row[2:] for row in conn.execute("SELECT * FROM employee_daily")}
+    weekly = {row[:2]: row[2:] for row in conn.execute("SELECT * FROM employee_weekly")}
+    teams = {row[:2]: row[2:] for row in conn.execute("SELECT * FROM team_daily")}
+    return stats, daily, weekly, teams
+
+def same_rows(a, b):
+    return a.keys() == b.keys() and all(
+        len(a[k]) == len(b[k]) and all(
+            close_enough(x, y) if isinstance(x, float) or isinstance(y, float) else x == y
+            for x, y in zip(a[k], b[k])
+        )
+        for k in a
+    )
+
+if __name__ == "__main__":
+    client = TestClient(app)
+    rng = random.Random(11)
+    assign_teams(client, rng)
+    seed(client, rng)
+    # Moves after the history exists: team_daily has to follow the employees
+    assign_teams(client, rng)
+    failures = []
+
+    with db.get_pool().connection() as conn:
+        for (employee_id,) in conn.execute("SELECT DISTINCT employee_id FROM checkins").fetchall():
+            mean, stddev, shift = conn.execute(
+                "SELECT baseline_mean, baseline_stddev, shift FROM employee_stats WHERE employee_id = ?",
+                (employee_id,)
+            ).fetchone()
+            exp_mean, exp_stddev = nudges.calculate_baseline(employee_id, conn)
+            exp_shift = nudges.detect_shift(employee_id, conn)
+            if not (close_enough(mean, exp_mean) and close_enough(stddev, exp_stddev) and close_enough(shift, exp_shift)):
+                failures.append(f"{employee_id}: baseline {(mean, stddev, shift)} != {(exp_mean, exp_stddev, exp_shift)}")
+
+        today = datetime.now().date()
+        start_date = today - timedelta(days=riskradar.LOOKBACK_DAYS)
+        stats = riskradar.compute_risk_stats(riskradar.load_window(conn, start_date, today))
+        for (employee_id,) in conn.execute("SELECT employee_id FROM employee_stats").fetchall():
+            expected = legacy_risk(conn, employee_id, start_date, today)
+            got = stats.get(employee_id)
+            if expected is None or got is None:
+                if expected != got:
+                    failures.append(f"{employee_id}: risk window {got} != {expected}")
+                continue
+            values = (got["avg_hours"], got["stddev_shift"], got["missing_checkout"])
+            if not all(close_enough(float(x), float(y)) for x, y in zip(values, expected)):
+                failures.append(f"{employee_id}: risk {values} != {expected}")
+
+        rollup = client.get("/capacity/rollup", params={"start": start_date.isoformat()}).json()
+        org = next(u for u in rollup["units"] if u["kind"] == "org")
+        expected = conn.execute("SELECT SUM(hours) FROM employee_daily WHERE work_date >= ?", (start_date.isoformat(),)).fetchone()[0]
+        if not math.isclose(org["hours"] + rollup["unassigned"]["hours"], expected, abs_tol=0.02):
+            failures.append(f"capacity rollup {org['hours']} + {rollup['unassigned']['hours']} != {expected}")
+
+        incremental = store_snapshot(conn)
+        baselines.rebuild(conn)
+        rebuilt = store_snapshot(conn)
+        if not all(same_rows(a, b) for a, b in zip(incremental, rebuilt)):
+            failures.append("rebuild from history differs from the incrementally maintained store")
+
+    for failure in failures:
+        print("MISMATCH:", failure)
+    print(f"checked {EMPLOYEES} employees, {len(failures)} mismatches")
+    sys.exit(1 if failures else 0)
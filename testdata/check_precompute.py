@@ -0,0 +1,125 @@
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+# Run from the repo root:
+#   python testdata/check_precompute.py
+#   python testdata/check_precompute.py --employees 20000 --days 120 --workers 8
+# Generates an org, runs the nightly precomputation (utils/precompute.py) in one
+# process and with a process pool, and checks that /nudges, /risk-radar and
+# /forecast serve exactly what they compute on request (all employees and
+# subsets), that other parameters and ?fresh=true compute on request, that a
+# check-in written after the run shows up only in fresh results, and that
+# /nudges applies today's unusual check-ins live over the run.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+sys.path.insert(0, TESTDATA_DIR)
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+logging.disable(logging.WARNING)
+# Generated check-ins have coordinates; resolve them offline
+os.environ.setdefault("GEOCODER_PROVIDER", "static")
+
+import generate_org
+from engine.utils import db
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "org.db")
+    started = time.perf_counter()
+    rows = generate_org.generate(db_path, args.employees, args.days, seed=42, end=date.today())
+    print(f"generated {rows} check-ins in {time.perf_counter() - started:.1f}s")
+    db.configure(db_path)
+
+    from fastapi.testclient import TestClient
+    from engine.Palantirengine import app
+    from engine.utils.precompute import compute_all, precompute
+
+    failures = []
+
+    def check(label, ok):
+        print(f"  {label:<52} {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            failures.append(label)
+
+    def without_computed_at(result):
+        return {k: v for k, v in result.items() if k != "computed_at"}
+
+    conn = db.connect(db_path)
+    employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY first_seen_id")]
+    subset = employees[::max(1, len(employees) // 25)][::-1]
+    subset_params = [("employees", e) for e in subset]
+    requests = {
+        "nudges": ("/nudges", []),
+        "risk-radar (all)": ("/risk-radar", [("all_employees", "true")]),
+        "risk-radar (subset)": ("/risk-radar", subset_params),
+        "forecast (all)": ("/forecast", [("all_employees", "true")]),
+        "forecast (subset)": ("/forecast", subset_params),
+    }
+
+    with TestClient(app) as client:
+        def get(path, params):
+            response = client.get(path, params=params)
+            assert response.status_code == 200, response.text
+            return response.json()
+
+        live = {label: get(path, params + [("fresh", "true")]) for label, (path, params) in requests.items()}
+        check("no run yet: computed on request", all(
+            "computed_at" not in get(path, params) for path, params in requests.values()
+        ))
+
+        timings = {}
+        for workers in (1, args.workers):
+            started = time.perf_counter()
+            merged = compute_all(db_path, workers)
+            timings[workers] = time.perf_counter() - started
+            if workers == 1:
+                serial = merged
+        check(f"{args.workers} workers merge like one", merged == serial)
+        print(f"  compute: 1 worker {timings[1]:.1f}s, {args.workers} workers {timings[args.workers]:.1f}s")
+
+        summary = precompute(conn, db_path, args.workers)
+        print(f"  {summary}")
+        served = {label: get(path, params) for label, (path, params) in requests.items()}
+        for label in requests:
+            check(f"{label}: precomputed == on request",
+                  "computed_at" in served[label] and without_computed_at(served[label]) == live[label])
+        check("other parameters: computed on request",
+              "computed_at" not in get("/risk-radar", [("all_employees", "true"), ("lookback_days", "30")])
+              and "computed_at" not in get("/forecast", [("all_employees", "true"), ("weeks", "2")]))
+        check("unknown employee: computed on request",
+              "computed_at" not in get("/risk-radar", [("employees", "NOBODY")]))
+
+        # A check-in after the run: the default keeps serving the run, fresh sees it
+        employee = subset[0]
+        now = datetime.now().replace(microsecond=0)
+        client.post("/checkin", json={"employee_id": employee, "checkin_time": (now - timedelta(hours=12)).isoformat(),
+                                      "checkout_time": now.isoformat()})
+        path, params = requests["forecast (subset)"]
+        check("after a write: default serves the run",
+              without_computed_at(get(path, params)) == without_computed_at(served["forecast (subset)"]))
+        check("after a write: fresh recomputes", get(path, params + [("fresh", "true")]) != live["forecast (subset)"])
+        # An unusual check-in today: /nudges shows it without ?fresh=true
+        late = subset[1]
+        early = now.replace(hour=3, minute=0, second=0)
+        client.post("/checkin", json={"employee_id": late, "checkin_time": early.isoformat(),
+                                      "checkout_time": (early + timedelta(hours=1)).isoformat()})
+        unusual = lambda result: {n["employee_id"] for n in result["nudges"] if n["summary"] == "Unusual check-in"}
+        nudges = get("/nudges", [])
+        check("unusual check-in applied live over the run",
+              "computed_at" in nudges and late in unusual(nudges) and unusual(nudges) == unusual(get("/nudges", [("fresh", "true")])))
+        stats = client.get("/precompute/stats").json()
+        check("precompute stats", stats["workers"] >= 1 and stats["running"] is False)
+
+    conn.close()
+    print("OK" if not failures else f"FAILED: {', '.join(failures)}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,95 @@
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+# Run from the repo root: python testdata/check_query_plans.py
+# Drives every analytic endpoint against a throwaway DB, captures the SQL it runs
+# and fails if EXPLAIN QUERY PLAN shows a full scan of the checkins table.
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+tmp_dir = tempfile.mkdtemp()
+DB_PATH = os.path.join(tmp_dir, "plans.db")
+captured = []
+
+real_connect = sqlite3.connect
+
+def traced_connect(*args, **kwargs):
+    conn = real_connect(DB_PATH, **kwargs)
+    conn.set_trace_callback(captured.append)
+    return conn
+
+sqlite3.connect = traced_connect
+
+from fastapi.testclient import TestClient
+from engine.Palantirengine import app
+
+def seed(employee_count=200, days=30):
+    conn = real_connect(DB_PATH)
+    rng = random.Random(7)
+    now = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    rows = []
+    for day in range(days):
+        for e in range(employee_count):
+            checkin = now - timedelta(days=day) + timedelta(minutes=rng.randint(-60, 120))
+            checkout = None if rng.random() < 0.1 else (checkin + timedelta(hours=8)).isoformat()
+            rows.append((f"EMP{e:04d}", checkin.isoformat(), checkout))
+    conn.executemany("INSERT INTO checkins (employee_id, checkin_time, checkout_time) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+def full_scans(sql):
+    conn = real_connect(DB_PATH)
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+    conn.close()
+    details = [row[-1] for row in plan]
+    # "c" is the alias the engine queries use for checkins
+    return [d for d in details if re.match(r"SCAN (checkins|c)\b", d) and "INDEX" not in d]
+
+if __name__ == "__main__":
+    seed()
+    client = TestClient(app, raise_server_exceptions=False)
+    captured.clear()
+
+    from engine.models import sessions
+    conn = sqlite3.connect(DB_PATH)
+    sessions.rebuild_open_sessions(conn)
+    sessions.close_stale_sessions(conn)
+    conn.close()
+
+    employees = [("employees", f"EMP{e:04d}") for e in range(20)]
+    assert client.get("/nudges").status_code == 200
+    assert client.get("/risk-radar", params=employees).status_code == 200
+    assert client.get("/risk-radar", params={"all_employees": "true"}).status_code == 200
+    assert client.get("/forecast", params=employees).status_code == 200
+    client.get("/timeline/EMP0001")
+    client.post("/submit-checkin", data={"employee_id": "EMP0001"}, follow_redirects=False)
+    client.post("/submit-checkout", data={"employee_id": "EMP0001"}, follow_redirects=False)
+    assert client.get("/sessions/open").status_code == 200
+    assert client.get("/sessions/open", params={"team_id": "TEAM0000"}).status_code == 200
+    assert client.get("/dashboard/summary").status_code == 200
+
+    from engine.models import nudges
+    conn = sqlite3.connect(DB_PATH)
+    nudges.calculate_baseline("EMP0002", conn)
+    nudges.detect_shift("EMP0002", conn)
+    conn.close()
+
+    failures = 0
+    for sql in captured:
+        if not sql.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE", "INSERT", "WITH")):
+            continue
+        scans = full_scans(sql)
+        if scans:
+            failures += 1
+            print("FULL SCAN:", " ".join(sql.split())[:160], scans)
+
+    print(f"checked {len(captured)} statements, {failures} with full table scans")
+    sys.exit(1 if failures else 0)
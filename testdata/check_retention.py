@@ -0,0 +1,141 @@
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+# Run from the repo root:
+#   python testdata/check_retention.py
+#   python testdata/check_retention.py --employees 5000 --days 730 --months 3
+# Generates an org, then archives every month older than --months (Parquet,
+# utils/retention.py) and checks that nothing visible changes: raw timelines
+# (whole, paged and across the cutoff) and the baseline store read the same as before,
+# a rebuild from archive plus live rows gives the same store, and a check-in
+# written late for an archived month is served and archived on the next run.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+sys.path.insert(0, TESTDATA_DIR)
+sys.path.insert(0, BACKEND_DIR)
+# The timeline and rebuild read the archive from EXPORT_DIR, so it is set before the engine is imported
+TMP_DIR = tempfile.mkdtemp()
+os.environ["EXPORT_DIR"] = os.path.join(TMP_DIR, "export")
+
+import generate_org
+from check_snapshot import add_checkins, timed
+from engine.models import baselines, sessions
+from engine.models.timeline import raw_entry, raw_query, raw_rows
+from engine.utils import retention
+from engine.utils.db import connect
+from engine.utils.ingest import apply_events, checkout_event
+
+STORE_QUERIES = {
+    "employee_stats": "SELECT employee_id, first_seen_id, recent, checkin_count, lifetime_mean, baseline_mean, shift, last_work_date FROM employee_stats ORDER BY 1",
+    "employee_daily": "SELECT employee_id, work_date, sessions, completed, hours, delta_sum FROM employee_daily ORDER BY 1, 2",
+    "employee_weekly": "SELECT employee_id, week_start, mon, tue, wed, thu, fri, sat, sun FROM employee_weekly ORDER BY 1, 2",
+    "team_daily": "SELECT team_id, work_date, sessions, completed, hours FROM team_daily ORDER BY 1, 2",
+}
+
+def store(conn):
+    return {table: conn.execute(sql).fetchall() for table, sql in STORE_QUERIES.items()}
+
+def same_rows(a, b):
+    return len(a) == len(b) and all(
+        len(x) == len(y) and all(
+            math.isclose(u, v, rel_tol=1e-9, abs_tol=1e-6) if isinstance(u, float) and isinstance(v, float) else u == v
+            for u, v in zip(x, y)
+        )
+        for x, y in zip(a, b)
+    )
+
+def timeline(conn, employee_id, start=None, end=None, page_size=None):
+    """Raw timeline entries, fetched in pages of page_size by following the cursor."""
+    entries, cursor = [], None
+    while True:
+        sql, params = raw_query(employee_id, start, end, cursor, page_size)
+        rows = list(raw_rows(conn, sql, params, employee_id, start, end,
+                             tuple(map(int, cursor.split(":"))) if cursor else None, page_size))
+        entries += [raw_entry(*row) for row in rows]
+        if not page_size or len(rows) < page_size:
+            return entries
+        cursor = f"{rows[-1][0]}:{rows[-1][1]}"
+
+def timelines(conn, employees, cutoff):
+    return {
+        (e, label): timeline(conn, e, *args)
+        for e in employees
+        for label, args in (
+            ("all", ()),
+            ("paged", (None, None, 37)),
+            ("across cutoff", (cutoff - timedelta(days=45), cutoff + timedelta(days=10))),
+        )
+    }
+
+def live_rows(conn):
+    return conn.execute("SELECT COUNT(*) FROM checkins").fetchone()[0]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--employees", type=int, default=500)
+    parser.add_argument("--days", type=int, default=300)
+    parser.add_argument("--months", type=int, default=2, help="full months kept in the live table")
+    args = parser.parse_args()
+
+    db_path, export_dir = os.path.join(TMP_DIR, "org.db"), os.environ["EXPORT_DIR"]
+    rows, seconds = timed(generate_org.generate, db_path, args.employees, args.days, seed=42, end=date.today())
+    print(f"generated {rows} check-ins in {seconds:.1f}s")
+
+    conn = connect(db_path)
+    employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY employee_id")]
+    sample = employees[::max(1, len(employees) // 20)]
+    cutoff = retention.retention_cutoff(months=args.months)
+    failures = []
+
+    def check(label, ok):
+        print(f"  {label:<44} {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            failures.append(label)
+
+    # The export closes stale sessions first (models/sessions.py); done here so the snapshot already has it
+    sessions.close_stale_sessions(conn)
+    before_store, before_timelines, before_live = store(conn), timelines(conn, sample, cutoff), live_rows(conn)
+    result, seconds = timed(retention.archive_expired, conn, export_dir, args.months)
+    archived = sum(result["archived"].values())
+    size = sum(os.path.getsize(f) for m in result["archived"] for f in retention.month_files(m, export_dir))
+    print(f"archived {archived} check-ins from {len(result['archived'])} months before {result['cutoff']} "
+          f"in {seconds:.1f}s ({size / 1e6:.1f} MB of Parquet); live table {before_live} -> {live_rows(conn)} rows")
+
+    (first_live,) = conn.execute("SELECT MIN(work_date) FROM checkins").fetchone()
+    check("live table starts at the cutoff", first_live >= result["cutoff"] and archived == before_live - live_rows(conn))
+    check("store tables untouched", all(same_rows(before_store[t], rows) for t, rows in store(conn).items()))
+    check("raw timelines (all, paged, across cutoff)", timelines(conn, sample, cutoff) == before_timelines)
+    check("recent range opens no archive file", retention.archived_checkins(conn, sample[0], cutoff) == [])
+    baselines.rebuild(conn)
+    check("rebuild from archive + live rows", all(same_rows(before_store[t], rows) for t, rows in store(conn).items()))
+
+    # A check-in written late for an archived month stays live until the next run
+    now = datetime.now().replace(microsecond=0)
+    late = datetime.combine(cutoff - timedelta(days=40), now.time())
+    add_checkins(conn, [(e, late, late + timedelta(hours=8)) for e in sample])
+    check("late check-in served from the live table", all(
+        timeline(conn, e, late.date(), late.date())[-1]["date"] == late.date().isoformat() for e in sample
+    ))
+    # Today's open sessions hold the export watermark (and so archiving) back; check them out
+    open_employees = [row[0] for row in conn.execute("SELECT employee_id FROM open_sessions")]
+    apply_events(conn, [checkout_event(e, datetime.now()) for e in open_employees])
+    result = retention.archive_expired(conn, export_dir, args.months)
+    check("late check-ins archived on the next run", sum(result["archived"].values()) == len(sample))
+    incremental = store(conn)
+    check("timelines still match after re-archiving", all(
+        len(timeline(conn, e)) == len(before_timelines[e, "all"]) + 1 for e in sample
+    ))
+    started = time.perf_counter()
+    baselines.rebuild(conn)
+    rebuilt = store(conn)
+    check("rebuild matches the incremental store", all(same_rows(incremental[t], rebuilt[t]) for t in STORE_QUERIES))
+    print(f"rebuild from archive + live rows: {time.perf_counter() - started:.1f}s")
+
+    conn.close()
+    print("OK" if not failures else f"FAILED: {', '.join(failures)}")
+    sys.exit(1 if failures else 0)
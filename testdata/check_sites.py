@@ -0,0 +1,149 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# Run from the repo root:
+#   python testdata/check_sites.py
+# Sets up two sites on opposite sides of UTC (models/sites.py) plus an employee
+# without a site, writes a month of check-ins through the API (naive site wall
+# clock times, UTC times, and the check-in form) and checks that rows land on
+# the site's local date and minute, that shift deltas, "late", nudges and the
+# timeline use each site's clock and expected start, that the Arrow snapshot
+# agrees with SQLite, and that a rebuild reproduces the store even after a
+# site's start time changes.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+sys.path.insert(0, TESTDATA_DIR)
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+logging.disable(logging.WARNING)
+TMP_DIR = tempfile.mkdtemp()
+os.environ["EXPORT_DIR"] = os.path.join(TMP_DIR, "export")
+
+from engine.utils import db
+DB_PATH = os.path.join(TMP_DIR, "sites.db")
+db.configure(DB_PATH)
+
+from fastapi.testclient import TestClient
+from check_retention import same_rows, store
+from check_snapshot import compare
+from engine.Palantirengine import app
+from engine.models import baselines
+from engine.utils import columnar
+
+DAYS = 30
+SITES = [
+    {"site_id": "BLR", "name": "Bengaluru", "timezone": "Asia/Kolkata", "expected_start": "10:00"},
+    {"site_id": "SFO", "name": "San Francisco", "timezone": "America/Los_Angeles", "expected_start": "08:00"},
+]
+# employee -> (site, usual local check-in, today's local check-in, how the client sends times)
+EMPLOYEES = {
+    "K1": ("BLR", (10, 5), (11, 0), "naive"),   # naive = the site's wall clock
+    "S1": ("SFO", (8, 20), (9, 0), "utc"),
+    "D1": (None, (9, 10), (9, 5), "naive"),     # no site: legacy clock, 9:00 start
+}
+
+def local_today(site_id):
+    tz = ZoneInfo(next(s["timezone"] for s in SITES if s["site_id"] == site_id)) if site_id else None
+    return datetime.now(tz).date() if tz else date.today()
+
+def site_clock(employee_id, day, hour, minute):
+    """(time as the client sends it, the same instant as an aware local time or naive)."""
+    site_id, _, _, mode = EMPLOYEES[employee_id]
+    local = datetime(day.year, day.month, day.day, hour, minute)
+    if site_id is None:
+        return local, local
+    local = local.replace(tzinfo=ZoneInfo(next(s["timezone"] for s in SITES if s["site_id"] == site_id)))
+    return (local.astimezone(timezone.utc) if mode == "utc" else local.replace(tzinfo=None)), local
+
+def post_checkin(client, employee_id, day, hour, minute):
+    sent, local = site_clock(employee_id, day, hour, minute)
+    response = client.post("/checkin", json={
+        "employee_id": employee_id,
+        "checkin_time": sent.isoformat(),
+        "checkout_time": (sent + timedelta(hours=9)).isoformat(),
+    })
+    assert response.status_code == 200, response.text
+    return local
+
+if __name__ == "__main__":
+    failures = []
+
+    def check(label, ok):
+        print(f"  {label:<48} {'ok' if ok else 'MISMATCH'}")
+        if not ok:
+            failures.append(label)
+
+    with TestClient(app) as client:
+        assert client.put("/org/sites", json=SITES).status_code == 200
+        assert client.put("/org/sites", json=[{**SITES[0], "timezone": "Mars/Olympus"}]).status_code == 400
+        assert client.put("/org/site-assignments", json=[
+            {"employee_id": e, "site_id": site_id} for e, (site_id, *_) in EMPLOYEES.items() if site_id
+        ]).status_code == 200
+
+        expected = {}
+        for employee_id, (site_id, usual, today_at, _) in EMPLOYEES.items():
+            today = local_today(site_id)
+            for i in range(DAYS, 0, -1):
+                local = post_checkin(client, employee_id, today - timedelta(days=i), *usual)
+                expected[employee_id, local.date().isoformat()] = local
+            local = post_checkin(client, employee_id, today, *today_at)
+            expected[employee_id, local.date().isoformat()] = local
+
+        conn = db.connect(DB_PATH)
+        rows = conn.execute("SELECT employee_id, work_date, checkin_ts, checkin_minute FROM checkins").fetchall()
+        check("local work_date, minute and UTC epoch per row", len(rows) == len(expected) and all(
+            (e, day) in expected
+            and minutes == expected[e, day].hour * 60 + expected[e, day].minute
+            and ts == (int(expected[e, day].timestamp()) if expected[e, day].tzinfo else
+                       int(expected[e, day].replace(tzinfo=timezone.utc).timestamp()))
+            for e, day, ts, minutes in rows
+        ))
+
+        # Every completed session starts the same distance from its site's expected start, except today's
+        starts = {"BLR": 600, "SFO": 480, None: baselines.EXPECTED_START_MINUTES}
+        daily = conn.execute("SELECT employee_id, work_date, completed, delta_sum FROM employee_daily").fetchall()
+        check("shift deltas against the site's expected start", all(
+            delta == abs(expected[e, day].hour * 60 + expected[e, day].minute - starts[EMPLOYEES[e][0]]) * completed
+            for e, day, completed, delta in daily
+        ))
+
+        summary = client.get("/dashboard/summary").json()
+        check("checked in / late today at each site", (summary["checked_in_today"], summary["late_today"]) == (3, 2))
+        unusual = {n["employee_id"] for n in client.get("/nudges").json()["nudges"] if n["summary"] == "Unusual check-in"}
+        check("unusual check-in nudges on each site's today", unusual == {"K1", "S1"})
+
+        day = local_today("BLR") - timedelta(days=3)
+        entries = client.get(f"/timeline/K1?start={day}&end={day}").json()["timeline"]
+        check("timeline days are the site's local days", [(x["date"], x["checkin"]) for x in entries] == [(day.isoformat(), "10:05")])
+
+        columnar.snapshot.path = os.path.join(os.environ["EXPORT_DIR"], columnar.SNAPSHOT_FILE)
+        columnar.export_parquet(conn, os.environ["EXPORT_DIR"])
+        columnar.build_snapshot(conn, os.environ["EXPORT_DIR"])
+        mismatches, _ = compare(conn, list(EMPLOYEES), 365, 52)
+        check("snapshot risk and forecast match SQLite", not mismatches)
+
+        incremental = store(conn)
+        baselines.rebuild(conn)
+        check("rebuild matches the incremental store", all(same_rows(incremental[t], rows) for t, rows in store(conn).items()))
+        client.put("/org/sites", json=[{**SITES[0], "expected_start": "09:30"}])
+        baselines.rebuild(conn)
+        check("new start time leaves written check-ins alone", all(same_rows(incremental[t], rows) for t, rows in store(conn).items()))
+
+        # The form stamps this server's clock; the row is written on the site's
+        now = datetime.now(ZoneInfo("Asia/Kolkata"))
+        client.post("/submit-checkin", data={"employee_id": "K1"}, follow_redirects=False)
+        time.sleep(0.5)
+        day, minutes, expected_start = conn.execute(
+            "SELECT work_date, checkin_minute, expected_start_minute FROM checkins WHERE employee_id = 'K1' ORDER BY id DESC LIMIT 1"
+        ).fetchone()
+        check("form check-in on the site's clock", day == now.date().isoformat()
+              and abs(minutes - (now.hour * 60 + now.minute)) <= 1 and expected_start == 570)
+        conn.close()
+
+    print("OK" if not failures else f"FAILED: {', '.join(failures)}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,106 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+# Run from the repo root:
+#   python testdata/check_snapshot.py
+#   python testdata/check_snapshot.py --employees 10000 --days 730
+# Generates an org, exports it to Parquet, builds the Arrow snapshot and checks
+# that long look-back risk and forecast results are identical whether they read
+# SQLite alone or the snapshot plus SQLite, including after writes the export
+# hasn't seen (today's and back-dated check-ins). Prints timings of both paths.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+sys.path.insert(0, TESTDATA_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+import generate_org
+from engine.models import baselines, sessions
+from engine.models.forecasting import forecast_employees
+from engine.models.riskradar import assess_risks
+from engine.utils import columnar
+from engine.utils.db import connect
+from engine.utils.timestamps import epoch_seconds, minute_of_day, work_date
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def compare(conn, employees, lookback_days, history_weeks):
+    """Run risk and forecast with the snapshot off and on; returns mismatching parts and timings."""
+    results, timings = {}, {}
+    for mode in (False, True):
+        columnar.snapshot.enabled = mode
+        results[mode, "risk"], timings[mode, "risk"] = timed(assess_risks, conn, None, None, lookback_days)
+        results[mode, "forecast"], timings[mode, "forecast"] = timed(
+            forecast_employees, conn, employees, "PL", None, 4, None, history_weeks
+        )
+    conn.commit()   # the temp-table fill of large employee lists leaves a transaction open
+    mismatches = [part for part in ("risk", "forecast") if results[False, part] != results[True, part]]
+    return mismatches, timings
+
+def add_checkins(conn, rows):
+    """Write through the same path as the API: checkins plus the baseline store."""
+    with conn:
+        checkins, checkouts = [], []
+        for employee_id, checkin, checkout in rows:
+            ts, day, minutes = epoch_seconds(checkin), work_date(checkin), minute_of_day(checkin)
+            cursor = conn.execute(
+                "INSERT INTO checkins (employee_id, checkin_time, checkout_time) VALUES (?, ?, ?)",
+                (employee_id, checkin.isoformat(), checkout.isoformat())
+            )
+            checkins.append((cursor.lastrowid, employee_id, ts, day, minutes))
+            checkouts.append((employee_id, day, minutes, epoch_seconds(checkout) - ts, None))
+        baselines.record_events(conn, checkins, checkouts)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=400)
+    parser.add_argument("--lookback-days", type=int, default=365)
+    parser.add_argument("--history-weeks", type=int, default=52)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    db_path, export_dir = os.path.join(tmp_dir, "org.db"), os.path.join(tmp_dir, "export")
+    rows, seconds = timed(generate_org.generate, db_path, args.employees, args.days, seed=42, end=date.today())
+    print(f"generated {rows} check-ins in {seconds:.1f}s")
+
+    conn = connect(db_path)
+    columnar.snapshot.path = os.path.join(export_dir, columnar.SNAPSHOT_FILE)
+    employees = [row[0] for row in conn.execute("SELECT employee_id FROM employee_stats ORDER BY employee_id")]
+
+    result, seconds = timed(columnar.export_parquet, conn, export_dir)
+    print(f"exported {result['exported']} rows up to id {result['last_id']} in {seconds:.1f}s")
+    result, seconds = timed(columnar.build_snapshot, conn, export_dir)
+    print(f"snapshot: {result['days']} employee-days through {result['through']} in {seconds:.1f}s\n")
+
+    failures = 0
+    def check(label):
+        global failures
+        mismatches, timings = compare(conn, employees, args.lookback_days, args.history_weeks)
+        failures += len(mismatches)
+        print(f"{label:<34} risk {timings[False, 'risk']:.3f}s -> {timings[True, 'risk']:.3f}s   "
+              f"forecast {timings[False, 'forecast']:.3f}s -> {timings[True, 'forecast']:.3f}s   "
+              f"{'MISMATCH: ' + ', '.join(mismatches) if mismatches else 'identical'}")
+
+    check("after export")
+
+    now = datetime.now().replace(microsecond=0)
+    add_checkins(conn, [(e, now - timedelta(hours=2), now) for e in employees[:50]])
+    add_checkins(conn, [(e, now - timedelta(days=90, hours=9), now - timedelta(days=90)) for e in employees[50:60]])
+    check("with unexported and back-dated rows")
+
+    # Today's open sessions hold the watermark back until they close; close them as the auto-close job would tomorrow
+    sessions.close_stale_sessions(conn, now=time.time() + 24 * 3600)
+    result, seconds = timed(columnar.export_parquet, conn, export_dir)
+    print(f"\nincremental export: {result['exported']} rows in {seconds:.2f}s")
+    columnar.build_snapshot(conn, export_dir)
+    check("after incremental export")
+
+    conn.close()
+    sys.exit(1 if failures else 0)
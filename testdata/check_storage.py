@@ -0,0 +1,250 @@
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit
+
+# Run from the repo root:
+#   python testdata/check_storage.py                                  # SQLite against SQLite
+#   python testdata/check_storage.py --database postgresql://user@host/postgres
+# Needs a user allowed to CREATE DATABASE: each check runs in a throwaway
+# database that is dropped afterwards.
+#   1. parity: the same check-in history written through the API on SQLite and
+#      on --database must give the same timeline, baseline, nudge, risk,
+#      forecast, capacity and dashboard responses.
+#   2. nodes: several API processes write overlapping employees at once while
+#      this one serves cached reads; its cache must pick up their writes
+#      (data_versions sync) and the baseline store must match a rebuild.
+TESTDATA_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(TESTDATA_DIR, "..", "backend")
+
+EMPLOYEES = 30
+DAYS = 21
+WRITER_NODES = 3
+WRITER_BATCHES = 40
+WRITER_BATCH_SIZE = 10
+SYNC_SECONDS = 0.2
+
+def is_postgres(database):
+    return database.startswith(("postgresql://", "postgres://"))
+
+def throwaway_database(database):
+    """A fresh database next to `database`; returns (url, drop callback)."""
+    if not is_postgres(database):
+        path = os.path.join(tempfile.mkdtemp(), "storage.db")
+        return path, lambda: None
+
+    import psycopg
+    name = f"palantir_check_{uuid.uuid4().hex[:8]}"
+    with psycopg.connect(database, autocommit=True) as admin:
+        admin.execute(f"CREATE DATABASE {name}")
+    parts = urlsplit(database)
+
+    def drop():
+        with psycopg.connect(database, autocommit=True) as admin:
+            admin.execute(f"DROP DATABASE IF EXISTS {name} WITH (FORCE)")
+    return urlunsplit(parts._replace(path="/" + name)), drop
+
+def start_app(database):
+    """Import the API against database (must run before anything imports engine)."""
+    os.environ["DATABASE_URL"] = database
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    logging.disable(logging.WARNING)
+    from engine.Palantirengine import app
+    return app
+
+def history(seed, employees, days, today):
+    rng = random.Random(seed)
+    rows = []
+    for e in employees:
+        for day in rng.sample(range(days), rng.randint(days // 2, days)):
+            checkin = (today - timedelta(days=day)).replace(hour=rng.randint(6, 11), minute=rng.randint(0, 59))
+            checkout = checkin + timedelta(hours=rng.choice([4, 8, 9, 11]), minutes=rng.randint(0, 59))
+            rows.append({"employee_id": e, "checkin_time": checkin.isoformat(), "checkout_time": checkout.isoformat()})
+    rng.shuffle(rows)
+    return rows
+
+def employee_ids(count):
+    return [f"EMP{e:03d}" for e in range(count)]
+
+def rounded(value):
+    """Floats to 6 significant decimals, so the backends' float sums compare equal."""
+    if isinstance(value, float):
+        return float(f"{value:.6g}")
+    if isinstance(value, dict):
+        return {k: rounded(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rounded(v) for v in value]
+    return value
+
+############ 1. parity ############
+
+def run_workload(database):
+    """Child process: write the fixed history, print every read endpoint's response as JSON."""
+    from fastapi.testclient import TestClient
+    client = TestClient(start_app(database))
+    employees = employee_ids(EMPLOYEES)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    units = [
+        {"unit_id": "ORG", "name": "Org", "kind": "org"},
+        {"unit_id": "D1", "name": "Dept 1", "kind": "department", "parent_id": "ORG"},
+        {"unit_id": "T1", "name": "Team 1", "kind": "team", "parent_id": "D1"},
+        {"unit_id": "T2", "name": "Team 2", "kind": "team", "parent_id": "D1"},
+    ]
+    assert client.put("/org/units", json=units).status_code == 200
+    assignments = [{"employee_id": e, "team_id": ["T1", "T2", None][i % 3]} for i, e in enumerate(employees)]
+    assert client.put("/org/assignments", json=assignments).status_code == 200
+    assert client.post("/checkin/bulk", json=history(1, employees, DAYS, today)).json()["rejected"] == 0
+    # A team change after the history is in moves its team_daily rows
+    assert client.put("/org/assignments", json=[{"employee_id": employees[0], "team_id": "T2"}]).status_code == 200
+
+    sample = [("employees", e) for e in employees[:10]]
+    reads = {
+        "timeline raw": (f"/timeline/{employees[1]}", {"limit": 50}),
+        "timeline daily": (f"/timeline/{employees[1]}", {"granularity": "daily"}),
+        "timeline weekly": (f"/timeline/{employees[1]}", {"granularity": "weekly"}),
+        "baseline": (f"/baseline/{employees[2]}", None),
+        "nudges": ("/nudges", None),
+        "risk-radar": ("/risk-radar", {"all_employees": "true", "lookback_days": 30}),
+        "forecast": ("/forecast", sample + [("weeks", 4)]),
+        "capacity teams": ("/capacity/rollup", {"level": "team"}),
+        "capacity org": ("/capacity/rollup", {"level": "org"}),
+        "dashboard": ("/dashboard/summary", None),
+    }
+    results = {}
+    for name, (path, params) in reads.items():
+        response = client.get(path, params=params)
+        results[name] = [response.status_code, response.json()]
+
+    # Form check-in/checkout: the times are "now", so only compare the counts
+    for e in employees[:6]:
+        client.post("/submit-checkin", data={"employee_id": e}, follow_redirects=False)
+    for e in employees[:2]:
+        client.post("/submit-checkout", data={"employee_id": e}, follow_redirects=False)
+    results["open sessions"] = client.get("/sessions/open").json()["open"]
+    print(json.dumps(rounded(results)))
+
+def check_parity(database):
+    reference_db, _ = throwaway_database("")
+    target_db, drop = throwaway_database(database)
+    try:
+        outputs = []
+        for db in (reference_db, target_db):
+            started = time.perf_counter()
+            out = subprocess.run([sys.executable, __file__, "--run-workload", db],
+                                 capture_output=True, text=True, check=True).stdout
+            outputs.append(json.loads(out.strip().splitlines()[-1]))
+            print(f"  workload on {'PostgreSQL' if is_postgres(db) else 'SQLite'}: {time.perf_counter() - started:.1f}s")
+    finally:
+        drop()
+    reference, target = outputs
+    failures = [name for name in reference if reference[name] != target.get(name)]
+    for name in reference:
+        print(f"  {name:<16} {'MISMATCH' if name in failures else 'same'}")
+    return failures
+
+############ 2. nodes ############
+
+def write_node(database, node):
+    """Child process: one more API node writing small batches of overlapping employees."""
+    from fastapi.testclient import TestClient
+    client = TestClient(start_app(database))
+    rng = random.Random(100 + node)
+    employees = employee_ids(EMPLOYEES)
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(WRITER_BATCHES):
+        batch = []
+        for e in rng.sample(employees, WRITER_BATCH_SIZE):
+            checkin = (today - timedelta(days=rng.randint(0, DAYS))).replace(hour=rng.randint(6, 11), minute=rng.randint(0, 59))
+            batch.append({"employee_id": e, "checkin_time": checkin.isoformat(),
+                          "checkout_time": (checkin + timedelta(hours=8)).isoformat()})
+        assert client.post("/checkin/bulk", json=batch).json()["rejected"] == 0
+
+STORE_QUERIES = {
+    "employee_stats": "SELECT employee_id, checkin_count, lifetime_mean, baseline_mean, shift, last_work_date FROM employee_stats ORDER BY 1",
+    "employee_daily": "SELECT employee_id, work_date, sessions, completed, hours, delta_sum FROM employee_daily ORDER BY 1, 2",
+    "employee_weekly": "SELECT employee_id, week_start, mon, tue, wed, thu, fri, sat, sun FROM employee_weekly ORDER BY 1, 2",
+    "team_daily": "SELECT team_id, work_date, sessions, completed, hours FROM team_daily ORDER BY 1, 2",
+}
+
+def same_rows(a, b):
+    return len(a) == len(b) and all(
+        len(x) == len(y) and all(
+            math.isclose(u, v, rel_tol=1e-9, abs_tol=1e-6) if isinstance(u, float) and isinstance(v, float) else u == v
+            for u, v in zip(x, y)
+        )
+        for x, y in zip(a, b)
+    )
+
+def check_nodes(database):
+    target_db, drop = throwaway_database(database)
+    os.environ["CACHE_SYNC_SECONDS"] = str(SYNC_SECONDS)
+    failures = []
+    try:
+        from fastapi.testclient import TestClient
+        app = start_app(target_db)
+        from engine.models import baselines
+        from engine.utils.db import get_pool
+
+        with TestClient(app) as client:
+            before = client.get("/dashboard/summary").json()["total_checkins"]
+            started = time.perf_counter()
+            nodes = [subprocess.Popen([sys.executable, __file__, "--write-node", target_db, str(n)]) for n in range(WRITER_NODES)]
+            if any(node.wait() for node in nodes):
+                return ["writer node failed"]
+            elapsed = time.perf_counter() - started
+            written = WRITER_NODES * WRITER_BATCHES * WRITER_BATCH_SIZE
+            print(f"  {WRITER_NODES} writer nodes: {written} check-ins in {WRITER_NODES * WRITER_BATCHES} batches, {elapsed:.1f}s")
+
+            # This node wrote nothing: only the data_versions sync can invalidate its cached summary
+            deadline = time.monotonic() + 20 * SYNC_SECONDS
+            total = client.get("/dashboard/summary").json()["total_checkins"]
+            while total != before + written and time.monotonic() < deadline:
+                time.sleep(SYNC_SECONDS / 4)
+                total = client.get("/dashboard/summary").json()["total_checkins"]
+            print(f"  cached summary on this node: {before} -> {total} check-ins (expected {before + written})")
+            if total != before + written:
+                failures.append("cache sync")
+
+        with get_pool().connection() as conn:
+            incremental = {table: conn.execute(sql).fetchall() for table, sql in STORE_QUERIES.items()}
+            baselines.rebuild(conn)
+            rebuilt = {table: conn.execute(sql).fetchall() for table, sql in STORE_QUERIES.items()}
+        for table in STORE_QUERIES:
+            same = same_rows(incremental[table], rebuilt[table])
+            print(f"  {table:<16} {len(rebuilt[table])} rows, {'matches rebuild' if same else 'MISMATCH with rebuild'}")
+            if not same:
+                failures.append(table)
+        get_pool().close()
+    finally:
+        drop()
+    return failures
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--run-workload":
+        run_workload(sys.argv[2])
+        sys.exit(0)
+    if len(sys.argv) > 3 and sys.argv[1] == "--write-node":
+        write_node(sys.argv[2], int(sys.argv[3]))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--database", default="", help="PostgreSQL URL to check; default: a throwaway SQLite file")
+    args = parser.parse_args()
+
+    print(f"parity with SQLite ({'PostgreSQL' if is_postgres(args.database) else 'SQLite'}):")
+    failures = check_parity(args.database)
+    print("nodes:")
+    failures += check_nodes(args.database)
+    print("OK" if not failures else f"FAILED: {', '.join(failures)}")
+    sys.exit(1 if failures else 0)
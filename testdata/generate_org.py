@@ -0,0 +1,154 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+# Run from the repo root:
+#   python testdata/generate_org.py --employees 10000 --days 730 --db /tmp/org.db
+# Seeded synthetic workforce written straight into a fresh SQLite DB (no server),
+# with the scenarios of testdatageneration.py. The same --seed and --end always
+# produce the same rows. Employees are grouped into teams and departments under
+# one org, and the baseline store and open sessions are filled as the rows are written.
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+
+from engine.models import baselines, sessions
+from engine.utils.db import connect
+from engine.utils.migrations import migrate
+from engine.utils.timestamps import epoch_seconds, minute_of_day, work_date
+
+BASE_LAT = 54.3382
+BASE_LON = 18.5858
+
+TEAM_SIZE = 10
+TEAMS_PER_DEPARTMENT = 10
+
+SCENARIOS = ["normal", "late_checkin", "early_checkout", "missing_checkout", "long_shift", "short_shift"]
+SCENARIO_WEIGHTS = [70, 8, 6, 4, 6, 6]
+WEEKEND_WORK_RATE = 0.05
+ABSENCE_RATE = 0.04
+
+INSERT_SQL = '''
+    INSERT INTO checkins (id, employee_id, checkin_time, checkout_time, latitude, longitude,
+                          checkin_ts, checkout_ts, work_date, checkin_minute)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def employee_ids(count):
+    return [f"EMP{e:05d}" for e in range(count)]
+
+def org_structure(employees):
+    """One org, departments of TEAMS_PER_DEPARTMENT teams, teams of TEAM_SIZE employees."""
+    units = [("ORG", "Organisation", "org", None)]
+    assignments = []
+    for e, emp in enumerate(employees):
+        team = e // TEAM_SIZE
+        department = team // TEAMS_PER_DEPARTMENT
+        if e % (TEAM_SIZE * TEAMS_PER_DEPARTMENT) == 0:
+            units.append((f"DEPT{department:03d}", f"Department {department}", "department", "ORG"))
+        if e % TEAM_SIZE == 0:
+            units.append((f"TEAM{team:04d}", f"Team {team}", "team", f"DEPT{department:03d}"))
+        assignments.append((emp, f"TEAM{team:04d}"))
+    return units, assignments
+
+def employee_profiles(rng, employees):
+    # Usual start minute per employee, so baselines and shift detection have something to find
+    return {emp: rng.randint(7 * 60 + 30, 10 * 60) for emp in employees}
+
+def generate_shift(rng, day, usual_start):
+    checkin = datetime(day.year, day.month, day.day) + timedelta(minutes=usual_start + rng.randint(-20, 20), seconds=rng.randint(0, 59))
+    scenario = rng.choices(SCENARIOS, SCENARIO_WEIGHTS)[0]
+
+    if scenario == "late_checkin":
+        checkin = checkin.replace(hour=rng.randint(10, 12))
+        checkout = checkin + timedelta(hours=8)
+    elif scenario == "early_checkout":
+        checkout = checkin + timedelta(hours=5)
+    elif scenario == "missing_checkout":
+        checkout = None
+    elif scenario == "long_shift":
+        checkout = checkin + timedelta(hours=10)
+    elif scenario == "short_shift":
+        checkout = checkin + timedelta(hours=3)
+    else:
+        checkout = checkin + timedelta(hours=8, minutes=rng.randint(-30, 30))
+    return checkin, checkout
+
+def generate_day(rng, day, profiles, next_id):
+    """Rows for one day plus the (checkin, checkout) events for the baseline store."""
+    weekend = day.weekday() >= 5
+    rows, checkins, checkouts = [], [], []
+    for emp, usual_start in profiles.items():
+        if rng.random() < (1 - WEEKEND_WORK_RATE if weekend else ABSENCE_RATE):
+            continue
+        checkin, checkout = generate_shift(rng, day, usual_start)
+        rows.append((
+            next_id, emp, checkin.isoformat(), checkout.isoformat() if checkout else None,
+            BASE_LAT + rng.uniform(-0.0002, 0.0002), BASE_LON + rng.uniform(-0.0002, 0.0002),
+            epoch_seconds(checkin), epoch_seconds(checkout), work_date(checkin), minute_of_day(checkin)
+        ))
+        checkins.append((next_id, emp, checkin))
+        if checkout:
+            checkouts.append((emp, checkin, checkout))
+        next_id += 1
+    return rows, checkins, checkouts
+
+def generate(db_path, employee_count, days, seed, end):
+    if os.path.exists(db_path):
+        raise SystemExit(f"{db_path} already exists; the generator only writes fresh databases")
+    rng = random.Random(seed)
+    conn = connect(db_path)
+    migrate(conn)
+    employees = employee_ids(employee_count)
+    profiles = employee_profiles(rng, employees)
+    units, assignments = org_structure(employees)
+    with conn:
+        conn.executemany("INSERT INTO org_units (unit_id, name, kind, parent_id) VALUES (?, ?, ?, ?)", units)
+        conn.executemany("INSERT INTO employee_teams (employee_id, team_id) VALUES (?, ?)", assignments)
+
+    # Each day is one transaction; employee_daily rows never span days, so they can be
+    # flushed per day, while the per-employee states stay in memory until the end.
+    states, next_id, total = {}, 1, 0
+    for offset in range(days - 1, -1, -1):
+        day = end - timedelta(days=offset)
+        rows, checkins, checkouts = generate_day(rng, day, profiles, next_id)
+        daily = {}
+        for checkin_id, emp, checkin_dt in checkins:
+            state = states.get(emp)
+            if state is None:
+                state = states[emp] = baselines.new_state(emp, checkin_id)
+            day_key = work_date(checkin_dt)
+            baselines.apply_checkin(state, epoch_seconds(checkin_dt), minute_of_day(checkin_dt), day_key)
+            baselines.apply_daily_checkin(daily, emp, day_key)
+        for emp, checkin_dt, checkout_dt in checkouts:
+            baselines.apply_daily_checkout(daily, emp, work_date(checkin_dt), minute_of_day(checkin_dt),
+                                           epoch_seconds(checkout_dt) - epoch_seconds(checkin_dt))
+
+        with conn:
+            conn.executemany(INSERT_SQL, rows)
+            baselines.save(conn, {}, daily)
+        next_id += len(rows)
+        total += len(rows)
+
+    with conn:
+        baselines.save(conn, states, {})
+    sessions.rebuild_open_sessions(conn)
+    conn.execute("ANALYZE")
+    conn.close()
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", required=True, help="path of the database to create")
+    parser.add_argument("--employees", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end", type=date.fromisoformat, default=date.today(), help="last generated day (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rows = generate(args.db, args.employees, args.days, args.seed, args.end)
+    print(f"wrote {rows} check-ins for {args.employees} employees x {args.days} days "
+          f"to {args.db} in {time.perf_counter() - started:.1f}s")
@@ -33,6 +33,7 @@ def generate_checkin_checkout(day_offset):
 
 # Generate and print data
 record_id = 1
+payloads = []
 for day in range(10):
     for emp in employees:
         checkin, checkout = generate_checkin_checkout(day_offset=day)
@@ -42,7 +43,6 @@ for day in range(10):
         print(f"{record_id}|{emp}|{checkin.isoformat()}|{checkout.isoformat()}|{lat}|{lon}|{address}")
         record_id += 1
 
-        # Optional: send via POST
         payload = {
              "employee_id": emp,
              "checkin_time": checkin.isoformat(),
@@ -51,5 +51,8 @@ for day in range(10):
              "longitude": lon,
              "address": address
          }
-        response = requests.post("http://127.0.0.1:8000/checkin", json=payload)
-        print(f"Sent {record_id}: {response.status_code}")
+        payloads.append(payload)
+
+# Optional: send everything in one POST
+response = requests.post("http://127.0.0.1:8000/checkin/bulk", json=payloads)
+print(f"Sent {len(payloads)}: {response.status_code} {response.json()['accepted']} accepted")